@@ -14,8 +14,34 @@
 #  DB 12   ; a decimal byte
 #  DB 0b0001 ; a binary byte
 
+import hashlib
+import importlib.util
+import io
+import os
 import sys
 import re
+import tempfile
+from collections import namedtuple
+
+# Directory holding the emulator, which owns the .ls8b image format
+LS8_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ls8")
+
+
+def load_ls8_module(name):
+    """
+    Import a module from the emulator directory by path. Putting that
+    directory on sys.path would let ls8/ls8.py shadow the ls8 package.
+    """
+
+    spec = importlib.util.spec_from_file_location(
+        f"ls8_{name}", os.path.join(LS8_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+pack_image = load_ls8_module("image").pack_image
 
 # Opcodes
 OPCODES = {
@@ -28,6 +54,7 @@ OPCODES = {
     "HLT":  {"type": 0, "code": "00000001"},
     "INC":  {"type": 1, "code": "01100101"},
     "INT":  {"type": 1, "code": "01010010"},
+    "IPI":  {"type": 2, "code": "10000110"},
     "IRET": {"type": 0, "code": "00010011"},
     "JEQ":  {"type": 1, "code": "01010101"},
     "JGE":  {"type": 1, "code": "01011010"},
@@ -53,8 +80,12 @@ OPCODES = {
     "ST":   {"type": 2, "code": "10000100"},
     "SUB":  {"type": 2, "code": "10100001"},
     "XOR":  {"type": 2, "code": "10101011"},
+    "XCHG": {"type": 2, "code": "10000101"},
 }
 
+# Bump when a change to the assembler changes its output for the same source
+ASM_VERSION = 1
+
 # Regex for matching lines
 # Capturing groups: label, opcode, operandA, operandB
 REGEX = r"(?:(\w+?):)?\s*(?:(\w+)\s*(?:(\w+)(?:\s*,\s*(\w+))?)?)?"
@@ -66,7 +97,12 @@ REGEX_DB = r"(?:(\w+?):)?\s*DB\s*(.+)"  # insensitive
 
 def parse_commandline(argv):
     """
-    Usage: asm.py [inputfile] [outputfile]
+    Usage: asm.py [-O] [inputfile] [outputfile]
+           asm.py --verify inputfile
+
+    If outputfile ends in .ls8b a binary image is written instead of text.
+    -O runs the peephole optimizer and reports what it saved on stderr.
+    --verify runs the program with and without it and compares the two.
     """
 
     if len(argv) == 1:
@@ -101,302 +137,933 @@ def open_files(inputfile, outputfile):
 
     if outputfile == "-":
         outputfile = sys.stdout
+    elif outputfile.endswith(".ls8b"):
+        outputfile = open(outputfile, "wb")
     else:
         outputfile = open(outputfile, "w")
 
     return inputfile, outputfile
 
 
-def normalize_line(groups):
-    """
-    Takes match groups and uppercases them if they're not None.
-    """
+# Compiled once rather than on every line
+RE_LINE = re.compile(REGEX)
+RE_DS = re.compile(REGEX_DS, re.IGNORECASE)
+RE_DB = re.compile(REGEX_DB, re.IGNORECASE)
+RE_REG = re.compile(r"R([0-7])")
 
-    result = []
+# Opcode name -> machine code value
+OPCODE_VALUES = {name: int(info["code"], 2) for name, info in OPCODES.items()}
 
-    for g in groups:
-        if g is None:
-            result.append(None)
-        else:
-            result.append(g.upper())
+# Register name -> number, for the common case of an exact "R0".."R7"
+REGISTERS = {f"R{n}": n for n in range(8)}
+
+# Byte value -> 8 character binary string
+BINARY = ["{:08b}".format(v) for v in range(256)]
 
-    return result
+# One parsed source statement. operands holds the cells that follow the
+# opcode: register numbers and immediates as ints, labels as strings that
+# pass2 resolves. For DS and DB, operands holds the data bytes and op_a the
+# data text.
+Statement = namedtuple(
+    "Statement", ["line_num", "label", "opcode", "op_a", "op_b", "operands"])
+
+
+class AsmError(Exception):
+    """
+    An error in the assembler source. status is the exit code for the CLI.
+    """
+
+    def __init__(self, message, status=1):
+        super().__init__(message)
+        self.status = status
 
 
 def p8(v):
+    if 0 <= v < 256:
+        return BINARY[v]
     return "{:08b}".format(v)
 
 
-def pass1(inputfile, sym, code):
+def pass1(inputfile):
     """
     Pass 1
 
     * Read the source code lines
     * Parse labels, opcodes, and operands
-    * Record label offsets
-    * Emit machine code
+    * Yield a Statement for each line with a label or opcode
+
+    This is a generator, so source is read as the statements are consumed.
     """
 
-    # Source line number
+    def get_reg(op):
+        """Get a register number from a string, e.g. "R2" -> 2"""
+
+        if op in REGISTERS:
+            return REGISTERS[op]
+
+        m = RE_REG.match(op)
+
+        if m is None:
+            raise AsmError(f"Line {line_num}: unknown register {op}")
+
+        return int(m.group(1))
+
+    def check_ops_count(opcode, desired, found):
+        # Makes sure we have right operand count
+        if found < desired:
+            raise AsmError(f"Line {line_num}: missing operand to {opcode}")
+        elif found > desired:
+            raise AsmError(f"Line {line_num}: unexpected operand to {opcode}")
+
+    def parse_ds(line):
+        """
+        Handle DS pseudo-opcode
+        """
+
+        m = RE_DS.match(line)
+
+        if m is None or m.group(2) is None:
+            raise AsmError(f"line {line_num}: missing argument to DS", 2)
+
+        data = m.group(2)
+
+        return data, tuple(data.encode("latin-1"))
+
+    def parse_db(line):
+        """
+        Handle the DB pseudo-opcode
+        """
+
+        m = RE_DB.match(line)
+
+        if m is None or m.group(2) is None:
+            raise AsmError(f"line {line_num}: missing argument to DB", 2)
+
+        data = m.group(2)
+
+        try:
+            val = int(data, 0)
+
+        except ValueError:
+            raise AsmError(
+                f"line {line_num}: invalid integer argument to DB", 2)
+
+        # Force to byte size
+        return data, (val & 0xff,)
+
     line_num = 0
 
-    # Current code address (for labels)
-    addr = 0
+    for line in inputfile:
+        line_num += 1
 
-    def get_reg(op, fatal=True):
-        """Get a register number from a string, e.g. "R2" -> 2"""
+        # Strip comments
+        comment_index = line.find(';')
+        if comment_index != -1:
+            line = line[:comment_index]
 
-        nonlocal line_num
+        # Normalize
+        line = line.strip()
 
-        m = re.match(r"R([0-7])", op)
+        # Ignore blank lines
+        if line == '':
+            continue
 
-        if m is None:
-            if fatal:
-                print(f"Line {line_num}: unknown register {op}",
-                      file=sys.stderr)
-                sys.exit(1)
+        # Matching the uppercased line uppercases every group at once
+        label, opcode, op_a, op_b = RE_LINE.match(line.upper()).groups()
+
+        if opcode is None:
+            if label is not None:
+                yield Statement(line_num, label, None, None, None, ())
+            continue
+
+        if opcode == 'DS':
+            data, operands = parse_ds(line)
+            yield Statement(line_num, label, opcode, data, None, operands)
+            continue
+
+        if opcode == 'DB':
+            data, operands = parse_db(line)
+            yield Statement(line_num, label, opcode, data, None, operands)
+            continue
+
+        # Make sure we know this opcode at all
+        if opcode not in OPCODES:
+            raise AsmError(f"line {line_num}: unknown opcode {opcode}", 2)
+
+        op_type = OPCODES[opcode]["type"]
+        total_operands = (op_a is not None) + (op_b is not None)
+
+        if op_type == 8:
+            # LDI r,i or LDI r,label
+            check_ops_count(opcode, 2, total_operands)
+
+            try:
+                val_b = int(op_b, 0)
+            except ValueError:
+                # If it's not a value, it might be a symbol
+                val_b = op_b
+
+            operands = (get_reg(op_a), val_b)
+        else:
+            # 0, 1, or 2 register operands
+            check_ops_count(opcode, op_type, total_operands)
+
+            if op_type == 0:
+                operands = ()
+            elif op_type == 1:
+                operands = (get_reg(op_a),)
             else:
-                return None
+                operands = (get_reg(op_a), get_reg(op_b))
+
+        yield Statement(line_num, label, opcode, op_a, op_b, operands)
+
+
+# Registers the optimizer leaves alone: IM and IS have side effects on
+# interrupts and R7 is the stack pointer
+RESERVED_REGISTERS = {5, 6, 7}
+
+# Instructions that read both register operands and write the first
+ALU_BINARY = {"ADD", "SUB", "MUL", "DIV", "MOD", "AND", "OR", "XOR", "SHL",
+              "SHR"}
+
+# Instructions after which execution does not simply fall through to the
+# next statement
+CONTROL = {"CALL", "JMP", "JEQ", "JNE", "JGT", "JLT", "JGE", "JLE", "RET",
+           "IRET", "INT", "IPI", "HLT"}
+
+# Constant folding, result of op on two byte values. The ALU works mod 256.
+# DIV and MOD are not folded, so that division by zero still fails at run
+# time.
+FOLD = {
+    "ADD": lambda a, b: (a + b) & 0xFF,
+    "SUB": lambda a, b: (a - b) & 0xFF,
+    "MUL": lambda a, b: (a * b) & 0xFF,
+    "AND": lambda a, b: a & b,
+    "OR": lambda a, b: a | b,
+    "XOR": lambda a, b: a ^ b,
+    "SHL": lambda a, b: (a << b) & 0xFF,
+    "SHR": lambda a, b: a >> b,
+}
 
-        return int(m.group(1))
 
-    def out0(opcode, op_a, op_b, machine_code):
-        """Handle opcodes with zero operands"""
+def reads_writes(st):
+    """Return the sets of registers a statement reads and writes."""
 
-        nonlocal addr
+    op = st.opcode
+    a = st.operands[0] if st.operands else None
 
-        code.append(f"{machine_code} # {opcode}")
-        addr += 1
+    if op in ALU_BINARY or op == "XCHG":
+        return {a, st.operands[1]}, {a}
+    if op in ("INC", "DEC", "NOT"):
+        return {a}, {a}
+    if op == "LDI" or op == "POP":
+        return set(), {a}
+    if op == "LD":
+        return {st.operands[1]}, {a}
+    if op in ("CMP", "ST", "IPI"):
+        return set(st.operands), set()
 
-    def out1(opcode, op_a, op_b, machine_code):
-        """Handle opcodes with one operand"""
+    # PUSH, PRN, PRA, jumps, CALL and INT read their one operand
+    return set(st.operands), set()
 
-        nonlocal addr
 
-        reg_a = get_reg(op_a)
-        code.append(f"{machine_code} # {opcode} {op_a}")
-        code.append(p8(reg_a))
-        addr += 2
+def label_only(st):
+    """The statement's label on a line of its own, for a removed statement"""
 
-    def out2(opcode, op_a, op_b, machine_code):
-        """Handle opcodes with two operands"""
+    if st.label is None:
+        return None
 
-        nonlocal addr
+    return Statement(st.line_num, st.label, None, None, None, ())
 
-        reg_a = get_reg(op_a)
-        reg_b = get_reg(op_b)
 
-        code.append(f"{machine_code} # {opcode} {op_a},{op_b}")
-        code.append(p8(reg_a))
-        code.append(p8(reg_b))
+def peephole(statements, stats=None):
+    """
+    Optimization pass between pass1 and pass2. Takes the parsed statements
+    and returns an optimized list of them:
+
+    * ADD and MUL of registers holding known constants become an LDI
+    * PUSH Rx immediately followed by POP Rx is dropped
+    * LDI Rn,L; JMP/CALL Rn where L starts with LDI Rn,L2; JMP Rn jumps
+      straight to L2, and a JMP to the statement after it is dropped
+    * LDI Rn,SKIP; JEQ Rn; LDI Rm,T; JMP Rm; SKIP: becomes
+      LDI Rm,T; JNE Rm, so the common path falls through
+    * LDI whose value is overwritten before it is read is dropped
+
+    Labels stay attached to the statements they name and addresses are
+    laid out afresh by pass2, so every label still points at the right
+    code, and the program never grows. Numeric immediates are taken to
+    be data: code that computes addresses without labels should not be
+    optimized. R5-R7 are never touched.
+
+    If a stats dict is given it is filled in with the number of times
+    each rewrite applied, and the instructions and bytes saved.
+    """
 
-        addr += 3
+    code = list(statements)
 
-    def out8(opcode, op_a, op_b, machine_code):
-        """Handle LDI opcode (type 8)"""
+    if stats is None:
+        stats = {}
 
-        nonlocal addr
+    def count(name):
+        stats[name] = stats.get(name, 0) + 1
 
-        reg_a = get_reg(op_a)
+    def size(sts):
+        return sum(len(st.operands) + (st.opcode not in ("DS", "DB"))
+                   for st in sts if st.opcode is not None)
 
-        try:
-            val_b = int(op_b, 0)
-            out_b = p8(val_b)
+    before = sum(st.opcode not in (None, "DS", "DB") for st in code)
+    before_bytes = size(code)
 
-        except ValueError:
-            # If it's not a value, it might be a symbol
-            out_b = f"sym:{op_b}"
+    for _ in range(16):
+        changed = (fold_constants(code, count)
+                   | drop_push_pop(code, count)
+                   | shorten_jumps(code, count)
+                   | invert_branches(code, count)
+                   | drop_dead_loads(code, count))
 
-        code.append(f"{machine_code} # {opcode} {op_a},{op_b}")
-        code.append(p8(reg_a))
-        code.append(out_b)
+        code = [st for st in code if st is not None]
 
-        addr += 3
+        if not changed:
+            break
 
-    def handle_ds(line):
-        """
-        Handle DS pseudo-opcode
-        """
+    after = sum(st.opcode not in (None, "DS", "DB") for st in code)
+    stats["instructions_saved"] = before - after
+    stats["bytes_saved"] = before_bytes - size(code)
 
-        nonlocal addr
+    return code
 
-        m = re.match(REGEX_DS, line, re.IGNORECASE)
 
-        if m is None or m.group(2) is None:
-            print(f"line {line_num}: missing argument to DS", file=sys.stderr)
-            sys.exit(2)
+def dead_after(code, index, reg):
+    """
+    True if reg is written before it is read on every path from
+    code[index] on. Only straight-line code is followed; any jump or
+    data ends the search with the register taken to be live.
+    """
 
-        data = m.group(2)
+    for st in code[index:]:
+        if st is None or st.opcode is None:
+            continue
+        if st.opcode in ("DS", "DB"):
+            return False
 
-        for i in range(len(data)):
-            print_char = data[i]
+        reads, writes = reads_writes(st)
 
-            if print_char == ' ':
-                print_char = '[space]'
+        if reg in reads:
+            return False
+        if reg in writes:
+            return True
+        if st.opcode in CONTROL:
+            return False
 
-            code.append(f"{p8(ord(data[i]))} # {print_char}")
+    return False
 
-        addr += len(data)
 
-    def handle_db(line):
-        """
-        Handle the DB pseudo-opcode
-        """
+def label_targets(code):
+    """Map each label to the index of the first instruction it names."""
 
-        nonlocal addr
+    targets = {}
+    waiting = []
 
-        m = re.match(REGEX_DB, line, re.IGNORECASE)
+    for i, st in enumerate(code):
+        if st is None:
+            continue
+        if st.label is not None:
+            waiting.append(st.label)
+        if st.opcode is not None:
+            for label in waiting:
+                targets[label] = i
+            waiting = []
 
-        if m is None or m.group(2) is None:
-            print(f"line {line}: missing argument to DB", file=sys.stderr)
-            sys.exit(2)
+    return targets
 
-        data = m.group(2)
 
-        try:
-            val = int(data, 0)
+def following(code, i):
+    """Index of the next statement with an opcode after code[i], or None,
+    along with whether a label lies in between."""
 
-        except ValueError:
-            print(f"line {line_num}: invalid integer argument to DB",
-                  file=sys.stderr)
-            sys.exit(2)
+    labelled = False
 
-        # Force to byte size
-        val &= 0xff
+    for j in range(i + 1, len(code)):
+        st = code[j]
+        if st is None:
+            continue
+        if st.label is not None:
+            labelled = True
+        if st.opcode is not None:
+            return j, labelled
 
-        code.append(f"{p8(val)} # {data}")
+    return None, labelled
 
-        addr += 1
 
-    def check_ops(opcode, op_a, op_b):
-        """Check operands for sanity with a particular opcode"""
+def fold_constants(code, count):
+    known = {}
+    changed = False
 
-        def check_ops_count(desired, found):
-            # Makes sure we have right operand count
-            if found < desired:
-                print(f"Line {line_num}: missing operand to {opcode}",
-                      file=sys.stderr)
-                sys.exit(1)
-            elif found > desired:
-                print(f"Line {line_num}: unexpected operand to {opcode}",
-                      file=sys.stderr)
-                sys.exit(1)
+    for i, st in enumerate(code):
+        if st is None:
+            continue
+        if st.label is not None:
+            # other paths lead here
+            known = {}
+        if st.opcode is None:
+            continue
 
-        # Make sure we know this opcode at all
-        if opcode not in OPCODES:
-            print(f"line {line_num}: unknown opcode {opcode}", file=sys.stderr)
-            sys.exit(2)
+        reads, writes = reads_writes(st)
+
+        if (st.opcode in FOLD and st.operands[0] in known
+                and st.operands[1] in known
+                and st.operands[0] not in RESERVED_REGISTERS):
+            a, b = st.operands
+            value = FOLD[st.opcode](known[a], known[b])
+            code[i] = st._replace(opcode="LDI", op_b=str(value),
+                                  operands=(a, value))
+            known[a] = value
+            count("folded")
+            changed = True
+            continue
 
-        op_type = OPCODES[opcode]["type"]
+        for reg in writes:
+            known.pop(reg, None)
 
-        total_operands = 0
+        if st.opcode == "LDI" and isinstance(st.operands[1], int):
+            known[st.operands[0]] = st.operands[1]
+        elif st.opcode in CONTROL or st.opcode in ("DS", "DB"):
+            known = {}
 
-        if op_a is not None:
-            total_operands += 1
+    return changed
 
-        if op_b is not None:
-            total_operands += 1
 
-        if op_type == 0 or op_type == 1 or op_type == 2:
-            # 0, 1, or 2 register operands
-            check_ops_count(op_type, total_operands)
+def drop_push_pop(code, count):
+    changed = False
 
-        elif op_type == 8:
-            # LDI r,i or LDI r,label
-            check_ops_count(2, total_operands)
+    for i, st in enumerate(code):
+        if st is None or st.opcode != "PUSH":
+            continue
 
-    # Type to function mapping
-    type_f = {
-        0: out0,
-        1: out1,
-        2: out2,
-        8: out8,
-    }
+        j, labelled = following(code, i)
 
-    for line in inputfile:
-        line_num += 1
+        if (j is not None and not labelled and code[j].opcode == "POP"
+                and code[j].operands == st.operands
+                and st.operands[0] not in RESERVED_REGISTERS):
+            code[i] = label_only(st)
+            code[j] = None
+            count("push_pop")
+            changed = True
 
-        # Strip comments
-        comment_index = line.find(';')
-        if comment_index != -1:
-            line = line[:comment_index]
+    return changed
 
-        # Normalize
-        line = line.strip()
 
-        # Ignore blank lines
-        if input == '':
+def shorten_jumps(code, count):
+    targets = label_targets(code)
+    changed = False
+
+    def jump_through(i):
+        """If code[i] is LDI Rn,label followed by JMP Rn, return j of the
+        JMP and the label."""
+        st = code[i]
+
+        if st.opcode != "LDI" or not isinstance(st.operands[1], str):
+            return None, None
+
+        j, _ = following(code, i)
+
+        if (j is not None and code[j].opcode == "JMP"
+                and code[j].operands[0] == st.operands[0]):
+            return j, st.operands[1]
+
+        return None, None
+
+    for i, st in enumerate(code):
+        if st is None or st.opcode != "LDI" or \
+                not isinstance(st.operands[1], str):
             continue
 
-        # print(line)  # debug
+        reg = st.operands[0]
+        j, labelled = following(code, i)
 
-        m = re.match(REGEX, line)
+        if j is None or code[j].opcode not in ("JMP", "CALL") \
+                or code[j].operands[0] != reg:
+            continue
 
-        if m is not None:
-            label, opcode, op_a, op_b = normalize_line(m.groups())
+        # Follow LDI Rn,L2; JMP Rn chains at the target
+        label = st.operands[1]
+        seen = {label}
+
+        while label in targets:
+            k = targets[label]
+            if code[k].opcode != "LDI" or code[k].operands[0] != reg:
+                break
+            hop, next_label = jump_through(k)
+            if hop is None or next_label in seen:
+                break
+            label = next_label
+            seen.add(label)
+
+        if label != st.operands[1]:
+            code[i] = st._replace(op_b=label, operands=(reg, label))
+            count("jump_chain")
+            changed = True
+
+        # A JMP to the very next instruction is no jump at all, unless
+        # other code jumps to the JMP itself
+        if not labelled and code[j].opcode == "JMP" and \
+                targets.get(label) == following(code, j)[0]:
+            code[j] = label_only(code[j])
+            count("jump_next")
+            changed = True
+
+    return changed
+
+
+def invert_branches(code, count):
+    targets = label_targets(code)
+    inverse = {"JEQ": "JNE", "JNE": "JEQ"}
+    changed = False
+
+    for i, st in enumerate(code):
+        if st is None or st.opcode != "LDI" or \
+                not isinstance(st.operands[1], str):
+            continue
 
-            # print(label, opcode, op_a, op_b)  # debug
+        n, skip = st.operands
+        j, l1 = following(code, i)
+        if j is None or l1 or code[j].opcode not in inverse \
+                or code[j].operands[0] != n:
+            continue
+        k, l2 = following(code, j)
+        if k is None or l2 or code[k].opcode != "LDI" \
+                or not isinstance(code[k].operands[1], str):
+            continue
+        m, target = code[k].operands
+        jmp, l3 = following(code, k)
+        if jmp is None or l3 or code[jmp].opcode != "JMP" \
+                or code[jmp].operands[0] != m:
+            continue
+        if targets.get(skip) != following(code, jmp)[0] \
+                or target not in targets:
+            continue
+        if n in RESERVED_REGISTERS or m in RESERVED_REGISTERS:
+            continue
 
-            # Track label address
-            if label is not None:
-                sym[label] = addr
-                # print(f"Label {label}: {addr}")  # debug
-                code.append(f'# {label} (address {addr}):')
-
-            if opcode is not None:
-                if opcode == 'DS':
-                    handle_ds(line)
-                elif opcode == 'DB':
-                    handle_db(line)
-                else:
-                    # Check operand count
-                    check_ops(opcode, op_a, op_b)
-
-                    # Handle opcodes
-                    op_info = OPCODES[opcode]
-                    handler = type_f[op_info["type"]]
-                    handler(opcode, op_a, op_b, op_info["code"])
-        else:
-            print(f"No match: {input}", file=sys.stderr)
-            sys.exit(3)
+        # Rn no longer holds SKIP, nor Rm T, wherever they went before
+        at_skip = targets[skip]
+        if not dead_after(code, at_skip, n):
+            continue
+        if n != m and not (dead_after(code, at_skip, m)
+                           and dead_after(code, targets[target], n)):
+            continue
+
+        code[i] = code[k]._replace(line_num=st.line_num, label=st.label)
+        code[j] = code[j]._replace(opcode=inverse[code[j].opcode],
+                                   op_a=code[jmp].op_a, operands=(m,))
+        code[k] = None
+        code[jmp] = None
+        count("inverted_branch")
+        changed = True
 
+    return changed
+
+
+def drop_dead_loads(code, count):
+    changed = False
+
+    for i, st in enumerate(code):
+        if st is None or st.opcode != "LDI":
+            continue
 
-def pass2(outputfile, sym, code):
+        reg = st.operands[0]
+
+        if reg not in RESERVED_REGISTERS and dead_after(code, i + 1, reg):
+            code[i] = label_only(st)
+            count("dead_load")
+            changed = True
+
+    return changed
+
+
+def emit(statements, sym, source_map=None):
     """
-    Output the code, substituting in any symbols.
+    Lay out statements in memory and yield lists of (value, comment) cells
+    in address order. value is None for the label comment lines of text
+    output.
+
+    Labels are resolved in this single pass: a cell that refers to a label
+    not seen yet is held back, and everything after it is buffered until
+    the label is defined and the cell patched. With no fixups pending, cells
+    are yielded as soon as they are produced, so memory stays bounded by the
+    distance of forward references.
     """
 
-    for c in code:
-        # Replace symbols
-        if c[:4] == 'sym:':
-            s = c[4:].strip()
+    # Current code address (for labels)
+    addr = 0
+
+    # Cells held back while fixups are pending
+    pending = []
+    # label -> indexes into pending waiting for it
+    fixups = {}
 
-            if s in sym:
-                c = p8(sym[s])
+    for st in statements:
+        if st.label is not None:
+            sym[st.label] = addr
+            pending.append((None, f"{st.label} (address {addr}):"))
 
+            for index in fixups.pop(st.label, ()):
+                pending[index] = (addr, pending[index][1])
+
+        if st.opcode is not None:
+            if source_map is not None:
+                source_map[addr] = st.line_num
+
+            if st.opcode == 'DS':
+                for c in st.operands:
+                    print_char = chr(c)
+
+                    if print_char == ' ':
+                        print_char = '[space]'
+
+                    pending.append((c, print_char))
+            elif st.opcode == 'DB':
+                pending.append((st.operands[0], st.op_a))
             else:
-                print(f"unknown symbol: {s}", file=sys.stderr)
-                sys.exit(2)
+                comment = st.opcode
+                if st.op_a is not None:
+                    comment += f" {st.op_a}"
+                if st.op_b is not None:
+                    comment += f",{st.op_b}"
+
+                pending.append((OPCODE_VALUES[st.opcode], comment))
+
+                for operand in st.operands:
+                    if isinstance(operand, str):
+                        if operand in sym:
+                            operand = sym[operand]
+                        else:
+                            fixups.setdefault(operand, []).append(len(pending))
+                    pending.append((operand, None))
+
+            addr += len(st.operands) + (st.opcode not in ('DS', 'DB'))
+
+        if not fixups and pending:
+            yield pending
+            pending = []
 
-        outputfile.write(f"{c}\n")
+    if fixups:
+        s = next(iter(fixups))
+        raise AsmError(f"unknown symbol: {s}", 2)
+
+    if pending:
+        yield pending
+
+
+def pass2(outputfile, sym, statements, source_map=None):
+    """
+    Output the code as text, streaming it as labels are resolved.
+    """
+
+    for cells in emit(statements, sym, source_map):
+        outputfile.writelines([
+            f"# {comment}\n" if value is None
+            else f"{p8(value)}\n" if comment is None
+            else f"{p8(value)} # {comment}\n"
+            for value, comment in cells
+        ])
+
+
+def link(sym, statements, source_map=None):
+    """
+    Return the statements as program bytes.
+    """
+
+    return bytes(value
+                 for cells in emit(statements, sym, source_map)
+                 for value, _ in cells
+                 if value is not None)
+
+
+def pass2_image(outputfile, sym, statements):
+    """
+    Output the code as a binary .ls8b image.
+    """
+
+    outputfile.write(pack_image(link(sym, statements)))
+
+
+def assemble(source, sym=None, source_map=None, optimize=False,
+             stats=None):
+    """
+    Assemble source code held in a string and return the program bytes,
+    ready for CPU.load_bytes(). Nothing is read from or written to disk.
+
+    If sym or source_map dicts are given they are filled in with the symbol
+    table (label -> address) and the source map (address -> line number).
+    With optimize, statements go through peephole(), which fills in stats.
+    """
+
+    if sym is None:
+        sym = {}
+
+    statements = pass1(source.splitlines())
+
+    if optimize:
+        statements = peephole(statements, stats)
+
+    return link(sym, statements, source_map)
+
+
+# Outcome of verify(). differences lists what did not match.
+Verification = namedtuple("Verification", [
+    "matches", "differences", "instructions", "optimized_instructions"])
+
+
+def verify(source, budget=1000000):
+    """
+    Run source assembled with and without the peephole optimizer side by
+    side on the emulator, for up to budget instructions each, and compare
+    what they print and whether they halt or raise. Registers are not
+    compared, as those holding code addresses differ once code moves. A
+    program that runs out of budget only has to print a prefix of the
+    other's output, since the optimized one gets further.
+    """
+
+    # cpu.py imports its siblings, so it is imported as part of the ls8
+    # package, from a sys.path entry that is only there while it loads
+    root = os.path.dirname(LS8_DIR)
+    added = root not in sys.path
+    if added:
+        sys.path.append(root)
+
+    try:
+        from ls8.cpu import CPU
+        from ls8.sinks import CollectorSink
+    finally:
+        if added:
+            sys.path.remove(root)
+
+    cpus = []
+    raised = []
+
+    for optimize in (False, True):
+        cpu = CPU(CollectorSink())
+        cpu.load_bytes(assemble(source, optimize=optimize))
+        try:
+            cpu.run(budget)
+            raised.append(False)
+        except Exception:
+            raised.append(True)
+        cpus.append(cpu)
+
+    plain, optimized = cpus
+    plain_output = plain.output.getvalue()
+    optimized_output = optimized.output.getvalue()
+    halted = (not plain._running, not optimized._running)
+    differences = []
+
+    if raised[0] != raised[1]:
+        differences.append("raised")
+    elif halted[0] != halted[1]:
+        differences.append("halted")
+
+    if all(raised) or all(halted):
+        if plain_output != optimized_output:
+            differences.append("output")
+    elif not (plain_output.startswith(optimized_output)
+              or optimized_output.startswith(plain_output)):
+        differences.append("output")
+
+    return Verification(
+        matches=not differences,
+        differences=differences,
+        instructions=plain.instructions,
+        optimized_instructions=optimized.instructions,
+    )
+
+
+class BuildCache:
+    """
+    Content-addressed cache of assembled output.
+
+    Entries are keyed on a hash of the source plus the assembler version and
+    OPCODES table, so changing either misses. Each entry is one file in
+    directory. Entries are written to a temporary file and renamed into
+    place, so concurrent builds never see a partial entry; two writers of
+    the same key write the same content and the last rename wins. When the
+    cache grows past max_bytes the least recently used entries (oldest
+    mtime; hits touch the file) are removed.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        fingerprint = hashlib.sha256()
+        fingerprint.update(str(ASM_VERSION).encode())
+        fingerprint.update(repr(sorted(OPCODES.items())).encode())
+        self.fingerprint = fingerprint.digest()
+
+    def key(self, source):
+        """Return the cache key for source bytes."""
+        return hashlib.sha256(self.fingerprint + source).hexdigest()
+
+    def get(self, key):
+        """Return the cached output for key, or None on a miss."""
+        path = os.path.join(self.directory, key)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Missing, or evicted by another build in the meantime
+            return None
+
+        return data
+
+    def put(self, key, data):
+        """Store output for key, then evict down to the size cap."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.directory, key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under max_bytes."""
+        entries = []
+        total = 0
+
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+
+        entries.sort()
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def default_cache_dir():
+    """The build cache directory: $LS8_ASM_CACHE or ~/.cache/ls8-asm."""
+    return os.environ.get("LS8_ASM_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "ls8-asm")
+
+
+def build(outdir, inputfiles, cache=None):
+    """
+    Assemble each .asm file into outdir/<name>.ls8 in this process.
+
+    With a BuildCache, sources seen before skip assembly entirely, and
+    output files that already hold the right content are left untouched.
+    Returns the number of files that had to be assembled.
+    """
+
+    assembled = 0
+
+    for inputfile in inputfiles:
+        name = os.path.splitext(os.path.basename(inputfile))[0]
+        outputfile = os.path.join(outdir, f"{name}.ls8")
+
+        with open(inputfile, "rb") as f:
+            source = f.read()
+
+        data = None
+
+        if cache is not None:
+            key = cache.key(source)
+            data = cache.get(key)
+
+        if data is None:
+            out = io.StringIO()
+            pass2(out, {}, pass1(source.decode().splitlines()))
+            data = out.getvalue().encode()
+            assembled += 1
+
+            if cache is not None:
+                cache.put(key, data)
+
+        try:
+            with open(outputfile, "rb") as f:
+                if f.read() == data:
+                    continue
+        except FileNotFoundError:
+            pass
+
+        with open(outputfile, "wb") as f:
+            f.write(data)
+
+    return assembled
 
 
 def main(argv):
-    # Parse command line
-    inputfile, outputfile = parse_commandline(argv)
+    try:
+        # asm.py --build outdir file.asm ... assembles many files in one
+        # process, through the build cache
+        if len(argv) > 1 and argv[1] == "--build":
+            build(argv[2], argv[3:], BuildCache(default_cache_dir()))
+            return 0
+
+        if len(argv) == 3 and argv[1] == "--verify":
+            with open(argv[2]) as f:
+                result = verify(f.read())
+
+            print(f"{result.instructions} instructions unoptimized, "
+                  f"{result.optimized_instructions} optimized")
+
+            if not result.matches:
+                print(f"MISMATCH: {', '.join(result.differences)}",
+                      file=sys.stderr)
+                return 1
+
+            return 0
+
+        optimize = "-O" in argv
+        if optimize:
+            argv = [arg for arg in argv if arg != "-O"]
+
+        # Parse command line
+        inputfile, outputfile = parse_commandline(argv)
 
-    # Open files
-    inputfile, outputfile = open_files(inputfile, outputfile)
+        # Open files
+        inputfile, outputfile = open_files(inputfile, outputfile)
 
-    # Set up the symbol table
-    sym = {}
+        # Set up the symbol table
+        sym = {}
 
-    # Set up the machine code output
-    code = []
+        # Assemble
+        statements = pass1(inputfile)
+
+        if optimize:
+            stats = {}
+            statements = peephole(statements, stats)
+            print(f"saved {stats['instructions_saved']} instructions "
+                  f"({stats['bytes_saved']} bytes)", file=sys.stderr)
+
+        if "b" in getattr(outputfile, "mode", ""):
+            pass2_image(outputfile, sym, statements)
+        else:
+            pass2(outputfile, sym, statements)
 
-    # Assemble
-    pass1(inputfile, sym, code)
-    pass2(outputfile, sym, code)
+    except AsmError as e:
+        print(e, file=sys.stderr)
+        return e.status
 
     return 0
 
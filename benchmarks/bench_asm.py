@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+Measure assembler throughput in source lines per second on a large
+synthetic .asm file, and the peak memory allocated while doing so.
+
+Usage: bench_asm.py [lines] [path/to/asm.py ...]
+
+With no paths the current asm/asm.py is measured. Pass other copies of
+asm.py (e.g. one checked out from an older commit) to compare them.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# A loop with a forward and a backward label reference, some data and
+# comments; repeated with unique labels to reach the requested size
+CHUNK = """\
+; block {n}
+LOOP{n}:
+    LDI R0,10        ; counter
+    LDI R1,END{n}
+    ADD R0,R2
+    CMP R0,R3
+    JEQ R1
+    LDI R1,LOOP{n}
+    JMP R1
+MSG{n}: DS hello
+    DB 0x0a
+END{n}:
+    PUSH R0
+    POP R4
+
+"""
+
+CHUNK_LINES = CHUNK.count("\n")
+
+
+def load_asm_module(path):
+    spec = importlib.util.spec_from_file_location("bench_asm_module", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main(argv):
+    lines = int(argv[1]) if len(argv) > 1 else 200000
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = argv[2:] or [os.path.join(here, "..", "asm", "asm.py")]
+
+    with tempfile.NamedTemporaryFile("w", suffix=".asm", delete=False) as f:
+        for n in range(lines // CHUNK_LINES):
+            f.write(CHUNK.format(n=n))
+        source = f.name
+
+    try:
+        for path in paths:
+            asm = load_asm_module(path)
+
+            start = time.perf_counter()
+            asm.main(["asm.py", source, os.devnull])
+            elapsed = time.perf_counter() - start
+
+            # Second run under tracemalloc, which slows things down
+            tracemalloc.start()
+            asm.main(["asm.py", source, os.devnull])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            print(f"{path}: {lines / elapsed:,.0f} lines/sec, "
+                  f"peak {peak / 1024:,.0f} KiB")
+    finally:
+        os.unlink(source)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Measure instructions per second of CPU.run on a tight ADD/CMP/JNE loop.
+
+Usage: bench_dispatch.py [path/to/cpu.py ...]
+
+With no arguments the current ls8/cpu.py is measured. Pass other copies of
+cpu.py (e.g. one checked out from an older commit) to compare them.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+# LDI R0,0 / LDI R1,1 / LDI R2,200 / LDI R3,LOOP
+# LOOP: ADD R0,R1 / CMP R0,R2 / JNE R3 / HLT
+PROGRAM = """\
+10000010
+00000000
+00000000
+10000010
+00000001
+00000001
+10000010
+00000010
+11001000
+10000010
+00000011
+00001100
+10100000
+00000000
+00000001
+10100111
+00000000
+00000010
+01010110
+00000011
+00000001
+"""
+
+# 4 LDI, 200 trips through the 3 instruction loop, HLT
+INSTRUCTIONS = 4 + 200 * 3 + 1
+
+RUNS = 2000
+
+
+def load_cpu_class(path):
+    """
+    Import the CPU class from the cpu.py at path. Its directory is put on
+    sys.path for the sibling modules cpu.py imports, and those are dropped
+    from sys.modules afterwards so that the next copy loads its own.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    before = set(sys.modules)
+    sys.path.insert(0, directory)
+
+    try:
+        spec = importlib.util.spec_from_file_location("bench_cpu", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(directory)
+        for name in set(sys.modules) - before:
+            loaded = getattr(sys.modules[name], "__file__", None) or ""
+            if os.path.dirname(os.path.abspath(loaded)) == directory:
+                del sys.modules[name]
+
+    return module.CPU
+
+
+def measure(cpu_class, program_file):
+    start = time.perf_counter()
+
+    for _ in range(RUNS):
+        cpu = cpu_class()
+        if hasattr(cpu, "skip_loops"):
+            # time every trip round the loop, not the shortcut past it
+            cpu.skip_loops = False
+        cpu.load(program_file)
+        cpu.run()
+
+    elapsed = time.perf_counter() - start
+
+    return RUNS * INSTRUCTIONS / elapsed
+
+
+def main(argv):
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = argv[1:] or [os.path.join(here, "..", "ls8", "cpu.py")]
+
+    with tempfile.NamedTemporaryFile("w", suffix=".ls8", delete=False) as f:
+        f.write(PROGRAM)
+        program_file = f.name
+
+    try:
+        for path in paths:
+            ips = measure(load_cpu_class(path), program_file)
+            print(f"{path}: {ips:,.0f} instructions/sec")
+    finally:
+        os.unlink(program_file)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
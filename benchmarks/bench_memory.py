@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""
+Measure the memory each resident machine costs.
+
+Usage: bench_memory.py [machines]
+
+Compares a CPU object per machine, with its own output sink and with one
+shared sink, against records in an arena.Arena.
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ls8.arena import Arena  # noqa: E402
+from ls8.cpu import CPU  # noqa: E402
+from ls8.sinks import CollectorSink  # noqa: E402
+
+
+def bytes_per_machine(make, n):
+    tracemalloc.start()
+    machines = make(n)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del machines
+
+    return size / n
+
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 100000
+    shared = CollectorSink()
+
+    layouts = [
+        ("CPU per machine", lambda n: [CPU() for _ in range(n)]),
+        ("CPU, shared sink", lambda n: [CPU(shared) for _ in range(n)]),
+        ("Arena record", Arena),
+    ]
+
+    for name, make in layouts:
+        print(f"{name:18} {bytes_per_machine(make, n):8.1f} bytes/machine")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
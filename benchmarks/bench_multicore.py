@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+Measure how multicore.MultiCore scales with the number of cores.
+
+Usage: bench_multicore.py [max_cores]
+
+Every core runs the same fixed amount of work, so with perfect scaling
+the wall time stays flat and the aggregate instructions per second grow
+with the core count. Runs 1 core up to max_cores, all host cores by
+default.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from asm.asm import assemble  # noqa: E402
+from ls8.multicore import MultiCore  # noqa: E402
+
+# 200 x 200 trips round an inner loop that reads shared RAM, which keeps
+# it from being fast-forwarded
+WORK = """\
+        LDI R0,0
+        LDI R2,1
+        LDI R3,200
+OUTER:  LDI R1,0
+INNER:  LD R4,R1
+        ADD R1,R2
+        CMP R1,R3
+        LDI R4,INNER
+        JNE R4
+        ADD R0,R2
+        CMP R0,R3
+        LDI R4,OUTER
+        JNE R4
+        HLT
+"""
+
+
+def main(argv):
+    max_cores = int(argv[1]) if len(argv) > 1 else os.cpu_count()
+    program = assemble(WORK)
+    baseline = None
+
+    print("cores  instructions    wall s    instr/s  speedup  efficiency")
+
+    for cores in range(1, max_cores + 1):
+        machine = MultiCore(program, cores=cores)
+
+        start = time.perf_counter()
+        results = machine.run()
+        wall = time.perf_counter() - start
+
+        instructions = sum(r.instructions for r in results)
+        rate = instructions / wall
+
+        if baseline is None:
+            baseline = rate
+
+        print(f"{cores:5} {instructions:13,} {wall:9.3f} {rate:10,.0f} "
+              f"{rate / baseline:8.2f} {rate / baseline / cores:11.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
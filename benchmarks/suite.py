@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark suite for the LS-8 emulator.
+
+Usage: suite.py [--engine=NAME ...] [--fast-forward] [--json=results.json]
+       suite.py --compare=base.json new.json
+
+Runs each workload on each engine (default: interp) and reports
+instructions/sec, ns/instruction and peak memory per workload, plus the
+startup time of ls8.py. With two or more engines the others are shown
+relative to the first. Loops are executed in full unless --fast-forward
+is given, so that the figures measure the engines rather than how many
+iterations the interpreter could skip. --json stores the results, a list
+with one entry per engine; --compare reports the change between two
+stored runs, engine by engine, and exits 1 if any workload got more than
+THRESHOLD slower.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from asm.asm import assemble  # noqa: E402
+from ls8.engines import ENGINES  # noqa: E402
+from ls8.image import parse_text  # noqa: E402
+from ls8.sinks import BufferedSink  # noqa: E402
+
+# Relative slowdown that --compare reports as a regression
+THRESHOLD = 0.10
+
+# Nested counted loops: ADD/CMP/LDI/JNE
+ARITH = """\
+        LDI R0,0
+        LDI R2,1
+        LDI R3,250
+OUTER:  LDI R1,0
+INNER:  ADD R1,R2
+        CMP R1,R3
+        LDI R4,INNER
+        JNE R4
+        ADD R0,R2
+        CMP R0,R3
+        LDI R4,OUTER
+        JNE R4
+        HLT
+"""
+
+# Recursion 100 calls deep, 100 times: CALL/RET and the stack
+CALLS = """\
+        LDI R1,0
+        LDI R2,1
+        LDI R3,100
+MAIN:   LDI R0,0
+        LDI R4,REC
+        CALL R4
+        ADD R1,R2
+        CMP R1,R3
+        LDI R4,MAIN
+        JNE R4
+        HLT
+REC:    ADD R0,R2
+        CMP R0,R3
+        LDI R4,DONE
+        JEQ R4
+        LDI R4,REC
+        CALL R4
+DONE:   RET
+"""
+
+# PUSH/POP churn
+STACK = """\
+        LDI R0,0
+        LDI R2,1
+        LDI R3,250
+LOOP:   PUSH R0
+        PUSH R2
+        PUSH R3
+        POP R3
+        POP R2
+        POP R1
+        ADD R0,R2
+        CMP R0,R3
+        LDI R4,LOOP
+        JNE R4
+        HLT
+"""
+
+
+def example(name):
+    with open(os.path.join(ROOT, "ls8", "examples", name)) as f:
+        return bytes(parse_text(f))
+
+
+# name -> (program bytes, number of runs)
+WORKLOADS = {
+    "arith_loop": (assemble(ARITH), 4),
+    "call_ret": (assemble(CALLS), 4),
+    "stack_churn": (assemble(STACK), 100),
+    "sctest": (example("sctest.ls8"), 5000),
+    "printstr": (example("printstr.ls8"), 2000),
+}
+
+
+def run_workload(engine, program, runs, fast_forward=False):
+    """Run program runs times on fresh CPUs; return instructions, seconds."""
+    cpu_class = ENGINES[engine]
+    instructions = 0
+
+    with open(os.devnull, "w") as devnull:
+        start = time.perf_counter()
+
+        for _ in range(runs):
+            cpu = cpu_class(BufferedSink(devnull))
+            cpu.skip_loops = fast_forward
+            cpu.load_bytes(program)
+            cpu.run()
+            instructions += cpu.instructions
+
+        seconds = time.perf_counter() - start
+
+    return instructions, seconds
+
+
+def peak_memory(engine, program, fast_forward=False):
+    """Peak bytes allocated while constructing, loading and running once."""
+    tracemalloc.start()
+    try:
+        run_workload(engine, program, 1, fast_forward)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def startup_time(engine, repeats=5):
+    """Best wall time of running print8.ls8 through ls8.py, in seconds."""
+    ls8_dir = os.path.join(ROOT, "ls8")
+    best = None
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "ls8.py", f"--engine={engine}",
+                        "examples/print8.ls8"],
+                       cwd=ls8_dir, check=True, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def run_suite(engine, fast_forward=False):
+    """Run every workload on engine and return the results as a dict."""
+    workloads = {}
+
+    for name, (program, runs) in WORKLOADS.items():
+        try:
+            instructions, seconds = run_workload(engine, program, runs,
+                                                 fast_forward)
+        except Exception as e:
+            workloads[name] = {"skipped": str(e)}
+            continue
+
+        workloads[name] = {
+            "instructions": instructions,
+            "seconds": seconds,
+            "ips": instructions / seconds,
+            "ns_per_instruction": seconds * 1e9 / instructions,
+            "peak_kib": peak_memory(engine, program, fast_forward) / 1024,
+        }
+
+    return {
+        "engine": engine,
+        "fast_forward": fast_forward,
+        "python": platform.python_version(),
+        "startup_ms": startup_time(engine) * 1000,
+        "workloads": workloads,
+    }
+
+
+def label(results):
+    """The engine, marked if loops were fast-forwarded."""
+    if results.get("fast_forward"):
+        return results["engine"] + " (fast-forward)"
+    return results["engine"]
+
+
+def print_results(results, base=None):
+    print(f"engine {label(results)}: "
+          f"startup {results['startup_ms']:.1f} ms")
+
+    for name, w in results["workloads"].items():
+        if "skipped" in w:
+            print(f"  {name:12} skipped: {w['skipped']}")
+            continue
+
+        line = (f"  {name:12} {w['ips']:>14,.0f} instr/s "
+                f"{w['ns_per_instruction']:>8.1f} ns/instr "
+                f"{w['peak_kib']:>8.1f} KiB peak")
+
+        if base is not None and "ips" in base["workloads"].get(name, {}):
+            ratio = w["ips"] / base["workloads"][name]["ips"]
+            line += f"  {ratio:.2f}x {label(base)}"
+
+        print(line)
+
+
+def compare(base, new):
+    """Print per-workload change from base to new; return regressions."""
+    regressions = []
+
+    print(f"{label(base)} ({base['python']}) -> "
+          f"{label(new)} ({new['python']})")
+
+    for name, w in new["workloads"].items():
+        b = base["workloads"].get(name, {})
+
+        if "ips" not in w or "ips" not in b:
+            continue
+
+        change = w["ips"] / b["ips"] - 1
+        flag = ""
+        if change < -THRESHOLD:
+            flag = "  REGRESSION"
+            regressions.append(name)
+
+        print(f"  {name:12} {b['ips']:>14,.0f} -> {w['ips']:>14,.0f} "
+              f"instr/s {change:+7.1%}{flag}")
+
+    return regressions
+
+
+def compare_runs(base, new):
+    """Compare each engine in new with the same engine, fast-forwarding
+    the same way, in base; return (engine, workload) for every
+    regression."""
+    by_label = {label(results): results for results in base}
+    regressions = []
+
+    for results in new:
+        if label(results) not in by_label:
+            print(f"{label(results)}: not in the base run")
+            continue
+
+        regressions += [(label(results), name) for name in
+                        compare(by_label[label(results)], results)]
+
+    return regressions
+
+
+def main(argv):
+    engines = []
+    json_file = None
+    compare_file = None
+    fast_forward = False
+    args = argv[1:]
+
+    for arg in list(args):
+        option, _, value = arg.partition("=")
+
+        if option == "--engine" and value in ENGINES:
+            engines.append(value)
+        elif arg == "--fast-forward":
+            fast_forward = True
+        elif option == "--json":
+            json_file = value
+        elif option == "--compare":
+            compare_file = value
+        elif not arg.startswith("--"):
+            continue
+        else:
+            print(__doc__.strip(), file=sys.stderr)
+            return 1
+
+        args.remove(arg)
+
+    if compare_file is not None:
+        if len(args) != 1:
+            print(__doc__.strip(), file=sys.stderr)
+            return 1
+
+        with open(compare_file) as f:
+            base = json.load(f)
+        with open(args[0]) as f:
+            new = json.load(f)
+
+        return 1 if compare_runs(base, new) else 0
+
+    all_results = []
+
+    for engine in engines or ["interp"]:
+        results = run_suite(engine, fast_forward)
+        print_results(results, all_results[0] if all_results else None)
+        all_results.append(results)
+
+    if json_file is not None:
+        with open(json_file, "w") as f:
+            json.dump(all_results, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
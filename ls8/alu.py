@@ -0,0 +1,66 @@
+"""
+8-bit ALU lookup tables.
+
+Two-operand tables have 65536 entries indexed by `a << 8 | b`, one-operand
+tables 256 entries indexed by `a`, so every ALU operation is a single
+lookup and results always fit in a byte. The CMP table holds the packed
+L, G and E flags. Each table is built the first time it is used.
+"""
+
+# Flag bits of the packed FL register, as in the spec's 00000LGE
+FL_L = 0b100  # a < b
+FL_G = 0b010  # a > b
+FL_E = 0b001  # a == b
+
+BYTES = range(256)
+SHIFTS = range(8)
+LOW_BYTE = 0xFF.__and__
+# Two copies of 0..255 and 255..0, so any 256 long slice wraps around
+UP = bytes(BYTES) * 2
+DOWN = bytes(reversed(BYTES)) * 2
+
+
+def table(row):
+    """Join row(a), the 256 results for b = 0..255, for every a."""
+    return b"".join(row(a) for a in BYTES)
+
+
+# Builders by table name. Division by zero has no result; its entries are
+# 0 and the CPU checks for it before looking up.
+BUILDERS = {
+    "ADD": lambda: table(lambda a: UP[a:a + 256]),
+    "SUB": lambda: table(lambda a: DOWN[255 - a:511 - a]),
+    "MUL": lambda: table(lambda a: bytes(map(LOW_BYTE, map(a.__mul__,
+                                                           BYTES)))),
+    "DIV": lambda: table(lambda a: b"\0" + bytes(map(a.__floordiv__,
+                                                     BYTES[1:]))),
+    "MOD": lambda: table(lambda a: b"\0" + bytes(map(a.__mod__,
+                                                     BYTES[1:]))),
+    "AND": lambda: table(lambda a: bytes(map(a.__and__, BYTES))),
+    "OR": lambda: table(lambda a: bytes(map(a.__or__, BYTES))),
+    "XOR": lambda: table(lambda a: bytes(map(a.__xor__, BYTES))),
+    # shifting by 8 or more leaves nothing
+    "SHL": lambda: table(lambda a: bytes(map(LOW_BYTE, map(a.__lshift__,
+                                                           SHIFTS)))
+                         + bytes(248)),
+    "SHR": lambda: table(lambda a: bytes(map(a.__rshift__, SHIFTS))
+                         + bytes(248)),
+    "CMP": lambda: table(lambda a: bytes([FL_G]) * a + bytes([FL_E])
+                         + bytes([FL_L]) * (255 - a)),
+    "INC": lambda: UP[1:257],
+    "DEC": lambda: UP[255:511],
+    "NOT": lambda: bytes(reversed(BYTES)),
+}
+
+
+def __getattr__(name):
+    """Build a table on first access and keep it as a module global."""
+    try:
+        builder = BUILDERS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute "
+                             f"{name!r}") from None
+
+    globals()[name] = result = builder()
+
+    return result
@@ -0,0 +1,124 @@
+"""Many resident machines packed into one bytearray."""
+
+import struct
+
+try:
+    from .cpu import IS, KEY_ADDRESS, POWER_ON, Snapshot
+except ImportError:
+    from cpu import IS, KEY_ADDRESS, POWER_ON, Snapshot
+
+# Layout of one machine's record: 256 bytes of RAM, R0-R7, then FL, PC,
+# SP, IR, status bits and the instruction count
+REG_OFFSET = 256
+STATE = struct.Struct("<BBBBB3xQ")
+STATE_OFFSET = REG_OFFSET + 8
+RECORD_SIZE = STATE_OFFSET + STATE.size
+
+# Status bits
+RUNNING = 0b001
+INTERRUPTS_ENABLED = 0b010
+PENDING = 0b100
+
+
+class Arena:
+    """
+    n machines held as fixed-size records in one bytearray, RECORD_SIZE
+    bytes each, with no Python objects per machine.
+
+    A machine is run by moving it onto a CPU of any engine: run() restores
+    the record into the CPU, runs it and saves it back, so a handful of
+    CPU objects can serve any number of resident machines. Posting an
+    interrupt to a resident machine sets its IS bit in the record
+    directly.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        record = bytearray(RECORD_SIZE)
+        record[REG_OFFSET:STATE_OFFSET] = bytes(POWER_ON.reg)
+        STATE.pack_into(record, STATE_OFFSET, POWER_ON.fl, POWER_ON.pc,
+                        POWER_ON.sp, POWER_ON.ir,
+                        RUNNING | INTERRUPTS_ENABLED,
+                        POWER_ON.instructions)
+        self.memory = record * n
+
+    def __len__(self):
+        return self.n
+
+    def offset(self, index):
+        if not 0 <= index < self.n:
+            raise IndexError(f"machine {index} out of range")
+        return index * RECORD_SIZE
+
+    def load(self, index, program, entry=0):
+        """Copy program bytes into a machine's memory from address 0 and
+        set its PC to the entry point."""
+        base = self.offset(index)
+        self.memory[base:base + len(program)] = program
+        self.memory[base + STATE_OFFSET + 1] = entry
+
+    def snapshot(self, index):
+        """Return a machine's state as a cpu.Snapshot."""
+        base = self.offset(index)
+        memory = self.memory
+        fl, pc, sp, ir, status, instructions = STATE.unpack_from(
+            memory, base + STATE_OFFSET)
+
+        return Snapshot(
+            ram=bytes(memory[base:base + REG_OFFSET]),
+            reg=tuple(memory[base + REG_OFFSET:base + STATE_OFFSET]),
+            fl=fl,
+            pc=pc,
+            sp=sp,
+            ir=ir,
+            running=bool(status & RUNNING),
+            instructions=instructions,
+            interrupts_enabled=bool(status & INTERRUPTS_ENABLED),
+            pending=bool(status & PENDING),
+        )
+
+    def save(self, index, cpu):
+        """
+        Store a CPU's state as a machine's record. Events posted to the
+        CPU but not yet taken in are not kept; post to the arena instead.
+        """
+        base = self.offset(index)
+        memory = self.memory
+        memory[base:base + REG_OFFSET] = cpu.RAM
+        memory[base + REG_OFFSET:base + STATE_OFFSET] = bytes(cpu.REG)
+        STATE.pack_into(
+            memory, base + STATE_OFFSET, cpu.FL, cpu.PC & 0xFF,
+            cpu.SP & 0xFF, cpu.IR,
+            (cpu._running and RUNNING)
+            | (cpu.interrupts_enabled and INTERRUPTS_ENABLED)
+            | (cpu._pending and PENDING),
+            cpu.instructions)
+
+    def post_interrupt(self, index, number, key=None):
+        """Raise interrupt number on a resident machine, storing key at
+        KEY_ADDRESS if given, as CPU.post_interrupt() would."""
+        base = self.offset(index)
+        memory = self.memory
+
+        if key is not None:
+            memory[base + KEY_ADDRESS] = key
+        memory[base + REG_OFFSET + IS] |= 1 << number
+        memory[base + STATE_OFFSET + 4] |= PENDING
+
+    def running(self, index):
+        """True unless the machine has halted."""
+        return bool(self.memory[self.offset(index) + STATE_OFFSET + 4]
+                    & RUNNING)
+
+    def run(self, index, cpu, max_instructions=None):
+        """
+        Run a machine on cpu until it halts or max_instructions have been
+        executed, then save it back. Returns the number of instructions
+        executed.
+        """
+        cpu.restore(self.snapshot(index))
+
+        try:
+            return cpu.run(max_instructions)
+        finally:
+            self.save(index, cpu)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""Run many .ls8 programs in parallel over a process pool."""
+
+import glob
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from .engines import ENGINES
+    from .sinks import CollectorSink
+except ImportError:
+    from engines import ENGINES
+    from sinks import CollectorSink
+
+# Per-program outcome. halted is False when the budget ran out or the
+# program raised; error holds the exception text in the latter case.
+Result = namedtuple('Result', [
+    'program', 'output', 'halted', 'instructions', 'wall_time', 'error'])
+
+
+def run_program(program, budget=None, engine='interp'):
+    """Load and run one program, capturing its output."""
+    output = CollectorSink()
+    cpu = ENGINES[engine](output)
+    error = None
+
+    start = time.perf_counter()
+
+    try:
+        cpu.load(program)
+        cpu.run(budget)
+    except Exception as e:
+        error = str(e)
+
+    wall_time = time.perf_counter() - start
+
+    return Result(
+        program=program,
+        output=output.getvalue(),
+        halted=error is None and not cpu._running,
+        instructions=cpu.instructions,
+        wall_time=wall_time,
+        error=error,
+    )
+
+
+def expand(patterns):
+    """Expand glob patterns into a sorted list of program paths."""
+    programs = []
+
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            programs += sorted(glob.glob(pattern))
+        else:
+            programs.append(pattern)
+
+    return programs
+
+
+def run_batch(programs, budgets=None, engine='interp', max_workers=None):
+    """
+    Run programs over a pool of worker processes, one per core by default.
+
+    programs is a list of paths or glob patterns. budgets is either a single
+    instruction budget for every program or a dict of program path to
+    budget; programs without a budget run until they halt. Workers are
+    reused across programs so interpreter startup is paid once per core.
+    Results are returned in the order of the expanded program list.
+    """
+    programs = expand(programs)
+
+    if isinstance(budgets, dict):
+        job_budgets = [budgets.get(p) for p in programs]
+    else:
+        job_budgets = [budgets] * len(programs)
+
+    max_workers = max_workers or os.cpu_count()
+    chunksize = max(1, len(programs) // (max_workers * 4))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run_program, programs, job_budgets,
+                             [engine] * len(programs), chunksize=chunksize))
+
+
+def main(argv):
+    args = argv[1:]
+    budget = None
+    engine = 'interp'
+
+    while args and args[0].startswith('--'):
+        option, _, value = args.pop(0).partition('=')
+
+        if option == '--budget':
+            budget = int(value)
+        elif option == '--engine' and value in ENGINES:
+            engine = value
+        else:
+            args = []
+            break
+
+    if not args:
+        print(f"Usage: batch.py [--budget=N] [--engine={'|'.join(ENGINES)}] "
+              "examples/*.ls8", file=sys.stderr)
+        return 1
+
+    for result in run_batch(args, budget, engine):
+        print(json.dumps(result._asdict()))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,311 @@
+"""Basic-block compiler execution engine."""
+
+try:
+    from . import alu
+    from .alu import FL_E
+    from .cpu import (CPU, HLT, RET, PUSH, POP, PRN, CALL, JMP, JEQ, JNE,
+                      LDI, ADD, SUB, MUL, AND, OR, XOR, SHL, SHR, INC, DEC,
+                      NOT, CMP)
+except ImportError:
+    import alu
+    from alu import FL_E
+    from cpu import (CPU, HLT, RET, PUSH, POP, PRN, CALL, JMP, JEQ, JNE,
+                     LDI, ADD, SUB, MUL, AND, OR, XOR, SHL, SHR, INC, DEC,
+                     NOT, CMP)
+
+# Instructions that end a basic block because they set the PC or halt
+TERMINATORS = {JMP, JEQ, JNE, CALL, RET, HLT}
+
+# Instructions that write RAM. A block ends after one of these so that a
+# write into code that has just been compiled takes effect straight away.
+MEMORY_WRITES = {PUSH}
+
+# ALU instructions compiled to a lookup in the alu.py table of the same
+# name. DIV and MOD are left to the interpreter, which checks for zero.
+BINARY = {ADD: 'ADD', SUB: 'SUB', MUL: 'MUL', AND: 'AND', OR: 'OR',
+          XOR: 'XOR', SHL: 'SHL', SHR: 'SHR'}
+UNARY = {INC: 'INC', DEC: 'DEC', NOT: 'NOT'}
+
+# Compiled code objects shared by every BlockCPU, keyed by generated source
+_code_cache = {}
+
+
+class BlockCPU(CPU):
+    """
+    CPU that runs straight-line runs of instructions as compiled Python.
+
+    Each basic block is translated to the source of a Python function that
+    keeps the registers it touches in locals, compiled once with compile()
+    and cached by start address. Writing RAM inside a compiled range drops
+    every block that covers that address.
+    """
+
+    def __init__(self, output=None):
+        super().__init__(output)
+        self._blocks = {}
+        # addresses -> start addresses of the blocks that cover them
+        self._covering = [[] for _ in range(256)]
+        self._namespace = {
+            'cpu': self,
+            'REG': self.REG,
+            'ram': self.RAM,
+            'alu': alu,
+        }
+
+    def ram_write(self, mar, mdr):
+        """writes data to ram and invalidates compiled blocks that cover it"""
+        mar &= 0xFF
+        self.RAM[mar] = mdr & 0xFF
+
+        if self._covering[mar]:
+            self.invalidate(mar)
+        if self._no_loop_at[mar]:
+            self.forget_loops()
+
+    def load_bytes(self, program, entry=0):
+        """Copy program bytes into memory, dropping every compiled block"""
+        super().load_bytes(program, entry)
+        self._blocks.clear()
+        for starts in self._covering:
+            starts.clear()
+
+    def restore(self, snapshot):
+        """Restore a snapshot, keeping the compiled blocks whose code it
+        leaves unchanged"""
+        ram = self.RAM
+        saved = snapshot.ram
+
+        if ram != saved:
+            for addr in range(256):
+                if ram[addr] != saved[addr] and self._covering[addr]:
+                    self.invalidate(addr)
+
+        super().restore(snapshot)
+
+    def invalidate(self, address):
+        """drop every compiled block covering the given address"""
+        for start in list(self._covering[address]):
+            end = self._blocks.pop(start)[1]
+            for addr in range(start, end):
+                self._covering[addr].remove(start)
+
+    def compile_block(self, start):
+        """Translate the block at start to Python, compile and cache it."""
+        source, end, count = generate_block(self.RAM, start)
+
+        if source is None:
+            return None
+
+        code = _code_cache.get(source)
+        if code is None:
+            code = compile(source, f"<block {start:02X}>", "exec")
+            _code_cache[source] = code
+
+        namespace = dict(self._namespace)
+        exec(code, namespace)
+        block = namespace['block']
+
+        entry = (block, end, count)
+        self._blocks[start] = entry
+        for addr in range(start, end):
+            self._covering[addr].append(start)
+
+        return entry
+
+    def run(self, max_instructions=None):
+        """
+        Run the CPU one compiled block at a time. A block that would overrun
+        max_instructions is stepped by the interpreter instead. A profiled
+        or traced CPU is always interpreted.
+        """
+        if self.profiler is not None or self.tracer is not None:
+            return CPU.run(self, max_instructions)
+
+        blocks = self._blocks
+        count = 0
+
+        try:
+            while self._running and count != max_instructions:
+                if self._pending:
+                    self.check_interrupts()
+
+                pc = self.PC
+                entry = blocks.get(pc)
+
+                if entry is None:
+                    entry = self.compile_block(pc)
+
+                    if entry is None:
+                        # Not compilable: let the interpreter run (or
+                        # reject) this one instruction
+                        stepped = self._run(1)
+                        self.instructions -= stepped
+                        count += stepped
+                        continue
+
+                block, _, length = entry
+
+                if (max_instructions is not None
+                        and count + length > max_instructions):
+                    stepped = self._run(max_instructions - count)
+                    # CPU.run has already counted these in self.instructions
+                    self.instructions -= stepped
+                    count += stepped
+                    break
+
+                self.PC = block()
+                count += length
+        finally:
+            self.instructions += count
+            self.output.flush()
+
+        return count
+
+
+def generate_block(ram, start):
+    """
+    Generate Python source for the basic block at start.
+
+    Returns (source, end, count) where end is one past the last byte of the
+    block and count is the number of instructions in it, or
+    (None, start, 0) if the first instruction is unknown.
+    """
+
+    body = []
+    used = set()
+    written = set()
+    uses_fl = False
+    uses_sp = False
+    addr = start
+    count = 0
+    exits = []
+
+    def reg(n):
+        used.add(n)
+        return f"r{n}"
+
+    def wrote(n):
+        """Note a write to register n, after the statement doing it."""
+        written.add(n)
+        if 4 < n < 7:  # IM or IS
+            body.append("cpu._pending = True")
+
+    while addr < 256:
+        ir = ram[addr]
+        entry = CPU.DECODE[ir]
+
+        if entry is None:
+            break
+
+        operands = entry[1]
+        if addr + operands >= 256:
+            break
+
+        a = ram[addr + 1] if operands > 0 else 0
+        b = ram[addr + 2] if operands > 1 else 0
+        nxt = addr + operands + 1
+
+        if a > 7 or (b > 7 and (ir in BINARY or ir == CMP)):
+            # No such register: end the block so the interpreter raises
+            break
+
+        if ir == LDI:
+            body.append(f"{reg(a)} = {b}")
+            wrote(a)
+        elif ir in BINARY:
+            body.append(f"{reg(a)} = alu.{BINARY[ir]}"
+                        f"[{reg(a)} << 8 | {reg(b)}]")
+            wrote(a)
+        elif ir in UNARY:
+            body.append(f"{reg(a)} = alu.{UNARY[ir]}[{reg(a)}]")
+            wrote(a)
+        elif ir == CMP:
+            uses_fl = True
+            body.append(f"fl = alu.CMP[{reg(a)} << 8 | {reg(b)}]")
+        elif ir == PRN:
+            body.append(f"cpu.output.write(f'{{{reg(a)}}}\\n')")
+        elif ir == PUSH:
+            uses_sp = True
+            body.append("sp -= 1")
+            body.append(f"cpu.ram_write(sp, {reg(a)})")
+        elif ir == POP:
+            uses_sp = True
+            body.append(f"{reg(a)} = ram[sp & 0xFF]")
+            body.append("sp += 1")
+            wrote(a)
+        elif ir == CALL:
+            uses_sp = True
+            body.append("sp -= 1")
+            body.append(f"cpu.ram_write(sp, {addr + 2})")
+            exits.append(len(body))
+            body.append(f"return {reg(a)}")
+        elif ir == RET:
+            uses_sp = True
+            body.append("pc = ram[sp & 0xFF]")
+            body.append("sp += 1")
+            exits.append(len(body))
+            body.append("return pc")
+        elif ir == JMP:
+            exits.append(len(body))
+            body.append(f"return {reg(a)}")
+        elif ir == JEQ:
+            uses_fl = True
+            exits.append(len(body))
+            body.append(f"return {reg(a)} if fl & {FL_E} else {nxt}")
+        elif ir == JNE:
+            uses_fl = True
+            exits.append(len(body))
+            body.append(f"return {nxt} if fl & {FL_E} else {reg(a)}")
+        elif ir == HLT:
+            body.append("cpu._running = False")
+            body.append("cpu._pending = True")
+            exits.append(len(body))
+            body.append(f"return {nxt}")
+        else:
+            # Known to the interpreter but not to the compiler
+            break
+
+        addr = nxt
+        count += 1
+
+        if ir in TERMINATORS:
+            break
+
+        if ir in MEMORY_WRITES or body[-1] == "cpu._pending = True":
+            # a RAM write, or an IM/IS write that may let an interrupt in,
+            # must take effect before the next instruction
+            exits.append(len(body))
+            body.append(f"return {addr}")
+            break
+    else:
+        exits.append(len(body))
+        body.append(f"return {addr}")
+
+    if addr == start:
+        return None, start, 0
+
+    if not exits or exits[-1] != len(body) - 1:
+        # Fell off the end in front of an instruction we can't compile
+        exits.append(len(body))
+        body.append(f"return {addr}")
+
+    # Write back modified state in front of every return
+    writeback = [f"REG[{n}] = r{n}" for n in sorted(written)]
+    if uses_fl:
+        writeback.append("cpu.FL = fl")
+    if uses_sp:
+        writeback.append("cpu.SP = sp")
+
+    lines = ["def block():"]
+    lines += [f"    r{n} = REG[{n}]" for n in sorted(used)]
+    if uses_fl:
+        lines.append("    fl = cpu.FL")
+    if uses_sp:
+        lines.append("    sp = cpu.SP")
+
+    for i, statement in enumerate(body):
+        if i in exits:
+            lines += ["    " + w for w in writeback]
+        lines.append("    " + statement)
+
+    return "\n".join(lines) + "\n", addr, count
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+Client for the emulator daemon (daemon.py), for use in place of ls8.py.
+
+Usage: client.py [--socket=PATH] [--engine=interp|blocks|fused]
+                 [--budget=N] [--state] examples/file_name
+
+Program output is written to stdout as the daemon sends it. Unless stdin
+is a terminal, it is read and fed to the program as key presses. --state
+prints the final machine state to stderr as JSON. The exit status is 1
+if the program raised an error, otherwise 0.
+"""
+
+import base64
+import json
+import os
+import socket
+import sys
+import tempfile
+
+try:
+    from .image import pack_image, parse_text, read_image
+except ImportError:
+    from image import pack_image, parse_text, read_image
+
+# Where the daemon listens and the client connects unless told otherwise
+SOCKET_PATH = os.path.join(tempfile.gettempdir(),
+                           f"ls8-{os.getuid()}.sock")
+
+USAGE = ("Usage: client.py [--socket=PATH] [--engine=interp|blocks|fused] "
+         "[--budget=N] [--state] examples/file_name")
+
+
+def read_program(path):
+    """Return the .ls8b image of a .ls8 text or .ls8b program file."""
+    if path.endswith('.ls8b'):
+        with open(path, 'rb') as f:
+            image = f.read()
+        # check it here rather than have the daemon reject it
+        read_image(image)[1].release()
+        return image
+
+    with open(path) as f:
+        return pack_image(parse_text(f))
+
+
+class Client:
+    """
+    A connection to the daemon, good for any number of runs. Use it as a
+    context manager or call close() when done.
+    """
+
+    def __init__(self, path=SOCKET_PATH):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self._reader = self.socket.makefile('rb')
+
+    def run(self, image, input="", budget=None, engine='interp',
+            output=None):
+        """
+        Run a .ls8b image on the daemon. Output is passed to output.write
+        as it arrives, or collected and returned in the final message's
+        "output" if output is None. Returns the daemon's final message.
+        """
+        request = {
+            "image": base64.b64encode(bytes(image)).decode('ascii'),
+            "input": input,
+            "budget": budget,
+            "engine": engine,
+        }
+        self.socket.sendall(json.dumps(request).encode() + b"\n")
+
+        parts = []
+
+        for line in self._reader:
+            message = json.loads(line)
+
+            if "output" not in message:
+                if output is None:
+                    message["output"] = "".join(parts)
+                return message
+
+            if output is None:
+                parts.append(message["output"])
+            else:
+                output.write(message["output"])
+                output.flush()
+
+        raise ConnectionError("daemon closed the connection")
+
+    def close(self):
+        self._reader.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv):
+    args = argv[1:]
+    path = SOCKET_PATH
+    engine = 'interp'
+    budget = None
+    state = False
+
+    while args and args[0].startswith('--'):
+        option, _, value = args.pop(0).partition('=')
+
+        if option == '--socket' and value:
+            path = value
+        elif option == '--engine' and value:
+            engine = value
+        elif option == '--budget' and value.isdigit():
+            budget = int(value)
+        elif option == '--state' and not value:
+            state = True
+        else:
+            args = []
+            break
+
+    if len(args) != 1:
+        print(USAGE, file=sys.stderr)
+        return 1
+
+    keys = "" if sys.stdin.isatty() else sys.stdin.read()
+
+    with Client(path) as client:
+        final = client.run(read_program(args[0]), keys, budget, engine,
+                           output=sys.stdout)
+
+    if state:
+        print(json.dumps(final), file=sys.stderr)
+
+    if final["error"] is not None:
+        print(final["error"], file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
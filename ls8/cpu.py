@@ -1,45 +1,175 @@
 """CPU functionality."""
 
+import functools
+import math
+import mmap
+import os
+import queue
 import sys
+import types
+from collections import namedtuple
+
+try:
+    from . import alu
+    from .alu import FL_L, FL_G, FL_E
+    from .image import parse_text, read_image
+    from .sinks import BufferedSink, CallbackSink
+except ImportError:
+    import alu
+    from alu import FL_L, FL_G, FL_E
+    from image import parse_text, read_image
+    from sinks import BufferedSink, CallbackSink
+
+# Opcodes
+HLT = 0b00000001
+RET = 0b00010001
+PUSH = 0b01000101
+POP = 0b01000110
+PRN = 0b01000111
+CALL = 0b01010000
+JMP = 0b01010100
+JEQ = 0b01010101
+JNE = 0b01010110
+JGT = 0b01010111
+JLT = 0b01011000
+JLE = 0b01011001
+JGE = 0b01011010
+INT = 0b01010010
+IRET = 0b00010011
+PRA = 0b01001000
+LD = 0b10000011
+ST = 0b10000100
+LDI = 0b10000010
+ADD = 0b10100000
+SUB = 0b10100001
+MUL = 0b10100010
+DIV = 0b10100011
+MOD = 0b10100100
+CMP = 0b10100111
+AND = 0b10101000
+OR = 0b10101010
+XOR = 0b10101011
+SHL = 0b10101100
+SHR = 0b10101101
+INC = 0b01100101
+DEC = 0b01100110
+NOT = 0b01101001
+
+# Reserved registers
+IM = 5  # interrupt mask
+IS = 6  # interrupt status
+
+# Memory map
+KEY_ADDRESS = 0xF4  # most recent key pressed
+VECTOR_TABLE = 0xF8  # I0 vector; I1-I7 follow
+
+# Branches whose backward edges CPU.run tries to fast-forward
+LOOP_BRANCHES = {JEQ, JNE}
+
+# Instructions analyze_loop() accepts in a loop body
+LOOP_BODY = {LDI, ADD, SUB, INC, DEC, CMP}
+
+# One iteration of a loop that CPU.fast_forward() can skip in closed form,
+# as worked out by analyze_loop(). Values are ('imm', n) for constants,
+# ('reg', r) for registers the loop never writes and ('neg', r) for their
+# negation.
+#   length: instructions per iteration, the branch included
+#   steps: register -> values added to it once per iteration
+#   consts: register -> value it is loaded with every iteration
+#   compare: the CMP operands, each a value or ('step', r, values added to
+#       r earlier in the iteration)
+#   equal: True if the branch is JEQ, taken while the operands are equal
+LoopShape = namedtuple('LoopShape', [
+    'length', 'steps', 'consts', 'compare', 'equal'])
+
+# Loops whose shapes loop_shape() keeps, least recently used dropped first
+LOOP_CACHE_SIZE = 1024
+
+# Machine state captured by CPU.snapshot(). Every field is immutable, so one
+# snapshot can be restored any number of times.
+Snapshot = namedtuple('Snapshot', [
+    'ram', 'reg', 'fl', 'pc', 'sp', 'ir', 'running', 'instructions',
+    'interrupts_enabled', 'pending'])
+
+# The state of a machine just switched on, restored by CPU.reset()
+POWER_ON = Snapshot(
+    ram=bytes(256), reg=(0,) * 7 + (0xF4,), fl=0, pc=0, sp=0xF4, ir=0,
+    running=True, instructions=0, interrupts_enabled=True, pending=False)
+
+# What CPU.run_iter() yields when asked for events. value is the text for
+# OUTPUT, the interrupt number for INTERRUPT and the instruction count so
+# far for HALT and BUDGET.
+Event = namedtuple('Event', ['kind', 'value'])
+
+OUTPUT = 'output'
+INTERRUPT = 'interrupt'
+HALT = 'halt'
+BUDGET = 'budget'  # max_instructions reached before HLT
+
+
+@types.coroutine
+def yield_to_loop():
+    """Suspend once so the event loop can run other tasks, as
+    asyncio.sleep(0) does, without importing asyncio."""
+    yield
 
 
 class CPU:
     """Main CPU class."""
 
-    def __init__(self):
-        """Construct a new CPU."""
-        self.RAM = [0] * 256
+    # 256 entry decode table, built once below the class. Each entry is
+    # (handler, operand count, sets PC) or None for unknown opcodes.
+    DECODE = None
+
+    # No per-instance __dict__; subclasses that add state get one back
+    __slots__ = ('RAM', 'PC', 'REG', 'FL', 'IR', '_running', 'instructions',
+                 'profiler', 'tracer', 'SP', 'output', 'interrupts_enabled',
+                 '_events', '_pending', 'on_interrupt', 'skip_loops',
+                 '_no_loop', '_no_loop_at')
+
+    def __init__(self, output=None):
+        """Construct a new CPU. output is the sink PRN and PRA write to;
+        a BufferedSink on stdout by default."""
+        self.RAM = bytearray(256)
         self.PC = 0
         self.REG = [0] * 8
-        self.FL = [0] * 8
+        # packed flags: 00000LGE
+        self.FL = 0
         self.IR = 0
         self._running = True
+        # instructions executed so far, across every call to run()
+        self.instructions = 0
+        # a profiler.Profiler, if this CPU is being profiled
+        self.profiler = None
+        # a tracebuf.Tracer, if this CPU is being traced
+        self.tracer = None
         self.SP = 0xf4
+        self.output = output if output is not None else BufferedSink()
+
+        self.interrupts_enabled = True
+        # (interrupt number, key or None) posted by external sources
+        self._events = queue.SimpleQueue()
+        # set when an interrupt may need servicing, and by HLT; the only
+        # thing the run loop looks at before each fetch
+        self._pending = False
+        # called with the number of each interrupt as it is dispatched
+        self.on_interrupt = None
+        # set to False to execute every iteration of loops fast_forward()
+        # could skip, e.g. to time the instructions themselves
+        self.skip_loops = True
+        # branch -> head of the backward branches fast_forward() has found
+        # it cannot skip, and 1 for every address inside those loops
+        self._no_loop = {}
+        self._no_loop_at = bytearray(256)
 
         self.REG[7] = 0xF4
 
-        self.operations = {
-            162: lambda x: self.alu(x),
-            160: lambda x: self.alu(x),
-            1: lambda x: self.hlt(),
-            130: lambda x: self.ldi(),
-            71: lambda x: self.prn(),
-            70: lambda x: self.pop(),
-            69: lambda x: self.push(),
-            80: lambda x: self.call(),
-            17: lambda x: self.ret(),
-            167: lambda x: self.alu(x),  # CMP
-            84: lambda x: self.jmp(),
-            85: lambda x: self.jeq(),
-            86: lambda x: self.jne(),
-        }
-
     def push(self):
         """take value from register and add  to the stack"""
         # decrement SP
         self.SP -= 1
         # get value in register
-        reg_num = int(self.ram_read(self.PC + 1), 2)
+        reg_num = self.ram_read(self.PC + 1)
         val = self.REG[reg_num]
         # store value in stack
         self.ram_write(self.SP, val)
@@ -48,62 +178,234 @@ class CPU:
         """ remove an item from the stack and add to register"""
 
         # get register number from ram
-        reg_num = int(self.ram_read(self.PC + 1), 2)
+        reg_num = self.ram_read(self.PC + 1)
         # get value from stack
         val = self.ram_read(self.SP)
         # store value in register
-        self.REG[reg_num] = val
+        self.reg_write(reg_num, val)
         # increment SP
         self.SP += 1
 
+    def reg_write(self, reg_num, val):
+        """
+        Store val in a register, so that a write to IM or IS makes the run
+        loop check for an interrupt before the next fetch. The ALU and LDI
+        handlers, which run far more often, do the same inline.
+        """
+        self.REG[reg_num] = val
+
+        if 4 < reg_num < 7:  # IM or IS
+            self._pending = True
+
     def ram_read(self, mar):
         """Read and return the value at the specified address in memory"""
-        return self.RAM[mar]
+        return self.RAM[mar & 0xFF]
 
     def ram_write(self, mar, mdr):
         """writes data to ram at the specified address"""
-        self.RAM[mar] = mdr
+        mar &= 0xFF
+        self.RAM[mar] = mdr & 0xFF
+
+        if self._no_loop_at[mar]:
+            self.forget_loops()
+
+    def ram_read_str(self, mar):
+        """Read the value at the specified address as an 8 character binary
+        string, the way cells were stored before RAM held real bytes"""
+        return "{:08b}".format(self.ram_read(mar))
 
     def load(self, file):
-        """Load a program into memory."""
-
-        address = 0
-        program_file = open(file, 'r')
-        for line in program_file:
-            line = line.strip()
-            # remove comments
-            # skip empty lines and lines with only a comment
-            if line == '' or line[0] == '#':
-                continue
-            # remove whitespace
-            line = line[0:8]
-            # add to memory at address
-            self.ram_write(address, line)
-            # increment address
-            address += 1
-
-        program_file.close()
+        """Load a program into memory, from a .ls8 text file or a .ls8b
+        binary image"""
+
+        if file.endswith('.ls8b'):
+            with open(file, 'rb') as f:
+                # mmap refuses an empty file
+                if os.fstat(f.fileno()).st_size == 0:
+                    raise ValueError("not an LS-8 image")
+
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    entry, program = read_image(m)
+                    try:
+                        self.load_bytes(program, entry)
+                    finally:
+                        program.release()
+        else:
+            with open(file, 'r') as program_file:
+                self.load_bytes(parse_text(program_file))
+
+    def load_bytes(self, program, entry=0):
+        """Copy program bytes into memory from address 0 and set the PC to
+        the entry point"""
+        self.RAM[:len(program)] = program
+        self.PC = entry
+        self.forget_loops()
+
+    def snapshot(self):
+        """Capture the machine state as a Snapshot."""
+        return Snapshot(
+            ram=bytes(self.RAM),
+            reg=tuple(self.REG),
+            fl=self.FL,
+            pc=self.PC,
+            sp=self.SP,
+            ir=self.IR,
+            running=self._running,
+            instructions=self.instructions,
+            interrupts_enabled=self.interrupts_enabled,
+            pending=self._pending,
+        )
+
+    def restore(self, snapshot):
+        """
+        Put the machine back in the state captured by snapshot(). RAM and
+        registers are overwritten in place. Events posted but not yet taken
+        in belong to the abandoned run and are dropped.
+        """
+        self.RAM[:] = snapshot.ram
+        self.REG[:] = snapshot.reg
+        self.FL = snapshot.fl
+        self.PC = snapshot.pc
+        self.SP = snapshot.sp
+        self.IR = snapshot.ir
+        self._running = snapshot.running
+        self.instructions = snapshot.instructions
+        self.interrupts_enabled = snapshot.interrupts_enabled
+        self._events = queue.SimpleQueue()
+        self._pending = snapshot.pending
+        self.forget_loops()
+
+    def reset(self):
+        """
+        Return to the power on state, clearing RAM, so the CPU can be
+        reused for another program without constructing a new one.
+        """
+        self.restore(POWER_ON)
 
     def alu(self, ir):
         """ALU operations."""
-        ir = int(ir, 2)
-
-        op_a = int(self.ram_read(self.PC + 1), 2)
-        op_b = int(self.ram_read(self.PC + 2), 2)
+        entry = self.DECODE[ir]
 
-        if ir == 160:  # ADD
-            self.REG[op_a] += self.REG[op_b]
-        elif ir == 162:  # MUL
-            self.REG[op_a] *= self.REG[op_b]
-
-        elif ir == 167:  # CMP
-            if self.REG[op_a] == self.REG[op_b]:
-                self.FL[7] = 1
-            else:
-                self.FL[7] = 0
-        else:
+        if entry is None or not ir & 0b00100000:
             raise Exception("Unsupported ALU operation")
 
+        entry[0](self)
+
+    # ALU operations. Each is one lookup in a table from alu.py, indexed by
+    # the operand values, so registers always hold bytes.
+
+    def add(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        REG[op_a] = alu.ADD[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def sub(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        REG[op_a] = alu.SUB[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def mul(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        REG[op_a] = alu.MUL[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def div(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        if REG[op_b] == 0:
+            raise Exception(f"Division by zero at {self.PC}")
+        REG[op_a] = alu.DIV[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def mod(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        if REG[op_b] == 0:
+            raise Exception(f"Division by zero at {self.PC}")
+        REG[op_a] = alu.MOD[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def and_(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        REG[op_a] = alu.AND[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def or_(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        REG[op_a] = alu.OR[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def xor(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        REG[op_a] = alu.XOR[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def shl(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        REG[op_a] = alu.SHL[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def shr(self):
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        REG[op_a] = alu.SHR[REG[op_a] << 8 | REG[op_b]]
+        if 4 < op_a < 7:  # IM or IS
+            self._pending = True
+
+    def inc(self):
+        REG = self.REG
+        reg_num = self.RAM[(self.PC + 1) & 0xFF]
+        REG[reg_num] = alu.INC[REG[reg_num]]
+        if 4 < reg_num < 7:  # IM or IS
+            self._pending = True
+
+    def dec(self):
+        REG = self.REG
+        reg_num = self.RAM[(self.PC + 1) & 0xFF]
+        REG[reg_num] = alu.DEC[REG[reg_num]]
+        if 4 < reg_num < 7:  # IM or IS
+            self._pending = True
+
+    def not_(self):
+        REG = self.REG
+        reg_num = self.RAM[(self.PC + 1) & 0xFF]
+        REG[reg_num] = alu.NOT[REG[reg_num]]
+        if 4 < reg_num < 7:  # IM or IS
+            self._pending = True
+
+    def cmp(self):
+        """set the L, G and E flags from comparing registers a and b"""
+        ram, REG = self.RAM, self.REG
+        op_a = ram[(self.PC + 1) & 0xFF]
+        op_b = ram[(self.PC + 2) & 0xFF]
+        self.FL = alu.CMP[REG[op_a] << 8 | REG[op_b]]
+
     def trace(self):
         """
         Handy function to print out the CPU state. You might want to call this
@@ -126,38 +428,76 @@ class CPU:
 
     def jmp(self):
         """set PC to address at given register"""
-        reg_num = int(self.ram_read(self.PC + 1), 2)
+        reg_num = self.ram_read(self.PC + 1)
         self.PC = self.REG[reg_num]
 
-    def jeq(self):
-        """if FL[7] is True set PC to value at given register"""
-        if self.FL[7] == 1:
-            reg_num = int(self.ram_read(self.PC + 1), 2)
+    def jump_if(self, condition):
+        """set PC to value at given register if condition, else skip on"""
+        if condition:
+            reg_num = self.ram_read(self.PC + 1)
             self.PC = self.REG[reg_num]
         else:
             self.PC += 2
 
-    def jne(self):
-        """ if FL[7] is False set PC to value at given register"""
-        if self.FL[7] == 0:
-            reg_num = int(self.ram_read(self.PC + 1), 2)
-            self.PC = self.REG[reg_num]
+    # JEQ and JNE close most loops, so they skip the call to jump_if()
+
+    def jeq(self):
+        if self.FL & FL_E:
+            self.PC = self.REG[self.RAM[(self.PC + 1) & 0xFF]]
         else:
             self.PC += 2
 
+    def jne(self):
+        if self.FL & FL_E:
+            self.PC += 2
+        else:
+            self.PC = self.REG[self.RAM[(self.PC + 1) & 0xFF]]
+
+    def jgt(self):
+        self.jump_if(self.FL & FL_G)
+
+    def jlt(self):
+        self.jump_if(self.FL & FL_L)
+
+    def jge(self):
+        self.jump_if(self.FL & (FL_G | FL_E))
+
+    def jle(self):
+        self.jump_if(self.FL & (FL_L | FL_E))
+
     def ldi(self):
-        reg_num = int(self.ram_read(self.PC + 1), 2)
-        val = int(self.ram_read(self.PC + 2), 2)
+        ram = self.RAM
+        reg_num = ram[(self.PC + 1) & 0xFF]
         # set  register to value
-        self.REG[reg_num] = val
+        self.REG[reg_num] = ram[(self.PC + 2) & 0xFF]
+        if 4 < reg_num < 7:  # IM or IS
+            self._pending = True
+
+    def ld(self):
+        """load register a with the value at the address in register b"""
+        reg_a = self.ram_read(self.PC + 1)
+        reg_b = self.ram_read(self.PC + 2)
+        self.reg_write(reg_a, self.ram_read(self.REG[reg_b]))
+
+    def st(self):
+        """store the value in register b at the address in register a"""
+        reg_a = self.ram_read(self.PC + 1)
+        reg_b = self.ram_read(self.PC + 2)
+        self.ram_write(self.REG[reg_a], self.REG[reg_b])
 
     def hlt(self):
         self._running = False
+        # so that the run loop notices
+        self._pending = True
 
     def prn(self):
-        loc = int(self.ram_read(self.PC + 1), 2)
+        loc = self.ram_read(self.PC + 1)
         val = self.REG[loc]
-        print(val)
+        self.output.write(f"{val}\n")
+
+    def pra(self):
+        loc = self.ram_read(self.PC + 1)
+        self.output.write(chr(self.REG[loc]))
 
     def call(self):
         """ can call saved functions"""
@@ -165,7 +505,7 @@ class CPU:
         self.SP -= 1
         self.ram_write(self.SP, self.PC + 2)
         # set PC to given reg#
-        reg_num = int(self.ram_read(self.PC + 1), 2)
+        reg_num = self.ram_read(self.PC + 1)
         self.PC = self.REG[reg_num]
 
     def ret(self):
@@ -173,27 +513,452 @@ class CPU:
         self.PC = self.ram_read(self.SP)
         self.SP += 1
 
+    def int(self):
+        """set the IS bit numbered in the given register"""
+        reg_num = self.ram_read(self.PC + 1)
+        self.REG[IS] |= 1 << (self.REG[reg_num] & 0b111)
+        self._pending = True
+        self.PC += 2
+
+    def iret(self):
+        """return from an interrupt handler"""
+        for reg_num in range(6, -1, -1):
+            self.REG[reg_num] = self.ram_read(self.SP)
+            self.SP += 1
+
+        self.FL = self.ram_read(self.SP)
+        self.SP += 1
+        self.PC = self.ram_read(self.SP)
+        self.SP += 1
+
+        self.interrupts_enabled = True
+        self._pending = True
+
+    def post_interrupt(self, number, key=None):
+        """
+        Raise interrupt number from an external source. If key is given it
+        is stored at KEY_ADDRESS when the interrupt is taken in. Safe to
+        call from any thread; the CPU picks the event up before its next
+        instruction fetch.
+        """
+        self._events.put((number, key))
+        self._pending = True
+
+    def check_interrupts(self):
+        """
+        Take in posted events, then dispatch the lowest numbered interrupt
+        that is both set in IS and enabled in IM.
+        """
+        # clear first so an event posted while draining is not lost
+        self._pending = False
+
+        while True:
+            try:
+                number, key = self._events.get_nowait()
+            except queue.Empty:
+                break
+
+            if key is not None:
+                self.ram_write(KEY_ADDRESS, key)
+            self.REG[IS] |= 1 << number
+
+        if not self.interrupts_enabled:
+            return
+
+        masked = self.REG[IM] & self.REG[IS]
+
+        if not masked:
+            return
+
+        number = (masked & -masked).bit_length() - 1
+
+        if self.on_interrupt is not None:
+            self.on_interrupt(number)
+
+        self.interrupts_enabled = False
+        self.REG[IS] &= ~(1 << number)
+
+        self.SP -= 1
+        self.ram_write(self.SP, self.PC)
+        self.SP -= 1
+        self.ram_write(self.SP, self.FL)
+        for reg_num in range(7):
+            self.SP -= 1
+            self.ram_write(self.SP, self.REG[reg_num])
+
+        self.PC = self.ram_read(VECTOR_TABLE + number)
+
     def advance_pc(self, ir):
         """ reads instruction register and determines how far to advance the PC
             uses fourth bit of op code to determine whether or not to advance the PC
          use first two bits of op code to determine how far
         to advance the PC"""
-        if ir[3] == '0':
-            op_bits = ir[:2]
-            op_bits = int(op_bits, 2)
+        if not ir & 0b00010000:
+            op_bits = ir >> 6
             self.PC += op_bits + 1
 
-    def run(self):
-        """Run the CPU."""
-        while self._running:
-            # read memory address in pc
-            # store result in IC(instruction register)
-            IR = self.ram_read(self.PC)
-            # convert to decimal
-            op_code = int(IR, 2)
+    def run(self, max_instructions=None):
+        """
+        Run the CPU until it halts, or until max_instructions have been
+        executed if a budget is given. Returns the number of instructions
+        executed by this call.
+        """
+        try:
+            if self.profiler is not None:
+                return self.profiler.run(self, max_instructions)
+            if self.tracer is not None:
+                return self.tracer.run(self, max_instructions)
+            return self._run(max_instructions)
+        finally:
+            # output is buffered while running; hand it over on the way out
+            self.output.flush()
+
+    def step(self, n=1):
+        """
+        Execute up to n instructions and return how many ran, fewer only if
+        the CPU halted. The next call resumes where this one stopped.
+        """
+        return self.run(n)
 
-            # read the opcode and execute
-            self.operations[op_code](IR)
+    def run_iter(self, max_instructions=None, events=False, chunk=1000):
+        """
+        Run like run(), as a generator. Yields each piece of output text
+        as the program prints it, or with events=True an Event for every
+        output, every interrupt dispatched and finally HALT or BUDGET.
+        Output goes only to the generator while it runs. The CPU runs
+        chunk instructions at a time between yields.
+        """
+        for batch in self._slices(max_instructions, events, chunk):
+            yield from batch
 
-            # advance PC
-            self.advance_pc(IR)
+    async def run_async(self, max_instructions=None, events=False,
+                        chunk=1000):
+        """
+        run_iter() as an async generator that hands control back to the
+        event loop after every chunk instructions, so that many CPUs can
+        share one loop without stalling other coroutines.
+        """
+        for batch in self._slices(max_instructions, events, chunk):
+            for item in batch:
+                yield item
+            await yield_to_loop()
+
+    def _slices(self, max_instructions, events, chunk):
+        """Run chunk instructions at a time, yielding what each chunk
+        produced as a list, empty if nothing."""
+        batch = []
+        saved = self.output, self.on_interrupt
+
+        if events:
+            self.output = CallbackSink(
+                lambda text: batch.append(Event(OUTPUT, text)))
+            self.on_interrupt = \
+                lambda number: batch.append(Event(INTERRUPT, number))
+        else:
+            self.output = CallbackSink(lambda text: batch.append(text))
+
+        count = 0
+
+        try:
+            while self._running and count != max_instructions:
+                n = chunk
+                if max_instructions is not None:
+                    n = min(n, max_instructions - count)
+                count += self.run(n)
+
+                yield batch
+                batch = []
+
+            if events:
+                yield [Event(BUDGET if self._running else HALT,
+                             self.instructions)]
+        finally:
+            self.output, self.on_interrupt = saved
+
+    def _run(self, max_instructions):
+        """The run loop itself. See run()."""
+        decode = self.DECODE
+        ram = self.RAM
+        no_loop = self._no_loop
+        skip_loops = self.skip_loops
+        count = 0
+
+        if not self._running:
+            return 0
+
+        try:
+            while count != max_instructions:
+                if self._pending:
+                    if not self._running:
+                        break
+                    self.check_interrupts()
+
+                # read memory address in pc
+                # store result in IR(instruction register)
+                pc = self.PC
+                IR = ram[pc]
+                entry = decode[IR]
+
+                if entry is None:
+                    raise Exception(f"Unknown instruction {IR:08b} at {pc}")
+
+                handler, operands, sets_pc = entry
+
+                # execute
+                handler(self)
+                count += 1
+
+                # advance PC
+                if not sets_pc:
+                    self.PC = pc + operands + 1
+                elif (IR in LOOP_BRANCHES and skip_loops and self.PC < pc
+                        and not self._pending and no_loop.get(pc) != self.PC):
+                    count += self.fast_forward(
+                        pc, None if max_instructions is None
+                        else max_instructions - count)
+        finally:
+            self.instructions += count
+
+        return count
+
+    def forget_loops(self):
+        """Drop every loop fast_forward() has given up on, so that it is
+        looked at again."""
+        if self._no_loop:
+            self._no_loop.clear()
+            self._no_loop_at[:] = bytes(256)
+
+    def fast_forward(self, branch, budget=None):
+        """
+        Called after the branch at address branch has jumped back to the
+        PC. If the loop from there to the branch is one analyze_loop()
+        understands, apply the iterations that would take the branch
+        again, at most budget instructions' worth, in one step. The CPU
+        is left at the loop head exactly as stepping would have left it.
+        Returns the number of instructions skipped.
+
+        A loop that cannot be skipped is remembered by its branch, so the
+        run loop stops trying until RAM inside the loop is written.
+        """
+        head = self.PC
+        shape = loop_shape(head, branch, bytes(self.RAM[head:branch + 2]))
+
+        if shape is None:
+            self._no_loop[branch] = head
+            for addr in range(head, min(branch + 2, 256)):
+                self._no_loop_at[addr] = 1
+            return 0
+
+        REG = self.REG
+
+        def value(v):
+            kind, n = v
+            return n if kind == 'imm' else REG[n] if kind == 'reg' else -REG[n]
+
+        deltas = {r: sum(value(v) for v in values) & 0xFF
+                  for r, values in shape.steps.items()}
+
+        def operand(v):
+            """value at the CMP in this iteration, and change per iteration"""
+            if v[0] == 'step':
+                return ((REG[v[1]] + sum(value(p) for p in v[2])) & 0xFF,
+                        deltas[v[1]])
+            return value(v) & 0xFF, 0
+
+        a, da = operand(shape.compare[0])
+        b, db = operand(shape.compare[1])
+        diff, step = (a - b) & 0xFF, (da - db) & 0xFF
+
+        # iterations from now that take the branch; None if all of them do
+        if shape.equal:
+            if diff != 0:
+                taken = 0
+            else:
+                taken = None if step == 0 else 1
+        elif diff == 0:
+            taken = 0
+        else:
+            # the first i with diff + i * step = 0 (mod 256)
+            g = math.gcd(step, 256)
+            if step == 0 or diff % g:
+                taken = None
+            else:
+                taken = (-diff // g * pow(step // g, -1, 256 // g)
+                         % (256 // g))
+
+        if budget is not None:
+            limit = budget // shape.length
+            taken = limit if taken is None else min(taken, limit)
+
+        if not taken:
+            return 0
+
+        for r, delta in deltas.items():
+            REG[r] = (REG[r] + taken * delta) & 0xFF
+        for r, v in shape.consts.items():
+            REG[r] = v
+
+        # flags as the CMP of the last skipped iteration left them
+        last = taken - 1
+        self.FL = alu.CMP[((a + last * da) & 0xFF) << 8
+                          | (b + last * db) & 0xFF]
+
+        return taken * shape.length
+
+
+@functools.lru_cache(maxsize=LOOP_CACHE_SIZE)
+def loop_shape(head, branch, code):
+    """
+    analyze_loop() for the loop from head to branch whose bytes are code,
+    cached by those bytes so that every CPU running the same loop shares
+    one analysis.
+    """
+    ram = bytearray(256)
+    ram[head:head + len(code)] = code
+    return analyze_loop(ram, head, branch)
+
+
+def analyze_loop(ram, head, branch):
+    """
+    Work out the LoopShape of the loop from head to the JEQ/JNE at branch,
+    or return None unless the loop body is straight-line code that only
+    updates registers, in a way that is linear in the iteration count:
+
+    * LDI loads the same constant every iteration
+    * ADD, SUB, INC and DEC add or subtract a constant, or a register the
+      loop never writes, to a counter that is not also loaded with LDI
+    * exactly one CMP, of such registers, decides the branch, which jumps
+      through a register holding the loop head
+
+    IM, IS and SP are never written, so no interrupt can be enabled or
+    raised inside the loop.
+    """
+    body = []
+    addr = head
+
+    while addr < branch:
+        ir = ram[addr]
+        size = (ir >> 6) + 1
+        if ir not in LOOP_BODY or addr + size > branch:
+            return None
+        body.append((ir, ram[addr + 1], ram[addr + 2] if size == 3 else 0))
+        addr += size
+
+    if addr != branch or branch + 1 > 255:
+        return None
+
+    loaded = {a for ir, a, _ in body if ir == LDI}
+    counted = {a for ir, a, _ in body if ir not in (LDI, CMP)}
+
+    if loaded & counted or any(a > 4 for a in loaded | counted):
+        return None
+
+    steps = {}
+    consts = {}
+    compare = None
+
+    def invariant(r):
+        """value of r as read at this point in every iteration"""
+        if r in consts:
+            return 'imm', consts[r]
+        if r < 8 and r not in loaded and r not in counted:
+            return 'reg', r
+        return None
+
+    for ir, a, b in body:
+        if ir == LDI:
+            consts[a] = b
+        elif ir == INC:
+            steps.setdefault(a, []).append(('imm', 1))
+        elif ir == DEC:
+            steps.setdefault(a, []).append(('imm', -1))
+        elif ir in (ADD, SUB):
+            source = invariant(b)
+            if source is None:
+                return None
+            if ir == SUB:
+                kind, n = source
+                source = ('imm', -n) if kind == 'imm' else ('neg', n)
+            steps.setdefault(a, []).append(source)
+        else:
+            if compare is not None:
+                return None
+            operands = []
+            for r in (a, b):
+                if r in counted:
+                    operands.append(('step', r, tuple(steps.get(r, ()))))
+                else:
+                    operands.append(invariant(r))
+            if None in operands:
+                return None
+            compare = tuple(operands)
+
+    target = ram[branch + 1]
+
+    if compare is None or target > 7 or target in counted:
+        return None
+    if target in loaded and consts[target] != head:
+        return None
+
+    return LoopShape(
+        length=len(body) + 1,
+        steps={r: tuple(values) for r, values in steps.items()},
+        consts=consts,
+        compare=compare,
+        equal=ram[branch] == JEQ,
+    )
+
+
+def build_decode_table(handlers):
+    """
+    Build a 256 entry decode table from a mapping of opcode to handler.
+
+    Operand count and the sets-PC flag come from the opcode bits `AABCDDDD`
+    so the run loop never has to look at them again.
+    """
+
+    table = [None] * 256
+
+    for opcode, handler in handlers.items():
+        operands = opcode >> 6
+        sets_pc = bool(opcode & 0b00010000)
+        table[opcode] = (handler, operands, sets_pc)
+
+    return table
+
+
+CPU.DECODE = build_decode_table({
+    HLT: CPU.hlt,
+    RET: CPU.ret,
+    PUSH: CPU.push,
+    POP: CPU.pop,
+    PRN: CPU.prn,
+    CALL: CPU.call,
+    JMP: CPU.jmp,
+    JEQ: CPU.jeq,
+    JNE: CPU.jne,
+    JGT: CPU.jgt,
+    JLT: CPU.jlt,
+    JGE: CPU.jge,
+    JLE: CPU.jle,
+    INT: CPU.int,
+    IRET: CPU.iret,
+    PRA: CPU.pra,
+    LD: CPU.ld,
+    ST: CPU.st,
+    LDI: CPU.ldi,
+    ADD: CPU.add,
+    SUB: CPU.sub,
+    MUL: CPU.mul,
+    DIV: CPU.div,
+    MOD: CPU.mod,
+    AND: CPU.and_,
+    OR: CPU.or_,
+    XOR: CPU.xor,
+    SHL: CPU.shl,
+    SHR: CPU.shr,
+    INC: CPU.inc,
+    DEC: CPU.dec,
+    NOT: CPU.not_,
+    CMP: CPU.cmp,
+})
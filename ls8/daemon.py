@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""
+Long-lived emulator daemon serving runs over a Unix socket.
+
+Usage: daemon.py [--socket=PATH] [--pool=N]
+
+Starting Python, importing the emulator and constructing a CPU costs more
+than most short programs take to run. The daemon pays for that once and
+runs each request on a pooled CPU, reset in between.
+
+Requests and replies are JSON objects, one per line. A request is
+
+    {"image": base64 .ls8b image, "input": text, "budget": N,
+     "engine": "interp"}
+
+where everything but image is optional. The daemon replies with any
+number of {"output": text} messages as the program prints, then one
+final message with the outcome and the machine state:
+
+    {"halted": bool, "instructions": N, "error": text or null,
+     "wall_time": seconds, "pc": N, "sp": N, "fl": N, "reg": [R0..R7]}
+
+Input is fed to the program as keyboard interrupts (I1), one key at a
+time; the next key is posted once the program has taken the last one in.
+A connection can carry any number of requests.
+"""
+
+import base64
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+try:
+    from .client import SOCKET_PATH
+    from .cpu import IS
+    from .engines import ENGINES
+    from .image import read_image
+    from .interrupts import KEYBOARD
+    from .sinks import BufferedSink
+except ImportError:
+    from client import SOCKET_PATH
+    from cpu import IS
+    from engines import ENGINES
+    from image import read_image
+    from interrupts import KEYBOARD
+    from sinks import BufferedSink
+
+# Instructions run between checks for the next input key
+INPUT_SLICE = 1000
+
+# Output characters collected before they are sent as one message
+OUTPUT_CHUNK = 4096
+
+
+class CPUPool:
+    """
+    Idle CPUs by engine. acquire() hands out a reset CPU, constructing one
+    only when none is idle; release() takes it back, keeping at most size
+    per engine.
+    """
+
+    def __init__(self, size=8):
+        self.size = size
+        self._idle = {name: [] for name in ENGINES}
+        self._lock = threading.Lock()
+
+    def acquire(self, engine, output):
+        with self._lock:
+            idle = self._idle[engine]
+            cpu = idle.pop() if idle else None
+
+        if cpu is None:
+            return ENGINES[engine](output)
+
+        cpu.output = output
+        return cpu
+
+    def release(self, engine, cpu):
+        cpu.reset()
+        cpu.output = None
+
+        with self._lock:
+            idle = self._idle[engine]
+            if len(idle) < self.size:
+                idle.append(cpu)
+
+
+class MessageStream:
+    """Sends whatever is written to it as {"output": ...} messages."""
+
+    def __init__(self, send):
+        self.send = send
+
+    def write(self, text):
+        self.send({"output": text})
+
+    def flush(self):
+        pass
+
+
+def run_request(pool, request, send):
+    """
+    Run one request on a pooled CPU, sending output through send as it is
+    flushed, and return the final message.
+    """
+    engine = request.get("engine", "interp")
+    budget = request.get("budget")
+    keys = request.get("input", "")
+
+    if engine not in ENGINES:
+        return {"error": f"unknown engine {engine!r}", "halted": False}
+    if "image" not in request:
+        return {"error": "request has no image", "halted": False}
+
+    output = BufferedSink(MessageStream(send), threshold=OUTPUT_CHUNK)
+    cpu = pool.acquire(engine, output)
+    error = None
+
+    start = time.perf_counter()
+
+    try:
+        entry, program = read_image(base64.b64decode(request["image"]))
+        cpu.load_bytes(program, entry)
+        run_with_input(cpu, keys, budget)
+    except Exception as e:
+        error = str(e)
+    finally:
+        output.flush()
+
+    wall_time = time.perf_counter() - start
+
+    final = {
+        "halted": error is None and not cpu._running,
+        "instructions": cpu.instructions,
+        "error": error,
+        "wall_time": wall_time,
+        "pc": cpu.PC,
+        "sp": cpu.SP & 0xFF,
+        "fl": cpu.FL,
+        "reg": list(cpu.REG),
+    }
+
+    pool.release(engine, cpu)
+
+    return final
+
+
+def run_with_input(cpu, keys, budget):
+    """
+    Run cpu until it halts or budget instructions have run, posting each
+    key of keys as a keyboard interrupt once the one before is taken in.
+    """
+    keys = iter(keys)
+    key = next(keys, None)
+
+    while cpu._running and key is not None:
+        if not cpu.REG[IS] & 1 << KEYBOARD and not cpu._pending:
+            cpu.post_interrupt(KEYBOARD, ord(key) & 0xFF)
+            key = next(keys, None)
+
+        left = None if budget is None else budget - cpu.instructions
+        if left is not None and left <= 0:
+            return
+        cpu.run(INPUT_SLICE if left is None else min(left, INPUT_SLICE))
+
+    left = None if budget is None else budget - cpu.instructions
+    if left is None or left > 0:
+        cpu.run(left)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Serves the requests of one connection, in order."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self.send({"error": f"bad request: {e}", "halted": False})
+                continue
+
+            self.send(run_request(self.server.pool, request, self.send))
+
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server running requests on a shared CPUPool."""
+
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET_PATH, pool_size=8):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, Handler)
+        self.path = path
+        self.pool = CPUPool(pool_size)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def main(argv):
+    path = SOCKET_PATH
+    pool_size = 8
+
+    for arg in argv[1:]:
+        option, _, value = arg.partition('=')
+
+        if option == '--socket' and value:
+            path = value
+        elif option == '--pool' and value.isdigit():
+            pool_size = int(value)
+        else:
+            print("Usage: daemon.py [--socket=PATH] [--pool=N]",
+                  file=sys.stderr)
+            return 1
+
+    with Daemon(path, pool_size) as daemon:
+        print(f"listening on {path}", file=sys.stderr)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,16 @@
+"""Execution engines selectable by name."""
+
+try:
+    from .cpu import CPU
+    from .blocks import BlockCPU
+    from .fusion import FusedCPU
+except ImportError:
+    from cpu import CPU
+    from blocks import BlockCPU
+    from fusion import FusedCPU
+
+ENGINES = {
+    'interp': CPU,
+    'blocks': BlockCPU,
+    'fused': FusedCPU,
+}
@@ -0,0 +1,80 @@
+"""Run a program's setup once, then serve many runs resumed from there."""
+
+import time
+
+try:
+    from .batch import Result
+    from .engines import ENGINES
+    from .sinks import CollectorSink
+except ImportError:
+    from batch import Result
+    from engines import ENGINES
+    from sinks import CollectorSink
+
+
+class ForkServer:
+    """
+    Runs program (a path or program bytes) until the PC reaches marker,
+    snapshots the machine there, and then serves each run() by restoring
+    that snapshot and carrying on, so the setup code before the marker is
+    executed only once.
+
+    Output printed before the marker is kept in prefix_output; each run()
+    returns only what it printed itself. Instruction counts include the
+    setup, as they would for a run from the start.
+    """
+
+    def __init__(self, program, marker, engine='interp',
+                 max_instructions=None):
+        self.program = program if isinstance(program, str) else None
+        self.cpu = ENGINES[engine](CollectorSink())
+
+        if self.program is not None:
+            self.cpu.load(program)
+        else:
+            self.cpu.load_bytes(program)
+
+        cpu = self.cpu
+
+        while cpu.PC != marker:
+            if (max_instructions is not None
+                    and cpu.instructions >= max_instructions):
+                raise Exception(f"marker {marker:02X} not reached within "
+                                f"{max_instructions} instructions")
+            if cpu.step() == 0:
+                raise Exception(f"halted before reaching marker {marker:02X}")
+
+        self.prefix_output = cpu.output.getvalue()
+        self.snapshot = cpu.snapshot()
+
+    def run(self, prepare=None, budget=None):
+        """
+        Resume from the marker and run until halt, or for budget more
+        instructions. prepare, if given, is called with the CPU first to
+        set up this run's inputs in registers or RAM. Returns a
+        batch.Result.
+        """
+        cpu = self.cpu
+        cpu.restore(self.snapshot)
+        cpu.output = output = CollectorSink()
+        error = None
+
+        start = time.perf_counter()
+
+        try:
+            if prepare is not None:
+                prepare(cpu)
+            cpu.run(budget)
+        except Exception as e:
+            error = str(e)
+
+        wall_time = time.perf_counter() - start
+
+        return Result(
+            program=self.program,
+            output=output.getvalue(),
+            halted=error is None and not cpu._running,
+            instructions=cpu.instructions,
+            wall_time=wall_time,
+            error=error,
+        )
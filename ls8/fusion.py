@@ -0,0 +1,362 @@
+"""Superinstruction engine: common instruction sequences run as one."""
+
+try:
+    from . import alu
+    from .alu import FL_E
+    from .cpu import (CPU, IM, IS, PUSH, POP, PRN, CALL, JMP, JEQ, JNE,
+                      LDI, CMP)
+except ImportError:
+    import alu
+    from alu import FL_E
+    from cpu import (CPU, IM, IS, PUSH, POP, PRN, CALL, JMP, JEQ, JNE,
+                     LDI, CMP)
+
+# Every fused sequence, named by its mnemonics, and its length in bytes
+PATTERNS = {
+    'LDI+JMP': 5, 'LDI+CALL': 5, 'LDI+JEQ': 5, 'LDI+JNE': 5, 'LDI+PRN': 5,
+    'CMP+JEQ': 5, 'CMP+JNE': 5, 'CMP+LDI+JEQ': 8, 'CMP+LDI+JNE': 8,
+    'PUSH+CALL': 4, 'PUSH+LDI+CALL': 7, 'PUSH+PUSH': 4, 'POP+POP': 4,
+}
+
+# Opcodes a fused sequence can start with
+HEADS = {LDI, CMP, PUSH, POP}
+
+# Matches shared by every FusedCPU, keyed by RAM contents. Handlers keep no
+# per-CPU state, so many machines running one program share one set.
+_match_cache = {}
+MATCH_CACHE_SIZE = 1024
+
+
+class FusedCPU(CPU):
+    """
+    CPU that recognizes the idioms the assembler produces (LDI of a label
+    followed by a jump or call through it, CMP followed by a branch, PUSH
+    before a CALL...) and runs each as a single handler.
+
+    Sequences are matched for every address at load time. A handler is
+    only used when execution actually reaches its address, so a match at
+    an address that is not an instruction boundary is harmless. Writing
+    RAM covered by a match rematches the whole of RAM. fusion_hits counts
+    how often each pattern ran.
+    """
+
+    def __init__(self, output=None):
+        super().__init__(output)
+        # per address: (pattern, handler, instructions) or None
+        self._fused = [None] * 256
+        # 1 for each address inside a matched sequence
+        self._covered = bytearray(256)
+        self.fusion_hits = dict.fromkeys(PATTERNS, 0)
+
+    def load_bytes(self, program, entry=0):
+        """Copy program bytes into memory and match fusable sequences"""
+        super().load_bytes(program, entry)
+        self.refuse()
+
+    def restore(self, snapshot):
+        changed = self.RAM != snapshot.ram
+        super().restore(snapshot)
+
+        if changed:
+            self.refuse()
+
+    def ram_write(self, mar, mdr):
+        """writes data to ram, rematching if it lands in a sequence"""
+        mar &= 0xFF
+        super().ram_write(mar, mdr)
+
+        if self._covered[mar]:
+            self.refuse()
+
+    def refuse(self):
+        """Match fusable sequences at every address of RAM."""
+        ram = bytes(self.RAM)
+        cached = _match_cache.get(ram)
+
+        if cached is not None:
+            self._fused, self._covered = cached
+            return
+
+        fused = [None] * 256
+        covered = bytearray(256)
+
+        for pc in range(256):
+            if ram[pc] in HEADS:
+                entry = fuse(ram, pc)
+
+                if entry is not None:
+                    fused[pc] = entry
+                    covered[pc:pc + PATTERNS[entry[0]]] = \
+                        b"\x01" * PATTERNS[entry[0]]
+
+        if len(_match_cache) >= MATCH_CACHE_SIZE:
+            _match_cache.clear()
+        _match_cache[ram] = (fused, covered)
+
+        self._fused = fused
+        self._covered = covered
+
+    def fusion_report(self):
+        """Hits per pattern and the share of instructions fused, as text."""
+        total = self.instructions or 1
+        fused = 0
+        lines = ["pattern            hits  instructions      %"]
+
+        for pattern in sorted(PATTERNS, key=lambda p: -self.fusion_hits[p]):
+            hits = self.fusion_hits[pattern]
+            if hits == 0:
+                break
+            covered = hits * (pattern.count('+') + 1)
+            fused += covered
+            lines.append(f"{pattern:14} {hits:8} {covered:13} "
+                         f"{100 * covered / total:6.2f}")
+
+        lines.append(f"fused {fused} of {self.instructions} instructions "
+                     f"({100 * fused / total:.2f}%)")
+
+        return "\n".join(lines) + "\n"
+
+    def run(self, max_instructions=None):
+        """
+        Run the CPU, dispatching a fused handler wherever one matched and
+        the budget allows the whole sequence. A profiled or traced CPU is
+        always interpreted.
+        """
+        if self.profiler is not None or self.tracer is not None:
+            return CPU.run(self, max_instructions)
+
+        decode = self.DECODE
+        ram = self.RAM
+        hits = self.fusion_hits
+        count = 0
+
+        try:
+            while self._running and count != max_instructions:
+                if self._pending:
+                    self.check_interrupts()
+
+                pc = self.PC
+                fused = self._fused[pc]
+
+                if fused is not None:
+                    pattern, handler, length = fused
+
+                    if (max_instructions is None
+                            or count + length <= max_instructions):
+                        ran = handler(self)
+                        count += ran
+                        if ran == length:
+                            hits[pattern] += 1
+                        continue
+
+                IR = ram[pc]
+                entry = decode[IR]
+
+                if entry is None:
+                    raise Exception(f"Unknown instruction {IR:08b} at {pc}")
+
+                handler, operands, sets_pc = entry
+
+                handler(self)
+                count += 1
+
+                if not sets_pc:
+                    self.PC += operands + 1
+        finally:
+            self.instructions += count
+            self.output.flush()
+
+        return count
+
+
+def fuse(ram, pc):
+    """
+    Return (pattern, handler, instructions) for the fusable sequence
+    starting at pc, or None. Each handler runs the sequence on a CPU, sets
+    the PC and returns the number of instructions it executed.
+
+    Registers must be R0-R7, and LDI and POP never target IM or IS, so
+    that a fused sequence never needs an interrupt check in the middle.
+    """
+
+    def byte(offset):
+        return ram[pc + offset] if pc + offset < 256 else None
+
+    def plain(n):
+        return n is not None and n < 8 and n != IM and n != IS
+
+    def reg(n):
+        return n is not None and n < 8
+
+    op = ram[pc]
+
+    if op == LDI:
+        x, imm, nxt, y = byte(1), byte(2), byte(3), byte(4)
+
+        if not plain(x) or y != x:
+            return None
+
+        if nxt == JMP:
+            return 'LDI+JMP', ldi_jmp(x, imm), 2
+        if nxt == CALL:
+            return 'LDI+CALL', ldi_call(pc, x, imm), 2
+        if nxt == JEQ:
+            return 'LDI+JEQ', ldi_branch(pc, x, imm, 1), 2
+        if nxt == JNE:
+            return 'LDI+JNE', ldi_branch(pc, x, imm, 0), 2
+        if nxt == PRN:
+            return 'LDI+PRN', ldi_prn(pc, x, imm), 2
+
+    elif op == CMP:
+        a, b, nxt = byte(1), byte(2), byte(3)
+
+        if not reg(a) or not reg(b):
+            return None
+
+        if nxt in (JEQ, JNE) and reg(byte(4)):
+            want = FL_E if nxt == JEQ else 0
+            return (f"CMP+{'JEQ' if want else 'JNE'}",
+                    cmp_branch(pc, a, b, byte(4), want), 2)
+
+        c, imm, jump, d = byte(4), byte(5), byte(6), byte(7)
+
+        if nxt == LDI and plain(c) and jump in (JEQ, JNE) and d == c:
+            want = FL_E if jump == JEQ else 0
+            return (f"CMP+LDI+{'JEQ' if want else 'JNE'}",
+                    cmp_ldi_branch(pc, a, b, c, imm, want), 3)
+
+    elif op == PUSH:
+        x, nxt, y = byte(1), byte(2), byte(3)
+
+        if not reg(x):
+            return None
+
+        if nxt == CALL and reg(y):
+            return 'PUSH+CALL', push_call(pc, x, y), 2
+        if nxt == PUSH and reg(y):
+            return 'PUSH+PUSH', push_push(pc, x, y), 2
+        if (nxt == LDI and plain(y) and byte(5) == CALL
+                and byte(6) == y):
+            return 'PUSH+LDI+CALL', push_ldi_call(pc, x, y, byte(4)), 3
+
+    elif op == POP:
+        x, nxt, y = byte(1), byte(2), byte(3)
+
+        if plain(x) and nxt == POP and plain(y):
+            return 'POP+POP', pop_pop(pc, x, y), 2
+
+    return None
+
+
+# Handler factories, one per pattern. pc and the operands are fixed when
+# the sequence is matched.
+
+def ldi_jmp(x, imm):
+    def handler(cpu):
+        cpu.REG[x] = imm
+        cpu.PC = imm
+        return 2
+    return handler
+
+
+def ldi_call(pc, x, imm):
+    def handler(cpu):
+        cpu.REG[x] = imm
+        cpu.SP -= 1
+        cpu.ram_write(cpu.SP, pc + 5)
+        cpu.PC = imm
+        return 2
+    return handler
+
+
+def ldi_branch(pc, x, imm, want):
+    def handler(cpu):
+        cpu.REG[x] = imm
+        cpu.PC = imm if (cpu.FL & FL_E) == want else pc + 5
+        return 2
+    return handler
+
+
+def ldi_prn(pc, x, imm):
+    text = f"{imm}\n"
+
+    def handler(cpu):
+        cpu.REG[x] = imm
+        cpu.output.write(text)
+        cpu.PC = pc + 5
+        return 2
+    return handler
+
+
+def cmp_branch(pc, a, b, c, want):
+    def handler(cpu):
+        REG = cpu.REG
+        fl = cpu.FL = alu.CMP[REG[a] << 8 | REG[b]]
+        cpu.PC = REG[c] if (fl & FL_E) == want else pc + 5
+        return 2
+    return handler
+
+
+def cmp_ldi_branch(pc, a, b, c, imm, want):
+    def handler(cpu):
+        REG = cpu.REG
+        fl = cpu.FL = alu.CMP[REG[a] << 8 | REG[b]]
+        REG[c] = imm
+        cpu.PC = imm if (fl & FL_E) == want else pc + 8
+        return 3
+    return handler
+
+
+def push_call(pc, x, y):
+    def handler(cpu):
+        cpu.SP -= 1
+        cpu.ram_write(cpu.SP, cpu.REG[x])
+        if pc + 2 <= cpu.SP & 0xFF < pc + 4:
+            # the push overwrote the CALL; let the interpreter decode it
+            cpu.PC = pc + 2
+            return 1
+        cpu.SP -= 1
+        cpu.ram_write(cpu.SP, pc + 4)
+        cpu.PC = cpu.REG[y]
+        return 2
+    return handler
+
+
+def push_ldi_call(pc, x, y, imm):
+    def handler(cpu):
+        cpu.SP -= 1
+        cpu.ram_write(cpu.SP, cpu.REG[x])
+        if pc + 2 <= cpu.SP & 0xFF < pc + 7:
+            cpu.PC = pc + 2
+            return 1
+        cpu.REG[y] = imm
+        cpu.SP -= 1
+        cpu.ram_write(cpu.SP, pc + 7)
+        cpu.PC = imm
+        return 3
+    return handler
+
+
+def push_push(pc, x, y):
+    def handler(cpu):
+        cpu.SP -= 1
+        cpu.ram_write(cpu.SP, cpu.REG[x])
+        if pc + 2 <= cpu.SP & 0xFF < pc + 4:
+            cpu.PC = pc + 2
+            return 1
+        cpu.SP -= 1
+        cpu.ram_write(cpu.SP, cpu.REG[y])
+        cpu.PC = pc + 4
+        return 2
+    return handler
+
+
+def pop_pop(pc, x, y):
+    def handler(cpu):
+        ram = cpu.RAM
+        cpu.REG[x] = ram[cpu.SP & 0xFF]
+        cpu.REG[y] = ram[(cpu.SP + 1) & 0xFF]
+        cpu.SP += 2
+        cpu.PC = pc + 4
+        return 2
+    return handler
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""
+Program image formats.
+
+A .ls8 program is text, one 8-bit binary number per line, with `#`
+comments. A .ls8b program is a packed binary image: a 12 byte header
+followed by the program bytes.
+
+Header (little endian):
+
+    4 bytes  magic b"LS8B"
+    1 byte   format version
+    1 byte   entry point (initial PC)
+    2 bytes  program length
+    4 bytes  CRC-32 of the program bytes
+"""
+
+import struct
+import sys
+import zlib
+
+MAGIC = b"LS8B"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHI")
+
+# Programs are loaded upward from address 0 into 256 bytes of RAM
+MAX_LENGTH = 256
+
+
+def parse_text(lines):
+    """Parse the lines of a text .ls8 program into a bytearray."""
+    program = bytearray()
+
+    for line in lines:
+        # ignore comments
+        num = line.split('#', 1)[0].strip()
+        # ignore blank lines
+        if num == '':
+            continue
+        program.append(int(num, 2))
+
+    if len(program) > MAX_LENGTH:
+        raise ValueError(f"program is {len(program)} bytes, "
+                         f"more than {MAX_LENGTH}")
+
+    return program
+
+
+def format_text(program):
+    """Format program bytes as the lines of a text .ls8 program."""
+    return "".join(f"{b:08b}\n" for b in program)
+
+
+def pack_image(program, entry=0):
+    """Pack program bytes into a binary .ls8b image."""
+    if len(program) > MAX_LENGTH:
+        raise ValueError(f"program is {len(program)} bytes, "
+                         f"more than {MAX_LENGTH}")
+
+    header = HEADER.pack(MAGIC, VERSION, entry, len(program),
+                         zlib.crc32(program))
+
+    return header + bytes(program)
+
+
+def read_image(buffer):
+    """
+    Check the header of a binary .ls8b image held in buffer (bytes, mmap or
+    anything else supporting the buffer protocol).
+
+    Returns (entry, program) where program is a memoryview into buffer, so
+    nothing is copied. The caller should release() it when done. On a bad
+    image no view is left behind, so an mmap buffer can still be closed.
+    """
+    view = memoryview(buffer)
+
+    try:
+        if len(view) < HEADER.size:
+            raise ValueError("image is too short for its header")
+
+        magic, version, entry, length, checksum = HEADER.unpack_from(view)
+
+        if magic != MAGIC:
+            raise ValueError("not an LS-8 image")
+        if version != VERSION:
+            raise ValueError(f"unsupported .ls8b version {version}")
+
+        program = view[HEADER.size:HEADER.size + length]
+
+        if len(program) != length:
+            error = "image is truncated"
+        elif zlib.crc32(program) != checksum:
+            error = "image checksum does not match"
+        else:
+            return entry, program
+
+        program.release()
+        raise ValueError(error)
+    finally:
+        view.release()
+
+
+def convert(inputfile, outputfile):
+    """Convert between .ls8 text and .ls8b images, by file extension."""
+    if inputfile.endswith('.ls8b'):
+        with open(inputfile, 'rb') as f:
+            entry, program = read_image(f.read())
+        with open(outputfile, 'w') as f:
+            f.write(format_text(program))
+    else:
+        with open(inputfile) as f:
+            program = parse_text(f)
+        with open(outputfile, 'wb') as f:
+            f.write(pack_image(program))
+
+
+def main(argv):
+    if len(argv) != 3:
+        print("usage: image.py infile.ls8 outfile.ls8b\n"
+              "       image.py infile.ls8b outfile.ls8", file=sys.stderr)
+        return 1
+
+    convert(argv[1], argv[2])
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
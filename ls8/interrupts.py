@@ -0,0 +1,109 @@
+"""External interrupt sources: the 1 second timer (I0) and keyboard (I1)."""
+
+import os
+import sys
+import threading
+import time
+
+try:
+    import termios
+    import tty
+except ImportError:
+    termios = None
+
+TIMER = 0
+KEYBOARD = 1
+
+
+class TimerSource:
+    """
+    Raises I0 on a CPU once every interval seconds.
+
+    start() runs it on a background thread. clock is called for the current
+    time, so tests can pass a fake clock and call tick() themselves instead.
+    """
+
+    def __init__(self, cpu, interval=1.0, clock=time.monotonic):
+        self.cpu = cpu
+        self.interval = interval
+        self.clock = clock
+        self.deadline = clock() + interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def tick(self):
+        """
+        Raise I0 if the deadline has passed. Returns the seconds left until
+        the next deadline. Missed deadlines collapse into one interrupt,
+        as they would in the single IS bit anyway.
+        """
+        now = self.clock()
+
+        if now >= self.deadline:
+            self.cpu.post_interrupt(TIMER)
+            missed = (now - self.deadline) // self.interval
+            self.deadline += (missed + 1) * self.interval
+
+        return self.deadline - now
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.tick()):
+            pass
+
+
+class KeyboardSource:
+    """
+    Raises I1 on a CPU for each key read from stream (stdin by default),
+    with the key's value stored at KEY_ADDRESS.
+
+    start() reads on a background thread. A terminal is switched to cbreak
+    mode so keys arrive without waiting for Enter, and restored by stop().
+    """
+
+    def __init__(self, cpu, stream=None):
+        self.cpu = cpu
+        self.stream = stream if stream is not None else sys.stdin
+        self._saved = None
+        self._thread = None
+
+    def feed(self, data):
+        """Raise I1 once per character of data."""
+        for ch in data:
+            self.cpu.post_interrupt(KEYBOARD, ord(ch) & 0xFF)
+
+    def start(self):
+        if termios is not None and self.stream.isatty():
+            fd = self.stream.fileno()
+            self._saved = termios.tcgetattr(fd)
+            tty.setcbreak(fd)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._saved is not None:
+            termios.tcsetattr(self.stream.fileno(), termios.TCSADRAIN,
+                              self._saved)
+            self._saved = None
+
+    def _read(self):
+        if self._saved is not None:
+            # bypass Python's buffering so each key is seen as it is pressed
+            return os.read(self.stream.fileno(), 1).decode("latin-1")
+        return self.stream.read(1)
+
+    def _run(self):
+        while True:
+            ch = self._read()
+            if not ch:
+                break
+            self.feed(ch)
@@ -0,0 +1,233 @@
+"""Lockstep engine running many LS-8 machines at once with NumPy."""
+
+import numpy as np
+
+try:
+    from . import alu
+    from .alu import FL_L, FL_G, FL_E
+    from .cpu import (CPU, HLT, RET, PUSH, POP, PRN, CALL, JMP, JEQ, JNE,
+                      JGT, JLT, JGE, JLE, LDI, ADD, SUB, MUL, DIV, MOD, AND,
+                      OR, XOR, SHL, SHR, INC, DEC, NOT, CMP)
+except ImportError:
+    import alu
+    from alu import FL_L, FL_G, FL_E
+    from cpu import (CPU, HLT, RET, PUSH, POP, PRN, CALL, JMP, JEQ, JNE,
+                     JGT, JLT, JGE, JLE, LDI, ADD, SUB, MUL, DIV, MOD, AND,
+                     OR, XOR, SHL, SHR, INC, DEC, NOT, CMP)
+
+# ALU instructions by the name of their alu.py table
+BINARY = {ADD: 'ADD', SUB: 'SUB', MUL: 'MUL', DIV: 'DIV', MOD: 'MOD',
+          AND: 'AND', OR: 'OR', XOR: 'XOR', SHL: 'SHL', SHR: 'SHR'}
+UNARY = {INC: 'INC', DEC: 'DEC', NOT: 'NOT'}
+
+# Flags each conditional jump is taken on; JNE is taken on E clear
+BRANCHES = {JEQ: FL_E, JGT: FL_G, JLT: FL_L, JGE: FL_G | FL_E,
+            JLE: FL_L | FL_E}
+
+
+class LockstepCPU:
+    """
+    N LS-8 machines stepped together.
+
+    RAM is an (N, 256) uint8 array, registers are (N, 8) and PC, SP, FL and
+    the running flag are (N,) arrays, one row or element per lane. Every
+    step fetches the current opcode of each running lane and executes each
+    distinct opcode once over all the lanes that hold it, so lanes may
+    diverge and still run in the same pass. Opcode semantics follow CPU in
+    cpu.py; operand counts and the sets-PC flag come from CPU.DECODE.
+
+    Per-lane inputs can be set by writing to REG or RAM after load().
+    """
+
+    def __init__(self, n):
+        """Construct n machines in their power on state."""
+        self.n = n
+        self.RAM = np.zeros((n, 256), dtype=np.uint8)
+        self.REG = np.zeros((n, 8), dtype=np.int64)
+        self.PC = np.zeros(n, dtype=np.int64)
+        self.SP = np.full(n, 0xF4, dtype=np.int64)
+        self.FL = np.zeros(n, dtype=np.uint8)
+        self.running = np.ones(n, dtype=bool)
+        self.instructions = np.zeros(n, dtype=np.int64)
+        self.output = [[] for _ in range(n)]
+
+        self.REG[:, 7] = 0xF4
+
+        self.operations = {
+            LDI: self.ldi,
+            CMP: self.cmp,
+            PRN: self.prn,
+            PUSH: self.push,
+            POP: self.pop,
+            CALL: self.call,
+            RET: self.ret,
+            JMP: self.jmp,
+            JNE: self.jne,
+            HLT: self.hlt,
+        }
+
+        for opcode, name in BINARY.items():
+            self.operations[opcode] = self.binary(opcode, name)
+        for opcode, name in UNARY.items():
+            self.operations[opcode] = self.unary(name)
+        for opcode, flags in BRANCHES.items():
+            self.operations[opcode] = self.branch(flags)
+
+    def load(self, file):
+        """Load the same program into the memory of every lane."""
+        cpu = CPU()
+        cpu.load(file)
+        self.RAM[:] = np.frombuffer(bytes(cpu.RAM), dtype=np.uint8)
+
+    def operand(self, lanes, offset):
+        """Return the operand byte at PC + offset for each lane."""
+        return self.RAM[lanes, (self.PC[lanes] + offset) & 0xFF]
+
+    def register(self, lanes, offset):
+        """
+        Return the register number at PC + offset for each lane. A lane
+        naming a register above R7 is an error, as it is on CPU.
+        """
+        reg = self.operand(lanes, offset)
+        bad = reg > 7
+
+        if bad.any():
+            raise Exception(f"No register {reg[bad][0]} in lane "
+                            f"{lanes[bad][0]}")
+
+        return reg
+
+    def ldi(self, lanes):
+        reg = self.register(lanes, 1)
+        self.REG[lanes, reg] = self.operand(lanes, 2)
+
+    def binary(self, opcode, name):
+        """Return the handler for a two-register ALU instruction, looking
+        up every lane's result in the alu.py table at once."""
+        checks_zero = opcode in (DIV, MOD)
+
+        def handler(lanes):
+            table = np.frombuffer(getattr(alu, name), dtype=np.uint8)
+            reg_a = self.register(lanes, 1)
+            reg_b = self.register(lanes, 2)
+            b = self.REG[lanes, reg_b]
+            if checks_zero and not b.all():
+                raise Exception(
+                    f"Division by zero in lane {lanes[b == 0][0]}")
+            self.REG[lanes, reg_a] = table[self.REG[lanes, reg_a] << 8 | b]
+
+        return handler
+
+    def unary(self, name):
+        """Return the handler for a one-register ALU instruction."""
+        def handler(lanes):
+            table = np.frombuffer(getattr(alu, name), dtype=np.uint8)
+            reg = self.register(lanes, 1)
+            self.REG[lanes, reg] = table[self.REG[lanes, reg]]
+
+        return handler
+
+    def cmp(self, lanes):
+        table = np.frombuffer(alu.CMP, dtype=np.uint8)
+        reg_a = self.register(lanes, 1)
+        reg_b = self.register(lanes, 2)
+        self.FL[lanes] = table[self.REG[lanes, reg_a] << 8
+                               | self.REG[lanes, reg_b]]
+
+    def prn(self, lanes):
+        reg = self.register(lanes, 1)
+        for lane, val in zip(lanes.tolist(), self.REG[lanes, reg].tolist()):
+            self.output[lane].append(val)
+
+    def push(self, lanes):
+        reg = self.register(lanes, 1)
+        self.SP[lanes] -= 1
+        self.RAM[lanes, self.SP[lanes] & 0xFF] = self.REG[lanes, reg] & 0xFF
+
+    def pop(self, lanes):
+        reg = self.register(lanes, 1)
+        self.REG[lanes, reg] = self.RAM[lanes, self.SP[lanes] & 0xFF]
+        self.SP[lanes] += 1
+
+    def call(self, lanes):
+        reg = self.register(lanes, 1)
+        self.SP[lanes] -= 1
+        self.RAM[lanes, self.SP[lanes] & 0xFF] = (self.PC[lanes] + 2) & 0xFF
+        self.PC[lanes] = self.REG[lanes, reg]
+
+    def ret(self, lanes):
+        self.PC[lanes] = self.RAM[lanes, self.SP[lanes] & 0xFF]
+        self.SP[lanes] += 1
+
+    def jmp(self, lanes):
+        reg = self.register(lanes, 1)
+        self.PC[lanes] = self.REG[lanes, reg]
+
+    def branch(self, flags):
+        """Return the handler for a jump taken when any of flags is set."""
+        def handler(lanes):
+            reg = self.register(lanes, 1)
+            self.PC[lanes] = np.where(self.FL[lanes] & flags,
+                                      self.REG[lanes, reg],
+                                      self.PC[lanes] + 2)
+
+        return handler
+
+    def jne(self, lanes):
+        reg = self.register(lanes, 1)
+        self.PC[lanes] = np.where(self.FL[lanes] & FL_E, self.PC[lanes] + 2,
+                                  self.REG[lanes, reg])
+
+    def hlt(self, lanes):
+        self.running[lanes] = False
+
+    def step(self):
+        """
+        Execute one instruction on every running lane.
+
+        Returns the number of lanes that executed an instruction.
+        """
+        lanes = np.flatnonzero(self.running)
+
+        if lanes.size == 0:
+            return 0
+
+        ir = self.RAM[lanes, self.PC[lanes] & 0xFF]
+        self.instructions[lanes] += 1
+
+        first = int(ir[0])
+        if (ir == first).all():
+            # lanes that have not diverged need no grouping
+            groups = [(first, lanes)]
+        else:
+            groups = [(opcode, lanes[ir == opcode])
+                      for opcode in np.unique(ir).tolist()]
+
+        for opcode, group in groups:
+            handler = self.operations.get(opcode)
+
+            if handler is None:
+                raise Exception(
+                    f"Unknown instruction {opcode:08b} in lane {group[0]}")
+
+            # handlers read operands relative to the current PC, so the PC
+            # is advanced afterwards
+            handler(group)
+
+            _, operands, sets_pc = CPU.DECODE[opcode]
+            if not sets_pc:
+                self.PC[group] += operands + 1
+
+        return lanes.size
+
+    def run(self, max_steps=None):
+        """Step every lane until all have halted or max_steps is reached."""
+        steps = 0
+
+        while self.running.any():
+            if max_steps is not None and steps >= max_steps:
+                break
+            self.step()
+            steps += 1
+
+        return steps
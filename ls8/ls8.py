@@ -4,13 +4,105 @@
 
 import sys
 from cpu import *
+from engines import ENGINES
+from interrupts import KeyboardSource, TimerSource
+from profiler import Profiler
+from replay import Recorder, read_log, replay
+from sinks import BufferedSink
+from tracebuf import Tracer
 
-if len(sys.argv) < 2:
-    print("Usage: ls8.py examples/file_name")
+USAGE = ("Usage: ls8.py [--engine=interp|blocks|fused] "
+         "[--profile[=stacks.txt]] [--trace=trace.bin] [--fusion-report] "
+         "[--record=events.bin | --replay=events.bin] [--no-fast-forward] "
+         "examples/file_name")
+
+args = sys.argv[1:]
+engine = 'interp'
+profile = None
+trace = None
+fusion_report = False
+record = None
+replay_log = None
+skip_loops = True
+
+while args and args[0].startswith('--'):
+    option, _, value = args.pop(0).partition('=')
+
+    if option == '--engine' and value in ENGINES:
+        engine = value
+    elif option == '--profile':
+        profile = value
+    elif option == '--trace' and value:
+        trace = value
+    elif option == '--fusion-report' and not value:
+        fusion_report = True
+    elif option == '--record' and value and replay_log is None:
+        record = value
+    elif option == '--replay' and value and record is None:
+        replay_log = value
+    elif option == '--no-fast-forward' and not value:
+        skip_loops = False
+    else:
+        print(USAGE)
+        sys.exit(1)
+
+if fusion_report:
+    # only the fused engine has anything to report
+    engine = 'fused'
+
+if len(args) < 1:
+    print(USAGE)
     sys.exit(1)
 
-cpu = CPU()
+# On a terminal, show each character as soon as it is printed; otherwise
+# let output batch up
+output = BufferedSink(threshold=1 if sys.stdout.isatty() else 8192)
+
+cpu = ENGINES[engine](output)
+cpu.skip_loops = skip_loops
+
+if profile is not None:
+    cpu.profiler = Profiler()
 
-program_file = sys.argv[1]
+if trace is not None:
+    cpu.tracer = Tracer(path=trace)
+
+program_file = args[0]
 cpu.load(program_file)
-cpu.run()
+
+if replay_log is not None:
+    # events come from the log alone, at the counts they were recorded at
+    events, end = read_log(replay_log)
+    replay(cpu, events, end)
+else:
+    # with --record, sources post to the recorder, which logs each event
+    # as it hands it to the CPU
+    target = cpu if record is None else Recorder(cpu)
+    sources = [TimerSource(target)]
+    if sys.stdin.isatty():
+        sources.append(KeyboardSource(target))
+
+    for source in sources:
+        source.start()
+
+    try:
+        target.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for source in sources:
+            source.stop()
+        if record is not None:
+            target.dump(record)
+
+if profile is not None:
+    # reports go to stderr so program output stays clean
+    print(cpu.profiler.flat_report(), file=sys.stderr)
+    print(cpu.profiler.call_graph_report(), file=sys.stderr)
+
+    if profile:
+        with open(profile, 'w') as f:
+            f.write(cpu.profiler.collapsed())
+
+if fusion_report:
+    print(cpu.fusion_report(), file=sys.stderr)
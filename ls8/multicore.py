@@ -0,0 +1,260 @@
+"""
+Multi-core LS-8: cores in separate processes sharing one RAM.
+
+Two instructions extend the spec for this mode:
+
+    XCHG registerA registerB    10000101 00000aaa 00000bbb
+
+Atomically exchange the value in register A with the byte at the address
+held in register B. Loading 1 and exchanging it with a lock byte takes the
+lock if the old value comes back as 0.
+
+    IPI registerA registerB     10000110 00000aaa 00000bbb
+
+Raise the interrupt numbered in register B on the core numbered in
+register A, by setting that bit in the target core's IS register. The
+target takes it like any other interrupt, when its IM allows.
+
+Each core starts with its core number in R0, the number of cores in R1
+and a stack of its own, stack_size bytes below that of the core before.
+The stacks all lie between the program and 0xF4.
+"""
+
+import os
+import queue
+from collections import namedtuple
+from multiprocessing import Lock, Process, Queue
+from multiprocessing.shared_memory import SharedMemory
+
+try:
+    from .cpu import CPU, IS, build_decode_table
+    from .sinks import CollectorSink
+except ImportError:
+    from cpu import CPU, IS, build_decode_table
+    from sinks import CollectorSink
+
+# Opcodes of the multi-core extension
+XCHG = 0b10000101
+IPI = 0b10000110
+
+# Instructions a core runs between looks at its mailbox, so the most an
+# inter-core interrupt waits before the target sees it
+POLL = 1000
+
+# Bytes of stack each core gets, unless that many would not fit
+STACK_SIZE = 16
+
+# Per-core outcome of MultiCore.run(). error holds the exception text if
+# the core raised.
+CoreResult = namedtuple('CoreResult', [
+    'core', 'output', 'halted', 'instructions', 'reg', 'pc', 'error'])
+
+
+class Core(CPU):
+    """
+    One core of a multi-core machine. memory is a writable buffer of 256
+    bytes of RAM followed by one mailbox byte per core, shared by all the
+    cores; lock serializes every write to it, so that XCHG is atomic with
+    respect to the other cores' stores as well as their exchanges.
+
+    Interrupts sent by IPI are collected in the target's mailbox and moved
+    into its IS register every poll instructions.
+    """
+
+    __slots__ = ('core', 'cores', 'lock', 'mailbox', 'poll')
+
+    def __init__(self, memory, core, cores, lock, output=None,
+                 stack_size=STACK_SIZE, poll=POLL):
+        if cores * stack_size > 0xF4:
+            raise ValueError(f"{cores} stacks of {stack_size} bytes do not "
+                             f"fit below 0xF4")
+
+        super().__init__(output)
+        view = memoryview(memory)
+        self.RAM = view[:256]
+        self.mailbox = view[256:256 + cores]
+        self.core = core
+        self.cores = cores
+        self.lock = lock
+        self.poll = poll
+
+        self.SP = self.REG[7] = 0xF4 - core * stack_size
+        self.REG[0] = core
+        self.REG[1] = cores
+
+    def release(self):
+        """Let go of the shared memory so that it can be closed."""
+        self.RAM.release()
+        self.mailbox.release()
+
+    def ram_write(self, mar, mdr):
+        """writes data to shared ram, holding the lock"""
+        mar &= 0xFF
+
+        with self.lock:
+            self.RAM[mar] = mdr & 0xFF
+
+        if self._no_loop_at[mar]:
+            self.forget_loops()
+
+    def xchg(self):
+        """atomically exchange register a with the byte at the address in
+        register b"""
+        reg_a = self.ram_read(self.PC + 1)
+        reg_b = self.ram_read(self.PC + 2)
+        address = self.REG[reg_b] & 0xFF
+
+        with self.lock:
+            old = self.RAM[address]
+            self.RAM[address] = self.REG[reg_a] & 0xFF
+
+        self.reg_write(reg_a, old)
+
+    def ipi(self):
+        """raise the interrupt numbered in register b on the core numbered
+        in register a"""
+        reg_a = self.ram_read(self.PC + 1)
+        reg_b = self.ram_read(self.PC + 2)
+        target = self.REG[reg_a]
+
+        if target >= self.cores:
+            raise Exception(f"No core {target} at {self.PC}")
+
+        with self.lock:
+            self.mailbox[target] |= 1 << (self.REG[reg_b] & 0b111)
+
+    def check_mailbox(self):
+        """Move interrupts sent to this core into its IS register."""
+        if self.mailbox[self.core]:
+            with self.lock:
+                self.REG[IS] |= self.mailbox[self.core]
+                self.mailbox[self.core] = 0
+            self._pending = True
+
+    def run(self, max_instructions=None):
+        """Run as CPU.run does, checking the mailbox every poll
+        instructions."""
+        count = 0
+
+        while self._running and count != max_instructions:
+            self.check_mailbox()
+            n = self.poll
+            if max_instructions is not None:
+                n = min(n, max_instructions - count)
+            count += CPU.run(self, n)
+
+        return count
+
+
+Core.DECODE = [cpu or core for cpu, core in zip(
+    CPU.DECODE, build_decode_table({XCHG: Core.xchg, IPI: Core.ipi}))]
+
+
+def run_core(name, core, cores, lock, entry, stack_size, poll,
+             max_instructions, results):
+    """Process entry point: run one core against the shared memory."""
+    shm = SharedMemory(name)
+    cpu = Core(shm.buf, core, cores, lock, CollectorSink(), stack_size,
+               poll)
+    cpu.PC = entry
+    error = None
+
+    try:
+        cpu.run(max_instructions)
+    except Exception as e:
+        error = str(e)
+    finally:
+        results.put(CoreResult(
+            core=core,
+            output=cpu.output.getvalue(),
+            halted=error is None and not cpu._running,
+            instructions=cpu.instructions,
+            reg=list(cpu.REG),
+            pc=cpu.PC,
+            error=error,
+        ))
+        cpu.release()
+        shm.close()
+
+
+class MultiCore:
+    """
+    A program (a path or program bytes) run on cores processes at once,
+    one per host core by default, sharing RAM through
+    multiprocessing.shared_memory.
+
+    Each core gets stack_size bytes of stack. By default that is
+    STACK_SIZE, or less if that many stacks would run into the program.
+    Raises ValueError if the stacks cannot fit between the program and
+    0xF4.
+    """
+
+    def __init__(self, program, cores=None, stack_size=None, poll=POLL):
+        if isinstance(program, str):
+            loader = CPU(CollectorSink())
+            loader.load(program)
+            # the program is taken to end at its last nonzero byte
+            self.program = bytes(loader.RAM).rstrip(b"\0")
+            self.entry = loader.PC
+        else:
+            self.program = bytes(program)
+            self.entry = 0
+
+        self.cores = cores or os.cpu_count()
+        room = 0xF4 - len(self.program)
+
+        if stack_size is None:
+            stack_size = min(STACK_SIZE, max(room, 0) // self.cores)
+        if stack_size < 1 or self.cores * stack_size > room:
+            raise ValueError(
+                f"{self.cores} stacks of {stack_size} bytes do not fit "
+                f"between the {len(self.program)} byte program and 0xF4")
+
+        self.stack_size = stack_size
+        self.poll = poll
+        # RAM as the cores left it after the last run()
+        self.ram = None
+
+    def run(self, max_instructions=None):
+        """
+        Start every core at the entry point and wait until all have halted
+        or run max_instructions each. Returns a CoreResult per core, in
+        core order.
+        """
+        shm = SharedMemory(create=True, size=256 + self.cores)
+
+        try:
+            shm.buf[:len(self.program)] = self.program
+
+            lock = Lock()
+            results = Queue()
+            processes = [
+                Process(target=run_core, args=(
+                    shm.name, core, self.cores, lock, self.entry,
+                    self.stack_size, self.poll, max_instructions, results))
+                for core in range(self.cores)]
+
+            for process in processes:
+                process.start()
+
+            collected = []
+            # a core that dies without reporting must not hang us
+            while len(collected) < self.cores:
+                try:
+                    collected.append(results.get(timeout=1))
+                except queue.Empty:
+                    if not any(p.is_alive() for p in processes):
+                        break
+
+            for process in processes:
+                process.join()
+
+            self.ram = bytes(shm.buf[:256])
+        finally:
+            shm.close()
+            shm.unlink()
+
+        if len(collected) < self.cores:
+            raise Exception("a core exited without reporting its result")
+
+        return sorted(collected)
@@ -0,0 +1,177 @@
+"""Opt-in per-opcode, per-PC and per-subroutine profiler."""
+
+try:
+    from .cpu import CPU, CALL, RET
+except ImportError:
+    from cpu import CPU, CALL, RET
+
+
+def opcode_name(ir):
+    """Return the mnemonic of an opcode, e.g. 0b10000010 -> "LDI"."""
+    entry = CPU.DECODE[ir]
+
+    if entry is None:
+        return f"{ir:08b}"
+
+    return entry[0].__name__.upper().rstrip('_')
+
+
+class Profiler:
+    """
+    Counts executions per opcode and per PC, calls per CALL target and
+    inclusive instructions per subroutine, and the instructions executed
+    under each call stack for flamegraphs.
+
+    Attach one to a CPU with `cpu.profiler = Profiler()`. The CPU then runs
+    the loop in Profiler.run instead of its own, so a CPU without a profiler
+    pays nothing per instruction. symbols (label -> address, as filled in by
+    asm.assemble) names subroutines in the reports.
+    """
+
+    def __init__(self, symbols=None):
+        self.opcodes = [0] * 256
+        self.pcs = [0] * 256
+        self.calls = {}
+        self.inclusive = {}
+        # (caller, callee) -> number of calls
+        self.edges = {}
+        # call stack tuple -> instructions executed with it on top
+        self.stacks = {}
+        self.names = {}
+
+        if symbols is not None:
+            self.names = {addr: label for label, addr in symbols.items()}
+
+        # (subroutine, instruction count at entry) for each active call
+        self._shadow = []
+        self._stack = ()
+        self._count = 0
+
+    def name(self, addr):
+        if addr is None:
+            return "main"
+        return self.names.get(addr, f"sub_{addr:02X}")
+
+    def run(self, cpu, max_instructions=None):
+        """The CPU run loop with profiling. See CPU.run."""
+        decode = cpu.DECODE
+        ram = cpu.RAM
+        opcodes = self.opcodes
+        pcs = self.pcs
+        stacks = self.stacks
+        stack = self._stack
+        total = self._count
+        count = 0
+
+        try:
+            while cpu._running and count != max_instructions:
+                if cpu._pending:
+                    cpu.check_interrupts()
+
+                pc = cpu.PC
+                IR = ram[pc]
+                entry = decode[IR]
+
+                if entry is None:
+                    raise Exception(f"Unknown instruction {IR:08b} at {pc}")
+
+                handler, operands, sets_pc = entry
+
+                handler(cpu)
+                count += 1
+                total += 1
+
+                opcodes[IR] += 1
+                pcs[pc] += 1
+                stacks[stack] = stacks.get(stack, 0) + 1
+
+                if IR == CALL:
+                    stack = self._enter(cpu.PC, total)
+                elif IR == RET:
+                    stack = self._leave(total)
+
+                if not sets_pc:
+                    cpu.PC += operands + 1
+        finally:
+            cpu.instructions += count
+            self._stack = stack
+            self._count = total
+
+        return count
+
+    def _enter(self, target, total):
+        caller = self._shadow[-1][0] if self._shadow else None
+
+        self.calls[target] = self.calls.get(target, 0) + 1
+        self.edges[caller, target] = self.edges.get((caller, target), 0) + 1
+        self._shadow.append((target, total))
+        self._stack = self._stack + (target,)
+
+        return self._stack
+
+    def _leave(self, total):
+        if not self._shadow:
+            return self._stack
+
+        target, entered = self._shadow.pop()
+
+        # Only the outermost activation of a recursive subroutine counts,
+        # so recursion is not counted twice
+        if all(t != target for t, _ in self._shadow):
+            self.inclusive[target] = (self.inclusive.get(target, 0)
+                                      + total - entered)
+
+        self._stack = self._stack[:-1]
+
+        return self._stack
+
+    def flat_report(self, top=10):
+        """Instruction counts per opcode and the hottest PCs, as text."""
+        total = sum(self.opcodes) or 1
+        lines = ["opcode      count      %"]
+
+        for ir in sorted(range(256), key=lambda ir: -self.opcodes[ir]):
+            if self.opcodes[ir] == 0:
+                break
+            lines.append(f"{opcode_name(ir):8} {self.opcodes[ir]:8} "
+                         f"{100 * self.opcodes[ir] / total:6.2f}")
+
+        lines.append("")
+        lines.append("pc          count      %")
+
+        hot = sorted(range(256), key=lambda pc: -self.pcs[pc])[:top]
+        for pc in hot:
+            if self.pcs[pc] == 0:
+                break
+            lines.append(f"{pc:02X}       {self.pcs[pc]:8} "
+                         f"{100 * self.pcs[pc] / total:6.2f}")
+
+        return "\n".join(lines) + "\n"
+
+    def call_graph_report(self):
+        """Calls and inclusive instructions per subroutine, with callers."""
+        lines = ["subroutine        calls  inclusive"]
+
+        by_inclusive = sorted(self.calls,
+                              key=lambda t: -self.inclusive.get(t, 0))
+
+        for target in by_inclusive:
+            lines.append(f"{self.name(target):16} {self.calls[target]:6} "
+                         f"{self.inclusive.get(target, 0):10}")
+
+            for (caller, callee), n in sorted(self.edges.items(),
+                                              key=lambda e: -e[1]):
+                if callee == target:
+                    lines.append(f"    from {self.name(caller):16} {n:6}")
+
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self):
+        """Stacks in the collapsed format read by flamegraph tools."""
+        lines = []
+
+        for stack, n in sorted(self.stacks.items()):
+            frames = ["main"] + [self.name(addr) for addr in stack]
+            lines.append(f"{';'.join(frames)} {n}")
+
+        return "\n".join(lines) + "\n"
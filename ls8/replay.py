@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+"""
+Deterministic record and replay of external events.
+
+Usage: replay.py events.bin
+
+Prints a recorded event log, one event per line.
+
+A Recorder stands between the interrupt sources and a CPU. Sources post
+to the recorder, which passes each event on only between slices of
+quantum instructions, at an exact instruction count, and logs it. Feeding
+the log back with replay() delivers every event at the same count, so the
+run repeats exactly, at full emulator speed and with no timers or stdin.
+Time the program spent idling in a jump to itself, waiting for the next
+event, is skipped outright.
+"""
+
+import queue
+import struct
+import sys
+
+try:
+    from .scheduler import waiting
+except ImportError:
+    from scheduler import waiting
+
+MAGIC = b"LS8R"
+VERSION = 1
+
+HEADER = struct.Struct("<4sB")
+
+# instruction count at delivery, interrupt number (KEY_FLAG set when a key
+# came with it), key
+RECORD = struct.Struct("<QBB")
+KEY_FLAG = 0x80
+
+# Marks where recording stopped; replay stops there too by default
+END = 0xFF
+
+
+class Recorder:
+    """
+    Runs a CPU, delivering events posted with post_interrupt() between
+    slices of quantum instructions and logging each one. Pass the recorder
+    to TimerSource or KeyboardSource in place of the CPU.
+
+    events holds (instructions, number, key) for every event delivered,
+    key being None for interrupts raised without one.
+    """
+
+    def __init__(self, cpu, quantum=1000):
+        self.cpu = cpu
+        self.quantum = quantum
+        self.events = []
+        self._posted = queue.SimpleQueue()
+
+    def post_interrupt(self, number, key=None):
+        """Queue an event for delivery. Safe to call from any thread."""
+        self._posted.put((number, key))
+
+    def deliver(self):
+        """Pass every queued event to the CPU, logging it at the current
+        instruction count."""
+        cpu = self.cpu
+
+        while True:
+            try:
+                number, key = self._posted.get_nowait()
+            except queue.Empty:
+                return
+
+            self.events.append((cpu.instructions, number, key))
+            cpu.post_interrupt(number, key)
+
+    def run(self, max_instructions=None):
+        """Run the CPU as CPU.run does. Returns the number of
+        instructions executed."""
+        cpu = self.cpu
+        count = 0
+
+        while cpu._running and count != max_instructions:
+            self.deliver()
+            n = self.quantum
+            if max_instructions is not None:
+                n = min(n, max_instructions - count)
+            count += cpu.run(n)
+
+        return count
+
+    def dump(self, path):
+        """Write the event log to path, ending at the current count."""
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION))
+            for instructions, number, key in self.events:
+                if key is None:
+                    f.write(RECORD.pack(instructions, number, 0))
+                else:
+                    f.write(RECORD.pack(instructions, number | KEY_FLAG,
+                                        key))
+            f.write(RECORD.pack(self.cpu.instructions, END, 0))
+
+
+def read_log(path):
+    """
+    Read an event log. Returns (events, end) where events are
+    (instructions, number, key) and end is the instruction count at which
+    recording stopped, or None if the log was cut short.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version = HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError("not an LS-8 event log")
+    if version != VERSION:
+        raise ValueError(f"unsupported event log version {version}")
+
+    events = []
+    end = None
+    body = data[HEADER.size:]
+    body = body[:len(body) - len(body) % RECORD.size]
+
+    for instructions, number, key in RECORD.iter_unpack(body):
+        if number == END:
+            end = instructions
+            break
+        if number & KEY_FLAG:
+            events.append((instructions, number & ~KEY_FLAG, key))
+        else:
+            events.append((instructions, number, None))
+
+    return events, end
+
+
+def advance(cpu, target, quantum=1000):
+    """
+    Run cpu until it has executed target instructions in all, or halts.
+    A CPU found idling in a jump to itself only counts instructions from
+    then on, so its count is moved straight to target. With target None,
+    run until it halts or idles with nothing left to wake it.
+    """
+    while cpu._running and cpu.instructions != target:
+        if waiting(cpu):
+            if target is not None:
+                cpu.instructions = target
+            return
+
+        n = quantum
+        if target is not None:
+            n = min(n, target - cpu.instructions)
+        cpu.run(n)
+
+
+def replay(cpu, events, end=None):
+    """
+    Run cpu from its current state, posting each event once it has
+    executed exactly the recorded number of instructions, and stop at end
+    (or when it halts; with end None, once it halts or idles after the
+    last event). Returns the number of instructions executed.
+    """
+    start = cpu.instructions
+
+    for instructions, number, key in events:
+        if instructions > cpu.instructions:
+            advance(cpu, instructions)
+        if cpu.instructions != instructions:
+            raise Exception(f"halted at {cpu.instructions} instructions, "
+                            f"before the event at {instructions}")
+        cpu.post_interrupt(number, key)
+
+    if end is None or end > cpu.instructions:
+        advance(cpu, end)
+
+    return cpu.instructions - start
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("usage: replay.py events.bin", file=sys.stderr)
+        return 1
+
+    events, end = read_log(argv[1])
+
+    for instructions, number, key in events:
+        print(f"{instructions:12} I{number}"
+              + (f" key {key:02X}" if key is not None else ""))
+
+    print(f"{end if end is not None else '?':>12} end")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
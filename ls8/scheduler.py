@@ -0,0 +1,177 @@
+"""Cooperative time-slicing of many CPUs in one thread."""
+
+import heapq
+import itertools
+import time
+
+try:
+    from .cpu import JMP
+except ImportError:
+    from cpu import JMP
+
+# Job states
+READY = 'ready'
+PARKED = 'parked'  # spinning in place until an interrupt arrives
+HALTED = 'halted'
+EXHAUSTED = 'exhausted'  # instruction or wall-clock budget used up
+FAILED = 'failed'
+
+
+def waiting(cpu):
+    """
+    True if cpu is idling on a jump to itself with nothing pending, the
+    way programs wait for a timer or key interrupt. It cannot make progress
+    until something calls post_interrupt().
+    """
+    pc = cpu.PC
+    if cpu._pending or cpu.RAM[pc] != JMP:
+        return False
+
+    # an invalid register is left for the JMP itself to fail on
+    reg_num = cpu.RAM[(pc + 1) & 0xFF]
+    return reg_num < 8 and cpu.REG[reg_num] == pc
+
+
+class Job:
+    """A CPU under a Scheduler, with its priority, budgets and state."""
+
+    def __init__(self, cpu, name, priority, max_instructions, max_seconds):
+        self.cpu = cpu
+        self.name = name
+        self.priority = priority
+        self.max_instructions = max_instructions
+        self.max_seconds = max_seconds
+        self.state = READY
+        # instructions and seconds run under the scheduler, which is what
+        # the budgets are charged with
+        self.instructions = 0
+        self.seconds = 0.0
+        self.error = None
+        self.ticket = None
+        # virtual time; the ready job with the lowest runs next
+        self.vtime = 0.0
+
+    def __repr__(self):
+        return f"<Job {self.name} {self.state}>"
+
+
+class Scheduler:
+    """
+    Runs many CPUs round robin, quantum instructions at a time, using
+    CPU.step() so that no CPU needs its own thread.
+
+    Priority is a weight: over time a job of priority 2 gets twice the
+    instructions of one of priority 1. A job that is idling waiting for an
+    interrupt is parked instead of burning its quanta, and becomes ready
+    again once an interrupt is posted to its CPU.
+    """
+
+    def __init__(self, quantum=1000, clock=time.perf_counter):
+        self.quantum = quantum
+        self.clock = clock
+        self.jobs = []
+        self._ready = []
+        self._parked = []
+        self._order = itertools.count()
+        # vtime of the last job run; new and woken jobs start from here so
+        # they cannot make up for time they were not around
+        self._now = 0.0
+
+    def add(self, cpu, name=None, priority=1, max_instructions=None,
+            max_seconds=None):
+        """Add a loaded CPU and return its Job."""
+        if priority <= 0:
+            raise ValueError("priority must be positive")
+
+        job = Job(cpu, name if name is not None else len(self.jobs),
+                  priority, max_instructions, max_seconds)
+        self.jobs.append(job)
+        self._make_ready(job)
+
+        return job
+
+    def park(self, job):
+        """Take a ready job off the run queue until it is woken."""
+        if job.state == READY:
+            job.state = PARKED
+            self._parked.append(job)
+
+    def wake(self, job):
+        """Put a parked job back on the run queue."""
+        if job.state == PARKED:
+            self._parked.remove(job)
+            self._make_ready(job)
+
+    def _make_ready(self, job):
+        job.state = READY
+        job.vtime = max(job.vtime, self._now)
+        # a job parked by hand leaves its old entry behind; the ticket tells
+        # the two apart
+        job.ticket = next(self._order)
+        heapq.heappush(self._ready, (job.vtime, job.ticket, job))
+
+    def _wake_interrupted(self):
+        for job in [j for j in self._parked if j.cpu._pending]:
+            self.wake(job)
+
+    def run_slice(self):
+        """
+        Run one quantum of the next ready job. Returns the job, or None if
+        no job is ready.
+        """
+        self._wake_interrupted()
+
+        while self._ready:
+            _, ticket, job = heapq.heappop(self._ready)
+            if job.state == READY and job.ticket == ticket:
+                break
+        else:
+            return None
+
+        cpu = job.cpu
+        n = self.quantum
+        if job.max_instructions is not None:
+            n = min(n, job.max_instructions - job.instructions)
+
+        self._now = job.vtime
+        start = self.clock()
+
+        try:
+            ran = cpu.step(n)
+        except Exception as e:
+            job.state = FAILED
+            job.error = str(e)
+            return job
+        finally:
+            job.seconds += self.clock() - start
+
+        job.instructions += ran
+        job.vtime += ran / job.priority
+
+        if not cpu._running:
+            job.state = HALTED
+        elif (job.max_instructions is not None
+                and job.instructions >= job.max_instructions):
+            job.state = EXHAUSTED
+        elif job.max_seconds is not None and job.seconds >= job.max_seconds:
+            job.state = EXHAUSTED
+        elif waiting(cpu):
+            job.state = PARKED
+            self._parked.append(job)
+        else:
+            self._make_ready(job)
+
+        return job
+
+    def run(self):
+        """
+        Run slices until no job is ready: every job has halted, failed,
+        used up its budget or is parked. Returns the number of slices run.
+        Call again after posting interrupts to resume parked jobs.
+        """
+        slices = 0
+
+        while self.run_slice() is not None:
+            slices += 1
+
+        return slices
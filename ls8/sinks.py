@@ -0,0 +1,65 @@
+"""Output sinks for PRN and PRA."""
+
+import sys
+
+
+class BufferedSink:
+    """
+    Collects output and writes it to stream in batches, once threshold
+    characters are waiting or when flushed. The CPU flushes its sink
+    whenever run() returns. stream defaults to whatever sys.stdout is at
+    flush time. threshold=1 writes every piece as it comes, like print().
+    """
+
+    def __init__(self, stream=None, threshold=8192):
+        self.stream = stream
+        self.threshold = threshold
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+
+        if self._size >= self.threshold:
+            self.flush()
+
+    def flush(self):
+        if not self._parts:
+            return
+
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write("".join(self._parts))
+        stream.flush()
+
+        self._parts = []
+        self._size = 0
+
+
+class CollectorSink:
+    """Keeps all output in memory; getvalue() returns it as one string."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return "".join(self._parts)
+
+
+class CallbackSink:
+    """Passes each piece of output to callback."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, text):
+        self.callback(text)
+
+    def flush(self):
+        pass
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+"""
+Binary ring-buffer execution trace.
+
+Usage: tracebuf.py trace.bin
+
+Prints a dumped trace in the TRACE: format of CPU.trace().
+"""
+
+import struct
+import sys
+
+MAGIC = b"LS8T"
+VERSION = 1
+
+# magic, version, record size, capacity, records written in total
+HEADER = struct.Struct("<4sBBIQ")
+
+# PC, IR, the two bytes after IR, FL, R0-R7 as they were before the
+# instruction ran. Register deltas are the differences between consecutive
+# records, worked out offline rather than on every step.
+RECORD = struct.Struct("<BBBBB8B")
+
+
+class Tracer:
+    """
+    Records every instruction into a preallocated ring buffer of packed
+    records, keeping the last `capacity` of them.
+
+    Attach one to a CPU with `cpu.tracer = Tracer(...)`; run() then uses the
+    loop in Tracer.run. If path is given the buffer is dumped there when the
+    CPU halts or the run raises. dump() writes it at any other time.
+    """
+
+    def __init__(self, capacity=65536, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.buffer = bytearray(capacity * RECORD.size)
+        # records written in total; the next goes at count % capacity
+        self.count = 0
+
+    def run(self, cpu, max_instructions=None):
+        """The CPU run loop with tracing. See CPU.run."""
+        decode = cpu.DECODE
+        ram = cpu.RAM
+        reg = cpu.REG
+        buffer = self.buffer
+        pack_into = RECORD.pack_into
+        size = RECORD.size
+        capacity = self.capacity
+        written = self.count
+        count = 0
+
+        try:
+            while cpu._running and count != max_instructions:
+                if cpu._pending:
+                    cpu.check_interrupts()
+
+                pc = cpu.PC
+                IR = ram[pc]
+
+                offset = (written % capacity) * size
+                operands_at = ram[pc + 1:pc + 3]
+
+                try:
+                    pack_into(buffer, offset, pc, IR, *operands_at,
+                              cpu.FL, *reg)
+                except struct.error:
+                    # near the top of RAM, or a register outside 0-255
+                    pack_into(buffer, offset, pc, IR,
+                              ram[(pc + 1) & 0xFF], ram[(pc + 2) & 0xFF],
+                              cpu.FL, *[r & 0xFF for r in reg])
+                written += 1
+
+                entry = decode[IR]
+
+                if entry is None:
+                    raise Exception(f"Unknown instruction {IR:08b} at {pc}")
+
+                handler, operands, sets_pc = entry
+
+                handler(cpu)
+                count += 1
+
+                if not sets_pc:
+                    cpu.PC += operands + 1
+        except BaseException:
+            self.count = written
+            if self.path is not None:
+                self.dump(self.path)
+            raise
+        finally:
+            cpu.instructions += count
+            self.count = written
+
+        if not cpu._running and self.path is not None:
+            self.dump(self.path)
+
+        return count
+
+    def records(self):
+        """Return the buffered records, oldest first, as raw bytes."""
+        size = RECORD.size
+
+        if self.count <= self.capacity:
+            return bytes(self.buffer[:self.count * size])
+
+        split = (self.count % self.capacity) * size
+
+        return bytes(self.buffer[split:] + self.buffer[:split])
+
+    def dump(self, path):
+        """Write the buffered records to path."""
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.capacity,
+                                self.count))
+            f.write(self.records())
+
+
+def read_trace(path):
+    """Yield (pc, ir, a, b, fl, registers) for each record in a dump."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, size, capacity, count = HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError("not an LS-8 trace")
+    if version != VERSION or size != RECORD.size:
+        raise ValueError(f"unsupported trace version {version}")
+
+    for fields in RECORD.iter_unpack(data[HEADER.size:]):
+        yield fields[:5] + (fields[5:],)
+
+
+def format_record(record):
+    """Render a record the way CPU.trace() prints a step."""
+    pc, ir, a, b, fl, registers = record
+
+    return ("TRACE: %02X | %02X %02X %02X |" % (pc, ir, a, b)
+            + "".join(" %02X" % r for r in registers))
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("usage: tracebuf.py trace.bin", file=sys.stderr)
+        return 1
+
+    for record in read_trace(argv[1]):
+        print(format_record(record))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1 +1 @@
-python3 -m unittest tests/test_ls8.py
\ No newline at end of file
+python3 -m unittest tests/test_*.py
\ No newline at end of file
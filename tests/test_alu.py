@@ -0,0 +1,152 @@
+import unittest
+from asm.asm import assemble
+from ls8 import alu
+from ls8.cpu import CPU
+from ls8.engines import ENGINES
+from ls8.sinks import CollectorSink
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if np is not None:
+    from ls8.lockstep import LockstepCPU
+
+# Every ALU operation, wrapping around in both directions, and every
+# conditional jump taken and not taken
+PROGRAM = """\
+        LDI R0,200
+        LDI R1,100
+        ADD R0,R1
+        PRN R0            ; 44
+        SUB R1,R0
+        PRN R1            ; 56
+        LDI R2,3
+        SUB R2,R1
+        PRN R2            ; 203
+        MUL R2,R1
+        PRN R2            ; 104
+        LDI R3,7
+        DIV R2,R3
+        PRN R2            ; 14
+        MOD R1,R3
+        PRN R1            ; 0
+        LDI R0,0b1100
+        LDI R1,0b1010
+        AND R0,R1
+        PRN R0            ; 8
+        OR R0,R1
+        PRN R0            ; 10
+        XOR R0,R1
+        PRN R0            ; 0
+        LDI R0,0x81
+        LDI R1,1
+        SHL R0,R1
+        PRN R0            ; 2
+        SHR R0,R1
+        PRN R0            ; 1
+        DEC R0
+        DEC R0
+        PRN R0            ; 255
+        INC R0
+        PRN R0            ; 0
+        NOT R0
+        PRN R0            ; 255
+        LDI R1,10
+        CMP R0,R1         ; greater
+        LDI R4,GT
+        JGT R4
+        HLT
+GT:     LDI R4,LT
+        JLT R4
+        LDI R4,GE
+        JGE R4
+        HLT
+GE:     LDI R4,EQ
+        JLE R4
+        CMP R1,R1
+        JEQ R4
+        HLT
+EQ:     LDI R4,LE
+        JLE R4
+        HLT
+LE:     LDI R2,99
+        PRN R2            ; 99
+        HLT
+LT:     HLT
+"""
+
+OUTPUT = [44, 56, 203, 104, 14, 0, 8, 10, 0, 2, 1, 255, 0, 255, 99]
+
+REFERENCE = {
+    "ADD": lambda a, b: (a + b) % 256,
+    "SUB": lambda a, b: (a - b) % 256,
+    "MUL": lambda a, b: a * b % 256,
+    "DIV": lambda a, b: a // b if b else 0,
+    "MOD": lambda a, b: a % b if b else 0,
+    "AND": lambda a, b: a & b,
+    "OR": lambda a, b: a | b,
+    "XOR": lambda a, b: a ^ b,
+    "SHL": lambda a, b: (a << b) % 256,
+    "SHR": lambda a, b: a >> b,
+    "CMP": lambda a, b: (alu.FL_L if a < b else
+                         alu.FL_G if a > b else alu.FL_E),
+}
+
+
+class TestCase(unittest.TestCase):
+    def test_tables(self):
+        """should hold op(a, b) at a << 8 | b for every pair of bytes"""
+        for name, op in REFERENCE.items():
+            table = getattr(alu, name)
+            self.assertEqual(len(table), 65536)
+            for a in (0, 1, 2, 7, 8, 100, 128, 200, 254, 255):
+                for b in range(256):
+                    self.assertEqual(table[a << 8 | b], op(a, b),
+                                     (name, a, b))
+
+        self.assertEqual(list(alu.INC), [(a + 1) % 256 for a in range(256)])
+        self.assertEqual(list(alu.DEC), [(a - 1) % 256 for a in range(256)])
+        self.assertEqual(list(alu.NOT), [255 - a for a in range(256)])
+
+    def test_engines(self):
+        """should wrap around and branch the same on every engine"""
+        expected = "".join(f"{n}\n" for n in OUTPUT)
+        program = assemble(PROGRAM)
+
+        for name, engine in ENGINES.items():
+            cpu = engine(CollectorSink())
+            cpu.load_bytes(program)
+            cpu.run()
+            self.assertEqual(cpu.output.getvalue(), expected, name)
+            self.assertEqual(cpu.FL, alu.FL_E, name)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_lockstep(self):
+        """should run the ALU in every lane"""
+        cpus = LockstepCPU(3)
+        cpus.RAM[:] = np.frombuffer(assemble(PROGRAM).ljust(256, b"\0"),
+                                    dtype=np.uint8)
+        cpus.run()
+        self.assertEqual(cpus.output, [OUTPUT] * 3)
+
+    def test_division_by_zero(self):
+        """should stop with an error rather than store a result"""
+        for op in ("DIV", "MOD"):
+            cpu = CPU(CollectorSink())
+            cpu.load_bytes(assemble(f"LDI R0,1\nLDI R1,0\n{op} R0,R1\nHLT\n"))
+            with self.assertRaisesRegex(Exception, "Division by zero at 6"):
+                cpu.run()
+            self.assertEqual(cpu.REG[0], 1)
+
+    def test_printstr(self):
+        """should run the example that needs INC and DEC"""
+        cpu = CPU(CollectorSink())
+        cpu.load('./ls8/examples/printstr.ls8')
+        cpu.run()
+        self.assertEqual(cpu.output.getvalue(), "Hello, world!\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
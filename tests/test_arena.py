@@ -0,0 +1,67 @@
+import unittest
+from ls8.arena import Arena, RECORD_SIZE
+from ls8.blocks import BlockCPU
+from ls8.cpu import CPU, KEY_ADDRESS, POWER_ON
+from ls8.interrupts import KEYBOARD
+from ls8.sinks import CollectorSink
+
+
+def program(path):
+    cpu = CPU(CollectorSink())
+    cpu.load(path)
+    return bytes(cpu.RAM)
+
+
+class TestCase(unittest.TestCase):
+    def test_layout(self):
+        """should hold every machine in one bytearray, at power on"""
+        arena = Arena(1000)
+        self.assertEqual(len(arena.memory), 1000 * RECORD_SIZE)
+        self.assertEqual(arena.snapshot(999), POWER_ON)
+        with self.assertRaises(IndexError):
+            arena.snapshot(1000)
+
+    def test_interleaved(self):
+        """should run machines in slices on shared CPUs as if each had
+        its own"""
+        paths = ['./ls8/examples/sctest.ls8', './ls8/examples/call.ls8',
+                 './ls8/examples/printstr.ls8']
+        arena = Arena(6)
+        for i in range(6):
+            arena.load(i, program(paths[i % 3]))
+
+        workers = [CPU(CollectorSink()), BlockCPU(CollectorSink())]
+        outputs = [[] for _ in range(6)]
+
+        while any(arena.running(i) for i in range(6)):
+            for i in range(6):
+                cpu = workers[i % 2]
+                cpu.output = CollectorSink()
+                arena.run(i, cpu, 7)
+                outputs[i].append(cpu.output.getvalue())
+
+        for i in range(6):
+            cpu = CPU(CollectorSink())
+            cpu.load(paths[i % 3])
+            cpu.run()
+            self.assertEqual("".join(outputs[i]), cpu.output.getvalue())
+            self.assertEqual(arena.snapshot(i), cpu.snapshot())
+
+    def test_post_interrupt(self):
+        """should deliver an interrupt posted while the machine is
+        resident"""
+        arena = Arena(2)
+        arena.load(1, program('./ls8/examples/keyboard.ls8'))
+        cpu = CPU(CollectorSink())
+        arena.run(1, cpu, 100)
+
+        arena.post_interrupt(1, KEYBOARD, ord('k'))
+        arena.run(1, cpu, 100)
+
+        self.assertEqual(cpu.output.getvalue(), "k")
+        self.assertEqual(arena.snapshot(1).ram[KEY_ADDRESS], ord('k'))
+        self.assertEqual(arena.snapshot(0), POWER_ON)
+
+
+if __name__ == '__main__':
+    unittest.main()
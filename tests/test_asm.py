@@ -0,0 +1,165 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from asm.asm import (AsmError, BuildCache, assemble, build, emit, pass1,
+                     peephole, verify)
+from ls8.cpu import CPU
+
+SOURCE = """\
+; print 8 using a subroutine
+    LDI R1,PRINT
+    LDI R0,8
+    CALL R1
+    HLT
+
+PRINT:
+    PRN R0   ; print it
+    RET
+"""
+
+# Something for every peephole rewrite
+OPTIMIZABLE = """\
+        LDI R0,6
+        LDI R1,7
+        MUL R0,R1         ; folds to LDI R0,42
+        PUSH R0           ; PUSH/POP pair
+        POP R0
+        LDI R2,HOP        ; HOP only jumps on, so this goes to PRINT
+        CALL R2
+        LDI R3,1
+        CMP R0,R0
+        LDI R2,SKIP       ; branch over a jump: JEQ becomes JNE OUT
+        JEQ R2
+        LDI R2,OUT
+        JMP R2
+SKIP:   LDI R2,NEXT       ; jumps to the next instruction
+        JMP R2
+NEXT:   LDI R0,2
+        LDI R2,PRINT
+        CALL R2
+OUT:    HLT
+HOP:    LDI R2,PRINT
+        JMP R2
+PRINT:  PRN R0
+        RET
+"""
+
+
+class TestCase(unittest.TestCase):
+    def test_assemble(self):
+        """should return program bytes, the symbol table and source map"""
+        sym = {}
+        source_map = {}
+        program = assemble(SOURCE, sym, source_map)
+
+        self.assertIsInstance(program, bytes)
+        self.assertEqual(program[:3], bytes([0b10000010, 1, 9]))
+        self.assertEqual(sym, {'PRINT': 9})
+        self.assertEqual(source_map[0], 2)
+        self.assertEqual(source_map[9], 8)
+
+    def test_errors(self):
+        """should raise AsmError for bad source"""
+        with self.assertRaises(AsmError):
+            assemble("LDI R0,NOWHERE\n")
+        with self.assertRaises(AsmError):
+            assemble("FOO R0\n")
+        with self.assertRaises(AsmError):
+            assemble("PRN R9\n")
+
+    def test_emit_streams(self):
+        """should hand out code as soon as no label is unresolved"""
+        chunks = list(emit(pass1(SOURCE.splitlines()), {}))
+
+        # held back until PRINT: is defined, then streamed
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0][2], (9, None))
+
+    def test_matches_example(self):
+        """should assemble the same bytes as the checked in example"""
+        with open('./asm/mult.asm') as f:
+            program = assemble(f.read())
+
+        cpu = CPU()
+        cpu.load('./ls8/examples/mult.ls8')
+        self.assertEqual(program, bytes(cpu.RAM[:len(program)]))
+
+    def test_load_bytes(self):
+        """should run assembled bytes loaded straight into the CPU"""
+        cpu = CPU()
+        cpu.load_bytes(assemble(SOURCE))
+
+        captured = io.StringIO()
+        sys.stdout = captured
+        try:
+            cpu.run()
+        finally:
+            sys.stdout = sys.__stdout__
+
+        self.assertEqual(captured.getvalue(), '8\n')
+
+    def test_peephole(self):
+        """should apply every rewrite and keep labels pointing right"""
+        statements = list(pass1(OPTIMIZABLE.splitlines()))
+        stats = {}
+        optimized = peephole(statements, stats)
+        opcodes = [st.opcode for st in optimized if st.opcode is not None]
+
+        self.assertEqual(stats['folded'], 1)
+        self.assertEqual(stats['push_pop'], 1)
+        self.assertEqual(stats['jump_chain'], 1)
+        self.assertEqual(stats['jump_next'], 2)  # SKIP and HOP
+        self.assertEqual(stats['inverted_branch'], 1)
+        self.assertGreater(stats['dead_load'], 0)
+        self.assertNotIn('PUSH', opcodes)
+        self.assertNotIn('MUL', opcodes)
+        self.assertIn('JNE', opcodes)
+        self.assertEqual(stats['instructions_saved'],
+                         len([st for st in statements if st.opcode])
+                         - len(opcodes))
+
+        sym = {}
+        program = assemble(OPTIMIZABLE, sym, optimize=True)
+        for label in ('SKIP', 'NEXT', 'OUT', 'HOP', 'PRINT'):
+            self.assertIn(label, sym)
+        self.assertEqual(program[sym['PRINT']], 0b01000111)  # PRN
+
+    def test_verify(self):
+        """should run optimized and unoptimized code to the same result"""
+        result = verify(OPTIMIZABLE)
+        self.assertTrue(result.matches, result.differences)
+        self.assertLess(result.optimized_instructions, result.instructions)
+
+        for name in ('call', 'mult', 'sctest', 'stack', 'interrupts'):
+            with open(f'./asm/{name}.asm') as f:
+                self.assertTrue(verify(f.read(), 10000).matches, name)
+
+    def test_build_cache(self):
+        """should skip assembly for sources already in the cache"""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = BuildCache(os.path.join(tmp, 'cache'))
+            sources = ['./asm/mult.asm', './asm/call.asm']
+
+            self.assertEqual(build(tmp, sources, cache), 2)
+            self.assertEqual(build(tmp, sources, cache), 0)
+
+            with open(os.path.join(tmp, 'mult.ls8')) as f:
+                self.assertEqual(f.read().splitlines()[0],
+                                 '10000010 # LDI R0,8')
+
+    def test_build_cache_eviction(self):
+        """should evict the least recently used entries past the size cap"""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = BuildCache(tmp, max_bytes=10)
+            cache.put('old', b'123456')
+            os.utime(os.path.join(tmp, 'old'), (0, 0))
+            cache.put('new', b'123456')
+
+            self.assertIsNone(cache.get('old'))
+            self.assertEqual(cache.get('new'), b'123456')
+
+
+if __name__ == '__main__':
+    unittest.main()
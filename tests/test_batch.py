@@ -0,0 +1,37 @@
+import unittest
+from ls8.batch import run_batch, run_program
+
+
+class TestCase(unittest.TestCase):
+    def test_run_program(self):
+        """should capture output, halt state and instruction count"""
+        result = run_program('./ls8/examples/mult.ls8')
+        self.assertEqual(result.output, '72\n')
+        self.assertTrue(result.halted)
+        self.assertEqual(result.instructions, 5)
+        self.assertIsNone(result.error)
+
+    def test_budget(self):
+        """should stop a program when its budget runs out"""
+        result = run_program('./ls8/examples/call.ls8', budget=5)
+        self.assertFalse(result.halted)
+        self.assertEqual(result.instructions, 5)
+
+    def test_run_batch(self):
+        """should run every program matched by a glob, in order"""
+        results = run_batch(['./ls8/examples/s*.ls8'],
+                            budgets={'./ls8/examples/sctest.ls8': 3},
+                            max_workers=2)
+        programs = [r.program for r in results]
+        self.assertEqual(programs, sorted(programs))
+        self.assertIn('./ls8/examples/stack.ls8', programs)
+
+        by_program = {r.program: r for r in results}
+        self.assertEqual(by_program['./ls8/examples/sctest.ls8'].instructions,
+                         3)
+        self.assertEqual(by_program['./ls8/examples/stack.ls8'].output,
+                         '2\n4\n1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import sys
+from io import StringIO
+from ls8.blocks import BlockCPU, generate_block
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.capturedOutput = StringIO()
+        sys.stdout = self.capturedOutput
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+        self.capturedOutput = None
+
+    def run_program(self, program_file):
+        cpu = BlockCPU()
+        cpu.load(program_file)
+        cpu.run()
+        return self.capturedOutput.getvalue().strip()
+
+    def test_examples(self):
+        """should print the same output as the interpreter"""
+        self.assertEqual(self.run_program('./ls8/examples/mult.ls8'), '72')
+        self.capturedOutput.truncate(0)
+        self.capturedOutput.seek(0)
+        self.assertEqual(self.run_program('./ls8/examples/call.ls8'),
+                         '20\n30\n36\n60')
+        self.capturedOutput.truncate(0)
+        self.capturedOutput.seek(0)
+        self.assertEqual(self.run_program('./ls8/examples/stack.ls8'),
+                         '2\n4\n1')
+
+    def test_generate_block_ends_at_jump(self):
+        """should stop the block after the first PC-setting instruction"""
+        cpu = BlockCPU()
+        cpu.load('./ls8/examples/call.ls8')
+
+        source, end, count = generate_block(cpu.RAM, 0)
+        self.assertEqual(end, 8)  # LDI, LDI, CALL
+        self.assertEqual(count, 3)
+        self.assertIn('return r1', source)
+
+    def test_budget(self):
+        """should stop inside a block when the budget runs out"""
+        cpu = BlockCPU()
+        cpu.load('./ls8/examples/call.ls8')
+
+        self.assertEqual(cpu.run(5), 5)
+        self.assertEqual(cpu.instructions, 5)
+        self.assertEqual(cpu.run(), 17)
+        self.assertEqual(cpu.instructions, 22)
+
+    def test_invalidate_on_write(self):
+        """should drop a compiled block when its code is overwritten"""
+        cpu = BlockCPU()
+        cpu.load('./ls8/examples/mult.ls8')
+        cpu.compile_block(0)
+        self.assertIn(0, cpu._blocks)
+
+        cpu.ram_write(4, 0)
+        self.assertNotIn(0, cpu._blocks)
+        self.assertEqual(cpu._covering[4], [])
+
+    def test_bad_register(self):
+        """should fail on a register that does not exist as the
+        interpreter does"""
+        cpu = BlockCPU()
+        # LDI R2,3 / MUL R2,60
+        cpu.load_bytes(bytes([0b10000010, 2, 3, 0b10100010, 2, 60]))
+
+        source, end, count = generate_block(cpu.RAM, 0)
+        self.assertEqual((end, count), (3, 1))
+        with self.assertRaises(IndexError):
+            cpu.run()
+        self.assertEqual((cpu.PC, cpu.REG[2]), (3, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from asm.asm import assemble
+from ls8.client import Client, read_program
+from ls8.cpu import CPU, POWER_ON
+from ls8.daemon import Daemon
+from ls8.image import pack_image
+from ls8.sinks import CollectorSink
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'ls8.sock')
+        self.daemon = Daemon(self.path, pool_size=2)
+        self.thread = threading.Thread(target=self.daemon.serve_forever,
+                                       args=(0.05,))
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.daemon.server_close()
+        self.thread.join()
+        shutil.rmtree(self.dir)
+
+    def test_reset(self):
+        """should put a used CPU back in its power on state"""
+        cpu = CPU(CollectorSink())
+        cpu.load('./ls8/examples/call.ls8')
+        cpu.run()
+        cpu.reset()
+        self.assertEqual(cpu.snapshot(), POWER_ON)
+
+    def test_run(self):
+        """should stream output and report the final state"""
+        with Client(self.path) as client:
+            final = client.run(read_program('./ls8/examples/mult.ls8'))
+
+        self.assertEqual(final["output"], "72\n")
+        self.assertTrue(final["halted"])
+        self.assertIsNone(final["error"])
+        self.assertEqual(final["reg"][0], 72)
+        self.assertEqual(final["instructions"], 5)
+
+    def test_pooled(self):
+        """should reuse reset CPUs across requests and connections"""
+        image = read_program('./ls8/examples/stack.ls8')
+        results = []
+
+        for _ in range(2):
+            with Client(self.path) as client:
+                for engine in ('interp', 'blocks', 'interp'):
+                    results.append(client.run(image, engine=engine))
+
+        self.assertEqual(len({r["output"] for r in results}), 1)
+        self.assertEqual(len({r["instructions"] for r in results}), 1)
+        self.assertEqual(len(self.daemon.pool._idle['interp']), 1)
+        self.assertEqual(len(self.daemon.pool._idle['blocks']), 1)
+
+    def test_input_and_budget(self):
+        """should feed input as key presses and stop at the budget"""
+        with Client(self.path) as client:
+            final = client.run(read_program('./ls8/examples/keyboard.ls8'),
+                               input="hello", budget=5000)
+
+        self.assertEqual(final["output"], "hello")
+        self.assertFalse(final["halted"])
+        self.assertEqual(final["instructions"], 5000)
+
+    def test_errors(self):
+        """should report errors and keep serving"""
+        with Client(self.path) as client:
+            final = client.run(pack_image(assemble("LDI R0,1\nDIV R0,R1\n")))
+            self.assertEqual(final["error"], "Division by zero at 3")
+            self.assertFalse(final["halted"])
+
+            final = client.run(b"junk")
+            self.assertIn("image", final["error"])
+
+            final = client.run(read_program('./ls8/examples/print8.ls8'),
+                               engine='nope')
+            self.assertIn("unknown engine", final["error"])
+
+            final = client.run(read_program('./ls8/examples/print8.ls8'))
+            self.assertEqual(final["output"], "8\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
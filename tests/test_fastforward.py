@@ -0,0 +1,178 @@
+import unittest
+from asm.asm import assemble
+from ls8.cpu import CPU, analyze_loop, loop_shape
+from ls8.sinks import CollectorSink
+
+# Nested counted loops; the inner one can be fast-forwarded
+NESTED = """\
+        LDI R0,0
+        LDI R2,1
+        LDI R3,200
+OUTER:  LDI R1,0
+INNER:  ADD R1,R2
+        ADD R6,R6
+        CMP R1,R3
+        LDI R4,INNER
+        JNE R4
+        ADD R0,R2
+        CMP R0,R3
+        LDI R4,OUTER
+        JNE R4
+        PRN R0
+        PRN R1
+        HLT
+"""
+
+# Counting down by adding 255, which reaches 0 only through wraparound
+COUNTDOWN = """\
+        LDI R0,10
+        LDI R1,255
+        LDI R2,0
+        LDI R3,LOOP
+LOOP:   ADD R0,R1
+        CMP R0,R2
+        JNE R3
+        PRN R0
+        HLT
+"""
+
+# Stepping an odd number by 2 never reaches 0, even with wraparound
+FOREVER = COUNTDOWN.replace('LDI R0,10', 'LDI R0,1').replace('R1,255',
+                                                              'R1,2')
+
+# R0 counts up by 3 and catches up with R1 counting up by 2, with R2
+# reloaded every iteration
+COUNTERS = """\
+        LDI R0,0
+        LDI R1,100
+        LDI R3,3
+LOOP:   LDI R2,2
+        ADD R0,R3
+        CMP R0,R1
+        ADD R1,R2
+        LDI R4,LOOP
+        JNE R4
+        PRN R0
+        PRN R1
+        HLT
+"""
+
+
+def stepped(program, budget):
+    """Run one instruction at a time, which never fast-forwards."""
+    cpu = CPU(CollectorSink())
+    cpu.load_bytes(program)
+    while cpu._running and cpu.instructions < budget:
+        cpu.step()
+    return cpu
+
+
+class TestCase(unittest.TestCase):
+    def assertSameState(self, cpu, reference):
+        self.assertEqual(cpu.instructions, reference.instructions)
+        self.assertEqual(cpu.REG, reference.REG)
+        self.assertEqual(cpu.FL, reference.FL)
+        self.assertEqual(cpu.PC, reference.PC)
+        self.assertEqual(cpu.output.getvalue(), reference.output.getvalue())
+
+    def test_analyze(self):
+        """should recognize the counted loop and reject the outer one"""
+        sym = {}
+        program = assemble(NESTED, sym)
+        ram = bytearray(256)
+        ram[:len(program)] = program
+
+        inner = analyze_loop(ram, sym['INNER'], sym['INNER'] + 12)
+        self.assertIsNone(inner)  # ADD R6,R6 touches IS
+
+        program = assemble(NESTED.replace('ADD R6,R6', 'ADD R0,R5'), sym)
+        ram[:len(program)] = program
+        inner = analyze_loop(ram, sym['INNER'], sym['INNER'] + 12)
+        self.assertEqual(inner.length, 5)
+        self.assertEqual(inner.steps, {1: (('reg', 2),), 0: (('reg', 5),)})
+        self.assertEqual(inner.consts, {4: sym['INNER']})
+        self.assertIsNone(analyze_loop(ram, sym['OUTER'], sym['OUTER'] + 27))
+
+    def test_same_as_stepping(self):
+        """should end in the state stepping would, instruction for
+        instruction"""
+        for source in (NESTED.replace('ADD R6,R6', 'ADD R0,R5'), COUNTERS,
+                       COUNTDOWN):
+            program = assemble(source)
+            cpu = CPU(CollectorSink())
+            cpu.load_bytes(program)
+            cpu.run()
+            self.assertSameState(cpu, stepped(program, cpu.instructions))
+
+    def test_budget(self):
+        """should stop exactly at the budget, even in an endless loop"""
+        for source in (NESTED.replace('ADD R6,R6', 'ADD R0,R5'), FOREVER):
+            program = assemble(source)
+            for budget in (7, 100, 1001, 5000):
+                cpu = CPU(CollectorSink())
+                cpu.load_bytes(program)
+                self.assertEqual(cpu.run(budget), budget)
+                self.assertSameState(cpu, stepped(program, budget))
+
+    def test_skips(self):
+        """should skip every iteration but the last in one step"""
+        sym = {}
+        cpu = CPU(CollectorSink())
+        cpu.load_bytes(assemble(COUNTERS, sym))
+        cpu.run(9)  # three LDIs and the first iteration
+        self.assertEqual(cpu.PC, sym['LOOP'])
+
+        skipped = cpu.fast_forward(sym['LOOP'] + 15)
+        self.assertEqual(skipped, 96 * 6)
+        cpu.instructions += skipped
+
+        cpu.run()
+        self.assertEqual(cpu.output.getvalue(), '38\n40\n')
+        self.assertSameState(cpu, stepped(assemble(COUNTERS), 594))
+
+    def test_gives_up(self):
+        """should stop trying a loop it cannot skip until it is rewritten"""
+        sym = {}
+        program = assemble(NESTED, sym)
+        branch = sym['INNER'] + 12
+        cpu = CPU(CollectorSink())
+        cpu.load_bytes(program)
+        cpu.run(30)
+        self.assertEqual(cpu._no_loop, {branch: sym['INNER']})
+
+        # ADD R6,R6 -> ADD R0,R5, which can be skipped
+        cpu.ram_write(sym['INNER'] + 4, 0)
+        self.assertEqual(cpu._no_loop, {})
+        cpu.ram_write(sym['INNER'] + 5, 5)
+
+        cpu.run()
+        self.assertNotIn(branch, cpu._no_loop)
+        self.assertSameState(cpu, stepped(
+            assemble(NESTED.replace('ADD R6,R6', 'ADD R0,R5')),
+            cpu.instructions))
+
+    def test_opt_out(self):
+        """should execute every iteration with skip_loops off"""
+        program = assemble(COUNTERS)
+        cpu = CPU(CollectorSink())
+        cpu.skip_loops = False
+        cpu.load_bytes(program)
+        cpu.run(100)
+        self.assertEqual(cpu._no_loop, {})
+        self.assertSameState(cpu, stepped(program, 100))
+
+    def test_shared_cache(self):
+        """should analyze a loop once for every CPU that runs it"""
+        loop_shape.cache_clear()
+        for _ in range(3):
+            cpu = CPU(CollectorSink())
+            cpu.load_bytes(assemble(COUNTERS))
+            cpu.run()
+            self.assertEqual(cpu.output.getvalue(), '38\n40\n')
+
+        info = loop_shape.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
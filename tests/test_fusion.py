@@ -0,0 +1,134 @@
+import unittest
+from asm.asm import assemble
+from ls8.cpu import CPU
+from ls8.fusion import FusedCPU, fuse
+from ls8.sinks import CollectorSink
+
+# Counted loop with a subroutine call: CMP+LDI+JNE, PUSH+LDI+CALL,
+# LDI+PRN and POP+POP all fire
+LOOP = """\
+        LDI R0,0
+        LDI R1,1
+        LDI R3,10
+LOOP:   PUSH R0
+        LDI R2,SHOW
+        CALL R2
+        POP R0
+        ADD R0,R1
+        CMP R0,R3
+        LDI R2,LOOP
+        JNE R2
+        LDI R2,99
+        PRN R2
+        HLT
+SHOW:   PUSH R1
+        PUSH R0
+        PRN R0
+        POP R0
+        POP R1
+        RET
+"""
+
+# With SP at 0x09 the PUSH lands on the CALL at 0x08, turning it into HLT
+SELF_MODIFYING = """\
+        LDI R0,1
+        LDI R1,TARGET
+        PUSH R0
+        CALL R1
+        HLT
+TARGET: LDI R3,7
+        PRN R3
+        HLT
+"""
+
+
+def run(cpu_class, program, budget=None):
+    cpu = cpu_class(CollectorSink())
+    cpu.load_bytes(program)
+    cpu.run(budget)
+    return cpu
+
+
+class TestCase(unittest.TestCase):
+    def test_same_as_interpreter(self):
+        """should print the same output and count the same instructions"""
+        for path in ['./ls8/examples/call.ls8', './ls8/examples/stack.ls8',
+                     './ls8/examples/sctest.ls8']:
+            interp = CPU(CollectorSink())
+            interp.load(path)
+            interp.run()
+            fused = FusedCPU(CollectorSink())
+            fused.load(path)
+            fused.run()
+            self.assertEqual(fused.output.getvalue(),
+                             interp.output.getvalue(), path)
+            self.assertEqual(fused.instructions, interp.instructions, path)
+
+    def test_hits(self):
+        """should run the idioms fused and report them"""
+        program = assemble(LOOP)
+        interp = run(CPU, program)
+        fused = run(FusedCPU, program)
+
+        self.assertEqual(fused.output.getvalue(), interp.output.getvalue())
+        self.assertEqual(fused.instructions, interp.instructions)
+        self.assertEqual(fused.REG, interp.REG)
+        self.assertEqual(fused.fusion_hits['CMP+LDI+JNE'], 10)
+        self.assertEqual(fused.fusion_hits['PUSH+LDI+CALL'], 10)
+        self.assertEqual(fused.fusion_hits['POP+POP'], 10)
+        self.assertEqual(fused.fusion_hits['LDI+PRN'], 1)
+        self.assertIn('CMP+LDI+JNE', fused.fusion_report())
+
+    def test_budget(self):
+        """should not let a fused sequence overrun the budget"""
+        program = assemble(LOOP)
+        for budget in range(1, 30):
+            interp = run(CPU, program, budget)
+            fused = run(FusedCPU, program, budget)
+            self.assertEqual(fused.instructions, budget)
+            self.assertEqual(fused.PC, interp.PC)
+            self.assertEqual(fused.REG, interp.REG)
+
+    def test_self_modifying(self):
+        """should fall back when a write changes fused code"""
+        program = assemble(SELF_MODIFYING)
+        cpu = FusedCPU(CollectorSink())
+        cpu.load_bytes(program)
+        cpu.SP = 0x09
+        interp = CPU(CollectorSink())
+        interp.load_bytes(program)
+        interp.SP = 0x09
+
+        cpu.run()
+        interp.run()
+
+        self.assertEqual(cpu.RAM[0x08], 1)
+        self.assertEqual(cpu.PC, interp.PC)
+        self.assertEqual(cpu.instructions, interp.instructions)
+        self.assertEqual(cpu.output.getvalue(), '')
+
+    def test_rematch_on_write(self):
+        """should drop a match when its code is overwritten"""
+        cpu = FusedCPU(CollectorSink())
+        cpu.load_bytes(assemble("LDI R0,5\nPRN R0\nHLT\n"))
+        self.assertEqual(cpu._fused[0][0], 'LDI+PRN')
+
+        cpu.ram_write(3, 1)  # PRN -> HLT
+        self.assertIsNone(cpu._fused[0])
+        self.assertIsNone(fuse(cpu.RAM, 0))
+
+    def test_forget_loops_on_write(self):
+        """should forget loops fast_forward() gave up on when one is
+        written, as CPU does"""
+        cpu = FusedCPU(CollectorSink())
+        cpu.load_bytes(assemble("LDI R0,5\nPRN R0\nHLT\n"))
+        # as fast_forward() leaves a loop from 0 to a branch at 3
+        cpu._no_loop[3] = 0
+        cpu._no_loop_at[0:5] = bytes([1]) * 5
+
+        cpu.ram_write(2, 6)
+        self.assertEqual(cpu._no_loop, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
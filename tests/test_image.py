@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from ls8.cpu import CPU
+from ls8.image import pack_image, parse_text, read_image
+
+
+class TestCase(unittest.TestCase):
+    def test_parse_text(self):
+        """should skip comments and blank lines"""
+        with open('./tests/test.txt') as f:
+            self.assertEqual(parse_text(f), bytearray([1, 2, 3, 4]))
+
+    def test_round_trip(self):
+        """should read back what was packed, without copying"""
+        image = pack_image(bytearray([0b10000010, 0, 8]), entry=3)
+        entry, program = read_image(image)
+        self.assertEqual(entry, 3)
+        self.assertIsInstance(program, memoryview)
+        self.assertEqual(bytes(program), bytes([0b10000010, 0, 8]))
+
+    def test_bad_checksum(self):
+        """should reject a corrupted image"""
+        image = bytearray(pack_image(bytearray([1, 2, 3])))
+        image[-1] ^= 0xFF
+        with self.assertRaises(ValueError):
+            read_image(image)
+
+    def test_load_image(self):
+        """should load a .ls8b image into RAM the same as the text file"""
+        text_cpu = CPU()
+        text_cpu.load('./ls8/examples/call.ls8')
+
+        with open('./ls8/examples/call.ls8') as f:
+            image = pack_image(parse_text(f))
+
+        fd, path = tempfile.mkstemp(suffix='.ls8b')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image)
+            cpu = CPU()
+            cpu.load(path)
+        finally:
+            os.unlink(path)
+
+        self.assertEqual(cpu.RAM, text_cpu.RAM)
+
+    def test_load_bad_image(self):
+        """should report a corrupted or empty image file as ValueError"""
+        image = bytearray(pack_image(bytearray([1, 2, 3])))
+        image[-1] ^= 0xFF
+
+        for contents in (image, b''):
+            fd, path = tempfile.mkstemp(suffix='.ls8b')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(contents)
+                with self.assertRaises(ValueError):
+                    CPU().load(path)
+            finally:
+                os.unlink(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import io
+import sys
+import unittest
+from asm.asm import assemble
+from ls8.blocks import BlockCPU
+from ls8.cpu import CPU, KEY_ADDRESS
+from ls8.interrupts import KeyboardSource, TimerSource
+
+# INT into a handler that clobbers R4, which IRET must restore
+SOFTWARE_INT = """\
+    LDI R0,0xF8
+    LDI R1,HANDLER
+    ST R0,R1
+    LDI R5,1
+    LDI R4,1
+    LDI R2,0
+    INT R2
+    PRN R4
+    HLT
+HANDLER:
+    LDI R4,7
+    PRN R4
+    IRET
+"""
+
+# Unmasks I0 with an ALU op rather than LDI; the handler sits at 0x80
+ALU_UNMASK = """\
+    LDI R1,1
+    INC R5
+    LDI R2,8
+    JMP R2
+"""
+
+HANDLER = """\
+    PRN R1
+    HLT
+"""
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.capturedOutput = io.StringIO()
+        sys.stdout = self.capturedOutput
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+        self.capturedOutput = None
+
+    def test_software_interrupt(self):
+        """should run the handler and restore registers on IRET"""
+        cpu = CPU()
+        cpu.load_bytes(assemble(SOFTWARE_INT))
+        cpu.run()
+        self.assertEqual(self.capturedOutput.getvalue(), '7\n1\n')
+        self.assertTrue(cpu.interrupts_enabled)
+        self.assertEqual(cpu.SP, 0xF4)
+
+    def test_timer(self):
+        """should print A for each timer tick in interrupts.ls8"""
+        clock = FakeClock()
+        cpu = CPU()
+        cpu.load('./ls8/examples/interrupts.ls8')
+        timer = TimerSource(cpu, clock=clock)
+
+        cpu.run(50)
+        self.assertEqual(timer.tick(), 1.0)
+        cpu.run(50)
+        self.assertEqual(self.capturedOutput.getvalue(), '')
+
+        clock.now = 1.5
+        self.assertEqual(timer.tick(), 0.5)
+        cpu.run(50)
+        clock.now = 2.0
+        timer.tick()
+        cpu.run(50)
+        self.assertEqual(self.capturedOutput.getvalue(), 'AA')
+
+    def test_keyboard(self):
+        """should store the key and echo it in keyboard.ls8"""
+        cpu = CPU()
+        cpu.load('./ls8/examples/keyboard.ls8')
+        keyboard = KeyboardSource(cpu, io.StringIO())
+
+        cpu.run(50)
+        keyboard.feed('h')
+        cpu.run(50)
+        keyboard.feed('i')
+        cpu.run(50)
+        self.assertEqual(self.capturedOutput.getvalue(), 'hi')
+        self.assertEqual(cpu.RAM[KEY_ADDRESS], ord('i'))
+
+    def test_masked(self):
+        """should not dispatch an interrupt that IM masks off"""
+        cpu = CPU()
+        cpu.load('./ls8/examples/keyboard.ls8')
+        cpu.run(50)
+
+        cpu.post_interrupt(0)
+        cpu.run(50)
+        self.assertEqual(self.capturedOutput.getvalue(), '')
+        self.assertEqual(cpu.REG[6], 1)
+        self.assertFalse(cpu._pending)
+
+    def test_alu_unmask(self):
+        """should dispatch a latched interrupt once an ALU op sets IM"""
+        for engine in (CPU, BlockCPU):
+            cpu = engine()
+            cpu.load_bytes(assemble(ALU_UNMASK))
+            cpu.RAM[0x80:0x80 + 3] = assemble(HANDLER)
+            cpu.RAM[0xF8] = 0x80
+            cpu.REG[6] = 1
+            cpu._pending = False
+
+            cpu.run(100)
+            self.assertFalse(cpu._running)
+        self.assertEqual(self.capturedOutput.getvalue(), '1\n1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
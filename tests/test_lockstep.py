@@ -0,0 +1,43 @@
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    from ls8.lockstep import LockstepCPU
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestCase(unittest.TestCase):
+    def test_examples(self):
+        """should collect the PRN output of every lane"""
+        cpu = LockstepCPU(3)
+        cpu.load('./ls8/examples/call.ls8')
+        cpu.run()
+        self.assertEqual(cpu.output, [[20, 30, 36, 60]] * 3)
+        self.assertFalse(cpu.running.any())
+
+    def test_divergent_lanes(self):
+        """should run lanes whose PCs diverge on different inputs"""
+        cpu = LockstepCPU(2)
+        cpu.load('./ls8/examples/sctest.ls8')
+        # LDI R1,20 -> LDI R1,10 in lane 1, so its first CMP is equal
+        cpu.RAM[1, 5] = 10
+        cpu.run()
+        self.assertEqual(cpu.output[0], [1, 4, 5])
+        self.assertEqual(cpu.output[1], [2, 4, 5])
+
+    def test_bad_register(self):
+        """should fail on a register above R7 rather than alias it"""
+        cpu = LockstepCPU(2)
+        # LDI R2,3 / MUL R2,R1 / HLT, with MUL R2,60 in lane 1
+        cpu.RAM[:, :7] = [0b10000010, 2, 3, 0b10100010, 2, 1, 0b00000001]
+        cpu.RAM[1, 5] = 60
+        with self.assertRaisesRegex(Exception, "No register 60 in lane 1"):
+            cpu.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,23 +20,54 @@ class TestCase(unittest.TestCase):
 
         program_file = './tests/test.txt'
         cpu.load(program_file)
-        self.assertEqual(cpu.RAM[0], '00000001')
-        self.assertEqual(cpu.RAM[1], '00000010')
-        self.assertEqual(cpu.RAM[2], '00000011')
-        self.assertEqual(cpu.RAM[3], '00000100')
+        self.assertEqual(cpu.RAM[0], 0b00000001)
+        self.assertEqual(cpu.RAM[1], 0b00000010)
+        self.assertEqual(cpu.RAM[2], 0b00000011)
+        self.assertEqual(cpu.RAM[3], 0b00000100)
+
+    def test_ram_read_str(self):
+        """should still expose memory as binary strings"""
+        cpu = CPU()
+
+        program_file = './tests/test.txt'
+        cpu.load(program_file)
+        self.assertEqual(cpu.ram_read_str(0), '00000001')
+        self.assertEqual(cpu.ram_read_str(3), '00000100')
+
+    def test_ram_wraparound(self):
+        """should keep addresses and values within 8 bits"""
+        cpu = CPU()
+
+        cpu.ram_write(0x101, 0x1FF)
+        self.assertEqual(cpu.ram_read(1), 0xFF)
+        self.assertEqual(cpu.ram_read(0x201), 0xFF)
 
     def test_advance_pc(self):
         """ should advance PC correctly"""
         cpu = CPU()
 
         self.assertEqual(cpu.PC, 0, f'Expected {cpu.PC} to eq 0')
-        cpu.advance_pc('0000')
+        cpu.advance_pc(0b00000000)
         self.assertEqual(cpu.PC, 1, f'Expected {cpu.PC} to eq 1')
-        cpu.advance_pc('0100')
+        cpu.advance_pc(0b01000000)
         self.assertEqual(cpu.PC, 3, f'Expected {cpu.PC} to eq 3')
-        cpu.advance_pc('1000')
+        cpu.advance_pc(0b10000000)
         self.assertEqual(cpu.PC, 6, f'Expected {cpu.PC} to eq 6')
 
+    def test_decode_table(self):
+        """should decode operand count and sets-PC flag for every opcode"""
+        handler, operands, sets_pc = CPU.DECODE[0b10000010]  # LDI
+        self.assertEqual(handler, CPU.ldi)
+        self.assertEqual(operands, 2)
+        self.assertFalse(sets_pc)
+
+        handler, operands, sets_pc = CPU.DECODE[0b01010000]  # CALL
+        self.assertEqual(operands, 1)
+        self.assertTrue(sets_pc)
+
+        self.assertEqual(len(CPU.DECODE), 256)
+        self.assertIsNone(CPU.DECODE[0b11111111])
+
     def test_ret(self):
         """should set PC and SP"""
         cpu = CPU()
@@ -51,8 +82,8 @@ class TestCase(unittest.TestCase):
         """should push next instruction onto stack and then set PC"""
         cpu = CPU()
 
-        cpu.RAM[1] = '00000001'
-        cpu.RAM[2] = '00001111'
+        cpu.RAM[1] = 0b00000001
+        cpu.RAM[2] = 0b00001111
         cpu.REG[1] = 4
         cpu.call()
         self.assertEqual(cpu.SP, 243)
@@ -0,0 +1,134 @@
+import threading
+import unittest
+from asm.asm import assemble
+from ls8.multicore import Core, MultiCore
+from ls8.sinks import CollectorSink
+
+# Every core adds 1 to COUNTER 20 times, taking LOCK around each update
+COUNTER = """\
+        LDI R0,20
+LOOP:   LDI R2,LOCK
+SPIN:   LDI R3,1
+        XCHG R3,R2
+        LDI R1,0
+        CMP R3,R1
+        LDI R4,SPIN
+        JNE R4
+        LDI R2,COUNTER
+        LD R1,R2
+        INC R1
+        ST R2,R1
+        LDI R2,LOCK
+        LDI R1,0
+        ST R2,R1
+        DEC R0
+        CMP R0,R1
+        LDI R4,LOOP
+        JNE R4
+        HLT
+LOCK:   DB 0
+COUNTER: DB 0
+"""
+
+# Core 0 sends interrupt 2 to core 1, which waits for it
+PING = """\
+        LDI R2,0xFA       ; I2 vector
+        LDI R3,HANDLER
+        ST R2,R3
+        LDI R2,0
+        CMP R0,R2
+        LDI R3,WAIT
+        JNE R3
+        LDI R2,1
+        LDI R3,2
+        IPI R2,R3
+        HLT
+WAIT:   LDI R5,0b100
+        LDI R3,IDLE
+IDLE:   JMP R3
+HANDLER: PRN R0
+        HLT
+"""
+
+
+def cores(program, n, poll=1):
+    """n in-process cores sharing one RAM."""
+    memory = bytearray(256 + n)
+    memory[:len(program)] = program
+    lock = threading.Lock()
+    return [Core(memory, i, n, lock, CollectorSink(), poll=poll)
+            for i in range(n)]
+
+
+class TestCase(unittest.TestCase):
+    def test_registers(self):
+        """should start each core with its number and its own stack"""
+        a, b = cores(b"\x01", 2)
+        self.assertEqual(a.REG[:2], [0, 2])
+        self.assertEqual(b.REG[:2], [1, 2])
+        self.assertEqual((a.SP, b.SP), (0xF4, 0xE4))
+
+    def test_stacks(self):
+        """should fit the stacks between the program and 0xF4 or refuse"""
+        program = assemble(COUNTER)
+        self.assertEqual(MultiCore(program, cores=4).stack_size, 16)
+        self.assertEqual(MultiCore(program, cores=20).stack_size, 9)
+        with self.assertRaises(ValueError):
+            MultiCore(program, cores=4, stack_size=60)
+        with self.assertRaises(ValueError):
+            MultiCore(bytes(0xF0), cores=8)
+        with self.assertRaises(ValueError):
+            cores(b"\x01", 16)
+
+    def test_xchg(self):
+        """should keep a lock held by one core from the others"""
+        sym = {}
+        program = assemble(COUNTER, sym)
+        machine = cores(program, 3)
+
+        # interleave the cores one instruction at a time
+        while any(cpu._running for cpu in machine):
+            for cpu in machine:
+                cpu.run(1)
+
+        self.assertEqual(machine[0].RAM[sym['COUNTER']], 60)
+        self.assertEqual(machine[0].RAM[sym['LOCK']], 0)
+
+    def test_ipi(self):
+        """should raise the interrupt on the target core through IS/IM"""
+        machine = cores(assemble(PING), 2)
+
+        while any(cpu._running for cpu in machine):
+            for cpu in machine:
+                cpu.run(3)
+
+        self.assertEqual(machine[0].output.getvalue(), "")
+        self.assertEqual(machine[1].output.getvalue(), "1\n")
+
+    def test_processes(self):
+        """should run cores in separate processes against shared RAM"""
+        sym = {}
+        program = assemble(COUNTER, sym)
+        results = MultiCore(program, cores=3, poll=50).run()
+
+        self.assertEqual([r.core for r in results], [0, 1, 2])
+        self.assertTrue(all(r.halted for r in results))
+        self.assertEqual(
+            MultiCore(assemble(PING), cores=2).run()[1].output, "1\n")
+
+    def test_process_counter(self):
+        """should not lose updates made by cores running in parallel"""
+        sym = {}
+        machine = MultiCore(assemble(COUNTER, sym), cores=4)
+        machine.run()
+        self.assertEqual(machine.ram[sym['COUNTER']], 80)
+
+    def test_error(self):
+        """should report an IPI to a core that does not exist"""
+        program = assemble("LDI R2,5\nIPI R2,R2\nHLT\n")
+        result = MultiCore(program, cores=2).run()[0]
+        self.assertEqual(result.error, "No core 5 at 3")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import io
+import sys
+import unittest
+from asm.asm import assemble
+from ls8.cpu import CPU
+from ls8.profiler import Profiler
+
+# main calls OUTER twice, OUTER calls INNER once per call
+SOURCE = """\
+    LDI R1,OUTER
+    CALL R1
+    CALL R1
+    HLT
+OUTER:
+    LDI R2,INNER
+    CALL R2
+    RET
+INNER:
+    PRN R0
+    RET
+"""
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        sym = {}
+        self.cpu = CPU()
+        self.cpu.load_bytes(assemble(SOURCE, sym))
+        self.cpu.profiler = Profiler(sym)
+
+        sys.stdout = io.StringIO()
+        try:
+            self.cpu.run()
+        finally:
+            sys.stdout = sys.__stdout__
+
+    def test_counts(self):
+        """should count executions per opcode and per PC"""
+        profiler = self.cpu.profiler
+        self.assertEqual(sum(profiler.opcodes), self.cpu.instructions)
+        self.assertEqual(profiler.opcodes[0b01010000], 4)  # CALL
+        self.assertEqual(profiler.pcs[0], 1)
+        self.assertIn('CALL', profiler.flat_report())
+
+    def test_calls(self):
+        """should count calls and inclusive instructions per subroutine"""
+        profiler = self.cpu.profiler
+        addr = {label: a for a, label in profiler.names.items()}
+        self.assertEqual(profiler.calls[addr['OUTER']], 2)
+        self.assertEqual(profiler.calls[addr['INNER']], 2)
+        # LDI, CALL, RET plus INNER's PRN, RET, twice
+        self.assertEqual(profiler.inclusive[addr['OUTER']], 10)
+        self.assertEqual(profiler.inclusive[addr['INNER']], 4)
+
+    def test_collapsed(self):
+        """should write stacks in collapsed format"""
+        lines = self.cpu.profiler.collapsed().splitlines()
+        self.assertIn('main 4', lines)
+        self.assertIn('main;OUTER 6', lines)
+        self.assertIn('main;OUTER;INNER 4', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from ls8.cpu import CPU
+from ls8.interrupts import KEYBOARD, TIMER, KeyboardSource
+from ls8.replay import RECORD, Recorder, read_log, replay
+from ls8.sinks import CollectorSink
+
+
+def machine(path):
+    cpu = CPU(CollectorSink())
+    cpu.load(path)
+    return cpu
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.log = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.log)
+
+    def test_log(self):
+        """should write events and the end point compactly"""
+        recorder = Recorder(machine('./ls8/examples/keyboard.ls8'), 10)
+        recorder.run(25)
+        recorder.post_interrupt(KEYBOARD, ord('x'))
+        recorder.post_interrupt(TIMER)
+        recorder.run(25)
+        recorder.dump(self.log)
+
+        self.assertEqual(read_log(self.log),
+                         ([(25, KEYBOARD, ord('x')), (25, TIMER, None)], 50))
+        self.assertEqual(os.path.getsize(self.log), 5 + 3 * RECORD.size)
+
+        with open(self.log, 'r+b') as f:
+            f.truncate(5 + 2 * RECORD.size + 3)
+        self.assertEqual(read_log(self.log)[1], None)
+
+    def test_replay(self):
+        """should repeat a run with keys typed in real time exactly"""
+        recorder = Recorder(machine('./ls8/examples/keyboard.ls8'), 100)
+        keyboard = KeyboardSource(recorder)
+
+        def typist():
+            for ch in "replay":
+                keyboard.feed(ch)
+                time.sleep(0.002)
+
+        thread = threading.Thread(target=typist)
+        thread.start()
+        while thread.is_alive():
+            recorder.run(2000)
+        recorder.run(2000)
+        recorder.dump(self.log)
+
+        events, end = read_log(self.log)
+        self.assertEqual(len(events), 6)
+
+        cpu = machine('./ls8/examples/keyboard.ls8')
+        replay(cpu, events, end)
+
+        self.assertEqual(cpu.output.getvalue(),
+                         recorder.cpu.output.getvalue())
+        self.assertEqual(cpu.snapshot(), recorder.cpu.snapshot())
+
+    def test_idle_skipped(self):
+        """should skip idle spinning instead of executing it"""
+        cpu = machine('./ls8/examples/interrupts.ls8')
+        events = [(n * 10 ** 9, TIMER, None) for n in (1, 2, 3)]
+
+        start = time.perf_counter()
+        replay(cpu, events, 4 * 10 ** 9)
+
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(cpu.output.getvalue(), "AAA")
+        self.assertEqual(cpu.instructions, 4 * 10 ** 9)
+
+    def test_halts_early(self):
+        """should refuse a log that does not belong to the program"""
+        cpu = machine('./ls8/examples/print8.ls8')
+        with self.assertRaisesRegex(Exception, "halted at 3"):
+            replay(cpu, [(100, TIMER, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+from asm.asm import assemble
+from ls8.cpu import CPU
+from ls8.interrupts import TIMER
+from ls8.scheduler import (EXHAUSTED, FAILED, HALTED, PARKED, READY,
+                           Scheduler)
+from ls8.sinks import CollectorSink
+
+# Counts forever
+SPIN = """\
+        LDI R0,0
+        LDI R1,1
+LOOP:   ADD R0,R1
+        LDI R2,LOOP
+        JMP R2
+"""
+
+
+def load(path):
+    output = CollectorSink()
+    cpu = CPU(output)
+    cpu.load(path)
+    return cpu, output
+
+
+def spinner():
+    cpu = CPU(CollectorSink())
+    cpu.load_bytes(assemble(SPIN))
+    return cpu
+
+
+class TestCase(unittest.TestCase):
+    def test_step(self):
+        """should run n instructions and resume from there"""
+        cpu, output = load('./ls8/examples/mult.ls8')
+        self.assertEqual(cpu.step(), 1)
+        self.assertEqual(cpu.step(2), 2)
+        self.assertEqual(cpu.step(10), 2)
+        self.assertEqual(output.getvalue(), '72\n')
+        self.assertEqual(cpu.instructions, 5)
+
+    def test_runs_to_completion(self):
+        """should interleave jobs until each halts"""
+        scheduler = Scheduler(quantum=2)
+        jobs = []
+        outputs = []
+        for path in ['./ls8/examples/mult.ls8', './ls8/examples/stack.ls8',
+                     './ls8/examples/call.ls8']:
+            cpu, output = load(path)
+            jobs.append(scheduler.add(cpu))
+            outputs.append(output)
+
+        scheduler.run()
+
+        self.assertEqual([j.state for j in jobs], [HALTED] * 3)
+        self.assertEqual(outputs[0].getvalue(), '72\n')
+        self.assertEqual(outputs[1].getvalue(), '2\n4\n1\n')
+
+    def test_instruction_budget(self):
+        """should stop a job once its instruction budget is used up"""
+        scheduler = Scheduler(quantum=7)
+        job = scheduler.add(spinner(), max_instructions=100)
+        scheduler.run()
+        self.assertEqual(job.state, EXHAUSTED)
+        self.assertEqual(job.cpu.instructions, 100)
+
+    def test_budget_from_add(self):
+        """should charge the budget only with instructions run after the
+        CPU was added"""
+        cpu = spinner()
+        cpu.run(100)
+        scheduler = Scheduler(quantum=7)
+        job = scheduler.add(cpu, max_instructions=10)
+        scheduler.run()
+        self.assertEqual(job.state, EXHAUSTED)
+        self.assertEqual(job.instructions, 10)
+        self.assertEqual(cpu.instructions, 110)
+
+    def test_wall_clock_budget(self):
+        """should stop a job once its time budget is used up"""
+        ticks = iter(range(1000))
+        scheduler = Scheduler(quantum=10, clock=lambda: next(ticks))
+        job = scheduler.add(spinner(), max_seconds=5)
+        scheduler.run()
+        self.assertEqual(job.state, EXHAUSTED)
+        self.assertEqual(job.seconds, 5)
+
+    def test_priorities(self):
+        """should share instructions in proportion to priority"""
+        scheduler = Scheduler(quantum=10)
+        low = scheduler.add(spinner(), priority=1)
+        high = scheduler.add(spinner(), priority=3)
+        for _ in range(400):
+            scheduler.run_slice()
+        self.assertEqual(high.cpu.instructions, 3 * low.cpu.instructions)
+
+    def test_failure(self):
+        """should record a job that raises and carry on with the rest"""
+        scheduler = Scheduler()
+        bad = CPU(CollectorSink())
+        bad.load_bytes(bytes([0b11111111]))
+        failed = scheduler.add(bad)
+        good = scheduler.add(load('./ls8/examples/mult.ls8')[0])
+        scheduler.run()
+        self.assertEqual(failed.state, FAILED)
+        self.assertIn('Unknown instruction', failed.error)
+        self.assertEqual(good.state, HALTED)
+
+    def test_bad_jump(self):
+        """should fail a job stopped on a JMP to a register that does not
+        exist only once it runs it"""
+        scheduler = Scheduler(quantum=1)
+        bad = CPU(CollectorSink())
+        # LDI R0,0 / JMP R9
+        bad.load_bytes(bytes([0b10000010, 0, 0, 0b01010100, 9]))
+        failed = scheduler.add(bad)
+        good = scheduler.add(load('./ls8/examples/mult.ls8')[0])
+        scheduler.run()
+        self.assertEqual(failed.state, FAILED)
+        self.assertEqual(bad.PC, 3)
+        self.assertEqual(good.state, HALTED)
+
+    def test_parks_until_interrupt(self):
+        """should park a job idling for an interrupt and wake it on one"""
+        scheduler = Scheduler(quantum=100)
+        cpu, output = load('./ls8/examples/interrupts.ls8')
+        job = scheduler.add(cpu)
+        scheduler.run()
+        self.assertEqual(job.state, PARKED)
+        parked_at = cpu.instructions
+
+        # nothing to do while parked
+        self.assertEqual(scheduler.run(), 0)
+        self.assertEqual(cpu.instructions, parked_at)
+
+        cpu.post_interrupt(TIMER)
+        scheduler.run()
+        self.assertEqual(output.getvalue(), 'A')
+        self.assertEqual(job.state, PARKED)
+
+    def test_park_and_wake(self):
+        """should skip a job parked by hand until it is woken"""
+        scheduler = Scheduler(quantum=10)
+        job = scheduler.add(spinner())
+        other = scheduler.add(spinner())
+        scheduler.park(job)
+        for _ in range(5):
+            scheduler.run_slice()
+        self.assertEqual(job.cpu.instructions, 0)
+        scheduler.wake(job)
+        self.assertEqual(job.state, READY)
+        for _ in range(10):
+            scheduler.run_slice()
+        self.assertEqual(job.cpu.instructions, other.cpu.instructions - 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
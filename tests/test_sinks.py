@@ -0,0 +1,48 @@
+import io
+import unittest
+from ls8.blocks import BlockCPU
+from ls8.cpu import CPU
+from ls8.sinks import BufferedSink, CallbackSink, CollectorSink
+
+
+class TestCase(unittest.TestCase):
+    def run_mult(self, cpu_class, output):
+        cpu = cpu_class(output)
+        cpu.load('./ls8/examples/mult.ls8')
+        cpu.run()
+        return cpu
+
+    def test_collector(self):
+        """should collect PRN output in memory"""
+        for cpu_class in (CPU, BlockCPU):
+            sink = CollectorSink()
+            self.run_mult(cpu_class, sink)
+            self.assertEqual(sink.getvalue(), '72\n')
+
+    def test_callback(self):
+        """should pass each piece of output to the callback"""
+        pieces = []
+        self.run_mult(CPU, CallbackSink(pieces.append))
+        self.assertEqual(pieces, ['72\n'])
+
+    def test_buffered_threshold(self):
+        """should hold output until the threshold or a flush"""
+        stream = io.StringIO()
+        sink = BufferedSink(stream, threshold=4)
+        sink.write('ab')
+        self.assertEqual(stream.getvalue(), '')
+        sink.write('cd')
+        self.assertEqual(stream.getvalue(), 'abcd')
+        sink.write('e')
+        sink.flush()
+        self.assertEqual(stream.getvalue(), 'abcde')
+
+    def test_flushed_on_return(self):
+        """should flush buffered output when run() returns"""
+        stream = io.StringIO()
+        self.run_mult(CPU, BufferedSink(stream))
+        self.assertEqual(stream.getvalue(), '72\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
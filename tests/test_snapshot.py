@@ -0,0 +1,99 @@
+import unittest
+from asm.asm import assemble
+from ls8.blocks import BlockCPU
+from ls8.cpu import CPU
+from ls8.forkserver import ForkServer
+from ls8.sinks import CollectorSink
+
+# Setup fills RAM from 0x80, then SUM adds up R1 of those cells
+SUM = """\
+        LDI R0,0x80
+        LDI R2,1
+        LDI R3,0x90
+FILL:   ST R0,R2
+        ADD R0,R2
+        CMP R0,R3
+        LDI R4,FILL
+        JNE R4
+        LDI R0,0x80
+SUM:    LDI R3,0
+        LDI R4,0
+LOOP:   LD R2,R0
+        ADD R3,R2
+        LDI R2,1
+        ADD R0,R2
+        ADD R4,R2
+        CMP R4,R1
+        LDI R2,LOOP
+        JNE R2
+        PRN R3
+        HLT
+"""
+
+
+def sum_program():
+    sym = {}
+    return assemble(SUM, sym), sym['SUM']
+
+
+class TestCase(unittest.TestCase):
+    def test_restore(self):
+        """should put RAM, registers, flags and PC back as they were"""
+        for cpu_class in (CPU, BlockCPU):
+            cpu = cpu_class(CollectorSink())
+            cpu.load('./ls8/examples/stack.ls8')
+            cpu.step(4)
+            snapshot = cpu.snapshot()
+            ram, reg = bytes(cpu.RAM), list(cpu.REG)
+
+            cpu.run()
+            self.assertFalse(cpu._running)
+
+            cpu.restore(snapshot)
+            self.assertEqual(bytes(cpu.RAM), ram)
+            self.assertEqual(cpu.REG, reg)
+            self.assertEqual(cpu.instructions, 4)
+            self.assertTrue(cpu._running)
+
+            cpu.run()
+            self.assertEqual(cpu.output.getvalue(), '2\n4\n1\n' * 2)
+
+    def test_restore_self_modified_code(self):
+        """should drop compiled blocks whose code the snapshot changes"""
+        cpu = BlockCPU(CollectorSink())
+        cpu.load('./ls8/examples/mult.ls8')
+        snapshot = cpu.snapshot()
+        cpu.run()
+        cpu.ram_write(2, 9)  # LDI R0,8 -> LDI R0,9
+        cpu.restore(snapshot)
+        cpu.run()
+        self.assertEqual(cpu.output.getvalue(), '72\n72\n')
+
+    def test_fork_server(self):
+        """should run setup once and resume from the marker each time"""
+        program, marker = sum_program()
+        server = ForkServer(program, marker)
+        setup = server.snapshot.instructions
+
+        for n in (1, 5, 16):
+            result = server.run(lambda cpu: cpu.REG.__setitem__(1, n))
+            self.assertTrue(result.halted)
+            self.assertEqual(result.output, f'{n}\n')
+            self.assertGreater(result.instructions, setup)
+
+    def test_fork_server_blocks(self):
+        """should serve runs on the block engine too"""
+        program, marker = sum_program()
+        server = ForkServer(program, marker, engine='blocks')
+        results = [server.run(lambda cpu: cpu.REG.__setitem__(1, 3))
+                   for _ in range(3)]
+        self.assertEqual([r.output for r in results], ['3\n'] * 3)
+
+    def test_marker_not_reached(self):
+        """should fail if the program halts before the marker"""
+        with self.assertRaises(Exception):
+            ForkServer('./ls8/examples/mult.ls8', 0xF0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from asm.asm import assemble
+from ls8.blocks import BlockCPU
+from ls8.cpu import CPU, Event, OUTPUT, INTERRUPT, HALT, BUDGET
+from ls8.interrupts import KEYBOARD
+from ls8.sinks import CollectorSink
+
+# Prints 1, 2, 3... forever
+COUNT = """\
+        LDI R0,0
+        LDI R1,LOOP
+LOOP:   INC R0
+        PRN R0
+        JMP R1
+"""
+
+
+class TestCase(unittest.TestCase):
+    def test_run_iter(self):
+        """should yield output as it is printed, and nothing else"""
+        for engine in (CPU, BlockCPU):
+            cpu = engine(CollectorSink())
+            cpu.load('./ls8/examples/printstr.ls8')
+            self.assertEqual("".join(cpu.run_iter(chunk=10)),
+                             "Hello, world!\n")
+            self.assertEqual(cpu.output.getvalue(), "")
+
+    def test_events(self):
+        """should yield interrupts in order with output, then halt or
+        budget"""
+        cpu = CPU(CollectorSink())
+        cpu.load('./ls8/examples/keyboard.ls8')
+        cpu.post_interrupt(KEYBOARD, ord('a'))
+        cpu.post_interrupt(KEYBOARD, ord('b'))
+
+        self.assertEqual(list(cpu.run_iter(200, events=True)), [
+            Event(INTERRUPT, KEYBOARD),
+            Event(OUTPUT, 'b'),
+            Event(BUDGET, 200),
+        ])
+
+        cpu = CPU(CollectorSink())
+        cpu.load('./ls8/examples/print8.ls8')
+        self.assertEqual(list(cpu.run_iter(events=True)),
+                         [Event(OUTPUT, '8\n'), Event(HALT, 3)])
+
+    def test_resume(self):
+        """should carry on where an abandoned iterator stopped"""
+        cpu = CPU(CollectorSink())
+        cpu.load_bytes(assemble(COUNT))
+        it = cpu.run_iter(chunk=1)
+
+        self.assertEqual([next(it) for _ in range(3)], ['1\n', '2\n', '3\n'])
+        it.close()
+        self.assertIsInstance(cpu.output, CollectorSink)
+
+        cpu.run(3)
+        self.assertEqual(cpu.output.getvalue(), '4\n')
+
+    def test_async(self):
+        """should share one event loop between many programs"""
+        seen = []
+
+        async def machine(name, budget):
+            cpu = CPU(CollectorSink())
+            cpu.load_bytes(assemble(COUNT))
+            async for text in cpu.run_async(budget, chunk=30):
+                seen.append((name, text))
+
+        async def ticker():
+            for _ in range(5):
+                seen.append(('tick', None))
+                await asyncio.sleep(0)
+
+        async def main():
+            await asyncio.gather(machine('a', 302), machine('b', 302),
+                                 ticker())
+
+        asyncio.run(main())
+
+        names = [name for name, _ in seen]
+        self.assertEqual(names.count('a'), 100)
+        self.assertEqual(names.count('b'), 100)
+        # every coroutine got the loop back before a finished
+        last_a = len(names) - names[::-1].index('a')
+        self.assertIn('b', names[:last_a])
+        self.assertEqual(names[:last_a].count('tick'), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
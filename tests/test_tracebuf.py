@@ -0,0 +1,70 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from ls8.cpu import CPU
+from ls8.tracebuf import Tracer, format_record, read_trace
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.capturedOutput = io.StringIO()
+        sys.stdout = self.capturedOutput
+        fd, self.path = tempfile.mkstemp(suffix='.bin')
+        os.close(fd)
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+        self.capturedOutput = None
+        os.unlink(self.path)
+
+    def test_matches_trace(self):
+        """should render the same lines CPU.trace() prints"""
+        expected = []
+        cpu = CPU()
+        cpu.load('./ls8/examples/mult.ls8')
+        while cpu._running:
+            cpu.trace()
+            cpu.run(1)
+        for line in self.capturedOutput.getvalue().splitlines():
+            if line.startswith('TRACE'):
+                expected.append(line)
+
+        cpu = CPU()
+        cpu.load('./ls8/examples/mult.ls8')
+        cpu.tracer = Tracer(path=self.path)
+        cpu.run()
+
+        lines = [format_record(r) for r in read_trace(self.path)]
+        self.assertEqual(lines, expected)
+
+    def test_ring_buffer(self):
+        """should keep only the most recent records"""
+        cpu = CPU()
+        cpu.load('./ls8/examples/call.ls8')
+        cpu.tracer = Tracer(capacity=4)
+        cpu.run()
+        cpu.tracer.dump(self.path)
+
+        records = list(read_trace(self.path))
+        self.assertEqual(cpu.tracer.count, cpu.instructions)
+        self.assertEqual(len(records), 4)
+        # the last instruction run is HLT
+        self.assertEqual(records[-1][1], 0b00000001)
+
+    def test_dump_on_exception(self):
+        """should dump the trace when the program fails"""
+        cpu = CPU()
+        cpu.load_bytes(bytes([0b10000010, 0, 8, 0b11111111]))
+        cpu.tracer = Tracer(path=self.path)
+
+        with self.assertRaises(Exception):
+            cpu.run()
+
+        records = list(read_trace(self.path))
+        self.assertEqual([r[0] for r in records], [0, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()